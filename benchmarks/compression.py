@@ -0,0 +1,108 @@
+"""Measure the CPU cost and the size savings of compressed payloads, and where compression starts to pay off.
+
+For states of increasing size and every codec and level, the benchmark measures the time to compress a state the way
+IPFSDict.save() does and to decompress it the way a load does, and the size of the stored payload. Compression pays
+off when the transfer time it saves is larger than the CPU time it costs: the break-even bandwidth is the link speed
+below which that is the case. For the given bandwidth, the crossover is the smallest measured state size for which
+compression saves time. No IPFS daemon is needed.
+
+Usage: python benchmarks/compression.py [--bandwidth MBPS] [--repeat N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ipfs_dict_chain.Compression import Compressor, decompress  # noqa: E402
+
+SIZES = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+CONFIGURATIONS = (('zlib', 1), ('zlib', 6), ('zlib', 9), ('lzma', 0), ('lzma', 6))
+
+
+def make_state(size: int) -> dict:
+    """Create a state with records of mixed values, like the dictionary data of a typical application.
+
+    :param size: The approximate size of the JSON encoding of the state in bytes
+    :type size: int
+    :return: The state
+    :rtype: dict
+    """
+    state = {'previous_cid': 'QmTyncTRbKVQ8tWFzL4HwdTn5U1shpEfgkahCE3Ff5thwD'}
+    length = len(json.dumps(state))
+    index = 0
+    while length < size:
+        key = f'record_{index:05d}'
+        state[key] = {'id': index, 'name': f'user {index * 7919 % 10007}', 'active': index % 3 == 0,
+                      'score': round(index * 1.618 % 100, 3), 'tags': ['alpha', f'group-{index % 13}']}
+        # The JSON encoding of the record, with the separator before it instead of the braces around it
+        length += len(json.dumps({key: state[key]}))
+        index += 1
+    return state
+
+
+def measure(state: dict, compressor: Compressor, repeat: int) -> tuple:
+    """Measure compressing and decompressing a state.
+
+    :param state: The state
+    :type state: dict
+    :param compressor: The compressor
+    :type compressor: Compressor
+    :param repeat: The number of repetitions, the fastest is reported
+    :type repeat: int
+    :return: The stored size in bytes, the best compression time and the best decompression time in seconds
+    :rtype: tuple
+    """
+    compress_time = decompress_time = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = json.dumps(compressor.compress(data=state))
+        compress_time = min(compress_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decompress(json.loads(payload))
+        decompress_time = min(decompress_time, time.perf_counter() - start)
+
+    return len(payload), compress_time, decompress_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bandwidth', type=float, default=10.0, help='the link speed in MB/s (default: 10)')
+    parser.add_argument('--repeat', type=int, default=5, help='the number of repetitions (default: 5)')
+    args = parser.parse_args()
+    bandwidth = args.bandwidth * 10 ** 6
+
+    print(f'{"size":>8} {"codec":<8} {"ratio":>6} {"comp ms":>8} {"decomp ms":>10} {"extra ms":>9} '
+          f'{"saved ms":>9} {"break-even MB/s":>16}')
+    crossovers = {}
+    for size in SIZES:
+        state = make_state(size=size)
+        # The time to encode and parse the uncompressed payload is spent either way
+        _, plain_encode, plain_decode = measure(state=state, compressor=Compressor(threshold=sys.maxsize),
+                                                repeat=args.repeat)
+        plain_size = len(json.dumps(state))
+
+        for codec, level in CONFIGURATIONS:
+            stored, compress_time, decompress_time = measure(state=state, repeat=args.repeat,
+                                                             compressor=Compressor(codec=codec, level=level, threshold=0))
+            extra = compress_time + decompress_time - plain_encode - plain_decode
+            saved = (plain_size - stored) / bandwidth
+            break_even = (plain_size - stored) / extra / 10 ** 6 if extra > 0 else float('inf')
+            name = f'{codec}-{level}'
+            if saved > extra:
+                crossovers.setdefault(name, size)
+
+            print(f'{plain_size:>8} {name:<8} {plain_size / stored:>6.2f} {compress_time * 1000:>8.2f} '
+                  f'{decompress_time * 1000:>10.2f} {extra * 1000:>9.2f} {saved * 1000:>9.2f} {break_even:>16.1f}')
+
+    print(f'\ncrossover at {args.bandwidth:g} MB/s, the smallest state size for which compression saves time:')
+    for codec, level in CONFIGURATIONS:
+        name = f'{codec}-{level}'
+        print(f'  {name:<8} {crossovers[name] if name in crossovers else "never":>8}')
+
+
+if __name__ == '__main__':
+    main()
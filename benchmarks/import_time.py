@@ -0,0 +1,74 @@
+"""Measure how long it takes to import the modules of ipfs_dict_chain in a fresh interpreter.
+
+Every measurement starts a new Python process, so nothing is cached in sys.modules. The numbers include the
+interpreter start-up itself, which is reported separately as the baseline.
+
+Usage: python benchmarks/import_time.py [--runs N]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each case is a description and the code run in the fresh interpreter
+CASES = [
+    ('interpreter start-up (baseline)', 'pass'),
+    ('ipfs_dict_chain.CID', 'import ipfs_dict_chain.CID'),
+    ('ipfs_dict_chain.IPFSDictChain', 'import ipfs_dict_chain.IPFSDictChain'),
+    ('IPFSDictChain + network dependencies', 'import ipfs_dict_chain.IPFSDictChain, aioipfs, multiaddr'),
+]
+
+HEAVY_MODULES = ('aiohttp', 'aioipfs', 'multiaddr')
+
+
+def measure(code: str, runs: int) -> float:
+    """Get the median wall time in milliseconds of running code in a fresh interpreter.
+
+    :param code: The code to run
+    :type code: str
+    :param runs: The number of runs
+    :type runs: int
+    :return: The median time in milliseconds
+    :rtype: float
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='1')
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=env, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def loaded_heavy_modules(code: str) -> list:
+    """Get the network dependencies that are loaded after running code in a fresh interpreter.
+
+    :param code: The code to run
+    :type code: str
+    :return: The names of the loaded network dependencies
+    :rtype: list
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    check = f'{code}\nimport sys\nprint(",".join(m for m in {HEAVY_MODULES!r} if m in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', check], env=env, check=True, capture_output=True, text=True)
+    return [module for module in output.stdout.strip().split(',') if module]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20, help='the number of runs per case (default: 20)')
+    args = parser.parse_args()
+
+    print(f'{"case":<40} {"median ms":>10}  network dependencies loaded')
+    for description, code in CASES:
+        milliseconds = measure(code=code, runs=args.runs)
+        modules = ', '.join(loaded_heavy_modules(code=code)) or '-'
+        print(f'{description:<40} {milliseconds:>10.1f}  {modules}')
+
+
+if __name__ == '__main__':
+    main()
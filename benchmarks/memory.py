@@ -0,0 +1,98 @@
+"""Measure the memory held after loading the history of a chain with get_previous_states(), with and without compact mode.
+
+The chain is stored in an in-memory stand-in for the IPFS daemon, so the benchmark runs without one. Every fetched
+state is parsed from its JSON text, like a state fetched from the daemon, and goes through the IPFS cache. The
+reported memory is everything allocated by loading the history that is still held afterwards, i.e. the returned
+states plus the cache entries, as measured by tracemalloc.
+
+Usage: python benchmarks/memory.py [--versions N] [--keys N]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ipfs_dict_chain.FrozenDict import freeze  # noqa: E402
+from ipfs_dict_chain.IPFS import ipfs_cache  # noqa: E402
+from ipfs_dict_chain.IPFSDictChain import IPFSDictChain  # noqa: E402
+from ipfs_dict_chain.UnixFS import file_cid  # noqa: E402
+
+
+def build_chain(versions: int, keys: int) -> dict:
+    """Build the JSON text of a chain in which every version changes one key.
+
+    :param versions: The number of versions
+    :type versions: int
+    :param keys: The number of keys per version
+    :type keys: int
+    :return: The JSON text of every state by CID, and the CID of the head under the key None
+    :rtype: dict
+    """
+    store = {}
+    state = {f'field_{i:03d}': {'value': i, 'tags': [f'tag_{i}', 'shared'], 'note': 'x' * 40} for i in range(keys)}
+    previous_cid = None
+    for version in range(versions):
+        state[f'field_{version % keys:03d}'] = {'value': version, 'tags': [f'tag_{version}', 'shared'], 'note': 'y' * 40}
+        text = json.dumps({'previous_cid': previous_cid, **state})
+        previous_cid = file_cid(text.encode())
+        store[previous_cid] = text
+    store[None] = previous_cid
+    return store
+
+
+def measure(store: dict, compact: bool) -> tuple:
+    """Load the history of the chain and measure the memory that is still held afterwards.
+
+    :param store: The JSON text of every state by CID, and the CID of the head under the key None
+    :type store: dict
+    :param compact: Load the history in compact mode
+    :type compact: bool
+    :return: The number of loaded states and the held memory in bytes
+    :rtype: tuple
+    """
+    def fetch(cid: str, gateway: object = None) -> dict:
+        data = freeze(json.loads(store[cid]))
+        ipfs_cache.set(cid, data)
+        return data
+
+    ipfs_cache.clear()
+    head = IPFSDictChain()
+    head.previous_cid = store[None]
+    gc.collect()
+
+    with patch('ipfs_dict_chain.IPFS._run_get_json', side_effect=fetch):
+        tracemalloc.start()
+        states = head.get_previous_states(compact=compact)
+        gc.collect()
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    count = len(states)
+    del states
+    ipfs_cache.clear()
+    return count, held
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--versions', type=int, default=5000, help='the number of versions (default: 5000)')
+    parser.add_argument('--keys', type=int, default=50, help='the number of keys per version (default: 50)')
+    args = parser.parse_args()
+
+    store = build_chain(versions=args.versions, keys=args.keys)
+    print(f'{"mode":<10} {"states":>8} {"held MiB":>10} {"bytes/state":>12}')
+    results = {}
+    for mode, compact in (('default', False), ('compact', True)):
+        count, held = measure(store=store, compact=compact)
+        results[mode] = held
+        print(f'{mode:<10} {count:>8} {held / 2 ** 20:>10.1f} {held // max(count, 1):>12}')
+    print(f'compact mode holds {results["default"] / max(results["compact"], 1):.1f}x less memory')
+
+
+if __name__ == '__main__':
+    main()
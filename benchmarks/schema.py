@@ -0,0 +1,106 @@
+"""Measure the memory held by many loaded records and the time to read their fields, with IPFSDict and SchemaDict.
+
+The records are stored in an in-memory stand-in for the IPFS daemon, so the benchmark runs without one. Every record
+is parsed from its JSON text, like a record fetched from the daemon, and goes through the IPFS cache, which is cleared
+again after loading. The reported memory is everything allocated by loading the records that is still held afterwards,
+as measured by tracemalloc.
+
+Usage: python benchmarks/schema.py [--records N]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import List
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ipfs_dict_chain.FrozenDict import freeze  # noqa: E402
+from ipfs_dict_chain.IPFS import ipfs_cache  # noqa: E402
+from ipfs_dict_chain.IPFSDict import IPFSDict  # noqa: E402
+from ipfs_dict_chain.Schema import SchemaDict, field  # noqa: E402
+from ipfs_dict_chain.UnixFS import file_cid  # noqa: E402
+
+
+class Order(SchemaDict, extra='forbid'):
+    status: str
+    customer: str
+    priority: int = 0
+    price: float = 0.0
+    paid: bool = False
+    tags: List[str] = field(default_factory=list)
+
+
+def build_records(records: int) -> dict:
+    """Build the JSON text of the records.
+
+    :param records: The number of records
+    :type records: int
+    :return: The JSON text of every record by CID
+    :rtype: dict
+    """
+    store = {}
+    for i in range(records):
+        text = json.dumps({'status': 'open', 'customer': f'customer {i % 1000}', 'priority': i % 5,
+                           'price': i / 100, 'paid': i % 2 == 0, 'tags': ['new', f'tag_{i % 10}']})
+        store[file_cid(text.encode())] = text
+    return store
+
+
+def measure(store: dict, dict_class: type) -> tuple:
+    """Load the records, measure the memory that is still held afterwards and the time to read all their fields.
+
+    :param store: The JSON text of every record by CID
+    :type store: dict
+    :param dict_class: The class to load the records with
+    :type dict_class: type
+    :return: The held memory in bytes and the time to read the fields in seconds
+    :rtype: tuple
+    """
+    def fetch(cid: str, gateway: object = None) -> dict:
+        data = freeze(json.loads(store[cid]))
+        ipfs_cache.set(cid, data)
+        return data
+
+    ipfs_cache.clear()
+    gc.collect()
+
+    with patch('ipfs_dict_chain.IPFS._run_get_json', new=fetch):
+        tracemalloc.start()
+        loaded = [dict_class(cid=cid) for cid in store]
+        ipfs_cache.clear()
+        gc.collect()
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    start = time.perf_counter()
+    for record in loaded:
+        record.status, record.customer, record.priority, record.price, record.paid, record.tags
+    elapsed = time.perf_counter() - start
+
+    del loaded
+    return held, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000, help='the number of records (default: 100000)')
+    args = parser.parse_args()
+
+    store = build_records(records=args.records)
+    print(f'{"class":<10} {"held MiB":>10} {"bytes/record":>13} {"read ms":>9}')
+    results = {}
+    for name, dict_class in (('IPFSDict', IPFSDict), ('Order', Order)):
+        held, elapsed = measure(store=store, dict_class=dict_class)
+        results[name] = (held, elapsed)
+        print(f'{name:<10} {held / 2 ** 20:>10.1f} {held // max(len(store), 1):>13} {elapsed * 1000:>9.1f}')
+    print(f'SchemaDict holds {results["IPFSDict"][0] / max(results["Order"][0], 1):.1f}x less memory and reads fields '
+          f'{results["IPFSDict"][1] / max(results["Order"][1], 1e-9):.1f}x faster')
+
+
+if __name__ == '__main__':
+    main()
@@ -10,8 +10,8 @@ project = 'ipfs_dict_chain'
 copyright = '2025, ValyrianTech'
 author = 'ValyrianTech'
 
-version = '1.0.7'
-release = '1.0.7'
+version = '2.0.0'
+release = '2.0.0'
 
 # -- General configuration ---------------------------------------------------
 # https://www.sphinx-doc.org/en/master/usage/configuration.html#general-configuration
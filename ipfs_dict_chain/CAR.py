@@ -0,0 +1,251 @@
+from typing import Any, BinaryIO, Iterator, List, Optional, Tuple
+
+from .CID import SHA2_256, cid_from_bytes, decode_varint, encode_varint, verify_block
+from .IPFS import IPFSError
+
+
+class CARError(IPFSError):
+    """Custom exception for invalid or corrupted CAR (Content Addressable aRchive) data."""
+    pass
+
+
+def _read_varint(stream: BinaryIO) -> Optional[int]:
+    """Read an unsigned varint from a stream.
+
+    :param stream: The stream to read from
+    :type stream: BinaryIO
+    :return: The decoded integer, or None at the end of the stream
+    :rtype: Optional[int]
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = stream.read(1)
+        if not byte:
+            if shift:
+                raise CARError('Truncated varint in CAR data')
+            return None
+        value |= (byte[0] & 0x7f) << shift
+        if not byte[0] & 0x80:
+            return value
+        shift += 7
+
+
+def _read_exactly(stream: BinaryIO, length: int) -> bytes:
+    """Read an exact number of bytes from a stream.
+
+    :param stream: The stream to read from
+    :type stream: BinaryIO
+    :param length: The number of bytes to read
+    :type length: int
+    :return: The data
+    :rtype: bytes
+    """
+    data = stream.read(length)
+    while len(data) < length:
+        more = stream.read(length - len(data))
+        if not more:
+            raise CARError(f'Truncated CAR data: expected {length} bytes, got {len(data)}')
+        data += more
+    return data
+
+
+def _cbor_head(major: int, value: int) -> bytes:
+    """Encode the head of a CBOR data item.
+
+    :param major: The major type
+    :type major: int
+    :param value: The argument of the head
+    :type value: int
+    :return: The encoded head
+    :rtype: bytes
+    """
+    if value < 24:
+        return bytes([major << 5 | value])
+    for additional, size in ((24, 1), (25, 2), (26, 4), (27, 8)):
+        if value < 1 << (8 * size):
+            return bytes([major << 5 | additional]) + value.to_bytes(size, 'big')
+    raise ValueError(f'CBOR argument {value} is too large')
+
+
+def _cbor_decode(data: bytes, offset: int = 0) -> Tuple[Any, int]:
+    """Decode the subset of dag-cbor used by CAR headers.
+
+    :param data: The encoded data
+    :type data: bytes
+    :param offset: The position of the data item
+    :type offset: int
+    :return: The decoded value and the position right after it, CID links are decoded as binary CIDs
+    :rtype: Tuple[Any, int]
+    """
+    initial = data[offset]
+    major, additional = initial >> 5, initial & 0x1f
+    offset += 1
+    if additional < 24:
+        value = additional
+    elif additional <= 27:
+        size = 1 << (additional - 24)
+        value = int.from_bytes(data[offset:offset + size], 'big')
+        offset += size
+    else:
+        raise CARError('Unsupported CBOR encoding in CAR header')
+
+    if major == 0:
+        return value, offset
+    if major in (2, 3):
+        raw = data[offset:offset + value]
+        return (raw if major == 2 else raw.decode()), offset + value
+    if major == 4:
+        items = []
+        for _ in range(value):
+            item, offset = _cbor_decode(data, offset)
+            items.append(item)
+        return items, offset
+    if major == 5:
+        mapping = {}
+        for _ in range(value):
+            key, offset = _cbor_decode(data, offset)
+            mapping[key], offset = _cbor_decode(data, offset)
+        return mapping, offset
+    if major == 6 and value == 42:
+        link, offset = _cbor_decode(data, offset)
+        return link[1:], offset
+    if major == 7 and value in (20, 21, 22):
+        return {20: False, 21: True, 22: None}[value], offset
+    raise CARError('Unsupported CBOR data item in CAR header')
+
+
+def split_cid(section: bytes) -> Tuple[bytes, bytes]:
+    """Split a CAR section into the binary CID and the block data.
+
+    :param section: The section, without its length prefix
+    :type section: bytes
+    :return: The binary CID and the block data
+    :rtype: Tuple[bytes, bytes]
+    """
+    if len(section) >= 34 and section[0] == SHA2_256 and section[1] == 32:
+        return section[:34], section[34:]
+
+    _, offset = decode_varint(section)
+    _, offset = decode_varint(section, offset)
+    _, offset = decode_varint(section, offset)
+    length, offset = decode_varint(section, offset)
+    return section[:offset + length], section[offset + length:]
+
+
+class CARWriter:
+    """Write blocks to a stream in the CARv1 (Content Addressable aRchive) format.
+
+    Blocks are written as they come, so memory use does not depend on the size of the archive.
+
+    :param stream: The binary stream to write to
+    :type stream: BinaryIO
+    :param roots: The binary CIDs of the roots of the archive
+    :type roots: List[bytes]
+    """
+
+    def __init__(self, stream: BinaryIO, roots: List[bytes]):
+        self.stream = stream
+        self.roots = roots
+        self._written = set()
+
+        header = b''.join([
+            _cbor_head(5, 2),
+            _cbor_head(3, 5), b'roots',
+            _cbor_head(4, len(roots)),
+            *[_cbor_head(6, 42) + _cbor_head(2, len(root) + 1) + b'\0' + root for root in roots],
+            _cbor_head(3, 7), b'version',
+            _cbor_head(0, 1),
+        ])
+        self.stream.write(encode_varint(len(header)) + header)
+
+    def write_block(self, cid: bytes, data: bytes) -> bool:
+        """Write a block to the archive, unless a block with the same CID was written already.
+
+        :param cid: The binary CID of the block
+        :type cid: bytes
+        :param data: The data of the block
+        :type data: bytes
+        :return: True if the block was written, False if it was a duplicate
+        :rtype: bool
+        """
+        if cid in self._written:
+            return False
+
+        self.stream.write(encode_varint(len(cid) + len(data)))
+        self.stream.write(cid)
+        self.stream.write(data)
+        self._written.add(cid)
+        return True
+
+    def __len__(self) -> int:
+        """Return the number of blocks written to the archive."""
+        return len(self._written)
+
+
+class CARReader:
+    """Read blocks from a stream in the CARv1 (Content Addressable aRchive) format.
+
+    Blocks are read one at a time, so memory use does not depend on the size of the archive.
+
+    :param stream: The binary stream to read from
+    :type stream: BinaryIO
+    :param verify: Verify that every block matches its CID, defaults to True
+    :type verify: bool, optional
+    :raises CARError: If the header is invalid
+    """
+
+    def __init__(self, stream: BinaryIO, verify: bool = True):
+        self.stream = stream
+        self.verify = verify
+
+        length = _read_varint(stream)
+        if length is None:
+            raise CARError('Empty CAR data')
+
+        try:
+            header, _ = _cbor_decode(_read_exactly(stream, length))
+        except CARError:
+            raise
+        except Exception as e:
+            raise CARError(f'Invalid CAR header: {e}')
+
+        if not isinstance(header, dict) or header.get('version') != 1:
+            raise CARError(f'Unsupported CAR header, only CARv1 is supported: {header}')
+
+        self.roots = header.get('roots', [])
+
+    def __iter__(self) -> Iterator[Tuple[bytes, bytes]]:
+        """Iterate over the blocks in the archive.
+
+        :return: An iterator of (binary CID, block data) tuples
+        :rtype: Iterator[Tuple[bytes, bytes]]
+        :raises CARError: If the data is truncated or a block does not match its CID
+        """
+        while True:
+            length = _read_varint(self.stream)
+            if length is None:
+                return
+
+            try:
+                cid, data = split_cid(_read_exactly(self.stream, length))
+            except CARError:
+                raise
+            except Exception as e:
+                raise CARError(f'Invalid block in CAR data: {e}')
+
+            if self.verify:
+                try:
+                    verify_block(cid=cid, block=data)
+                except ValueError as e:
+                    raise CARError(f'Invalid block in CAR data: {e}')
+
+            yield cid, data
+
+    def root_cids(self) -> List[str]:
+        """Get the roots of the archive as strings.
+
+        :return: The CIDs of the roots
+        :rtype: List[str]
+        """
+        return [cid_from_bytes(root) for root in self.roots]
@@ -1,5 +1,7 @@
+import base64
+import hashlib
 import re
-from typing import Any
+from typing import Any, Tuple
 
 
 class CID:
@@ -54,3 +56,189 @@ class CID:
         :return: The long CID value as a string.
         """
         return self.value
+
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+
+DAG_PB = 0x70
+RAW = 0x55
+SHA2_256 = 0x12
+SHA2_512 = 0x13
+IDENTITY = 0x00
+
+
+def encode_varint(value: int) -> bytes:
+    """
+    Encode a non-negative integer as an unsigned varint, as used throughout the multiformats.
+
+    :param value: The integer to encode.
+    :return: The encoded varint.
+    """
+    if value < 0:
+        raise ValueError(f'Can not encode negative value {value} as a varint')
+
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def decode_varint(data: bytes, offset: int = 0) -> Tuple[int, int]:
+    """
+    Decode an unsigned varint.
+
+    :param data: The bytes containing the varint.
+    :param offset: The position of the varint in the data.
+    :return: A tuple with the decoded integer and the position right after the varint.
+    """
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError('Truncated varint')
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+        if shift > 63:
+            raise ValueError('Varint is too long')
+
+
+def b58encode(data: bytes) -> str:
+    """
+    Encode bytes as a base58btc string.
+
+    :param data: The bytes to encode.
+    :return: The base58btc string.
+    """
+    number = int.from_bytes(data, 'big')
+    encoded = ''
+    while number:
+        number, remainder = divmod(number, 58)
+        encoded = BASE58_ALPHABET[remainder] + encoded
+
+    leading_zeros = len(data) - len(data.lstrip(b'\0'))
+    return BASE58_ALPHABET[0] * leading_zeros + encoded
+
+
+def b58decode(value: str) -> bytes:
+    """
+    Decode a base58btc string.
+
+    :param value: The base58btc string.
+    :return: The decoded bytes.
+    """
+    number = 0
+    for char in value:
+        index = BASE58_ALPHABET.find(char)
+        if index < 0:
+            raise ValueError(f'Invalid base58 character {char!r} in {value}')
+        number = number * 58 + index
+
+    leading_zeros = len(value) - len(value.lstrip(BASE58_ALPHABET[0]))
+    return b'\0' * leading_zeros + number.to_bytes((number.bit_length() + 7) // 8, 'big')
+
+
+def cid_to_bytes(cid: str) -> bytes:
+    """
+    Convert the string form of a CID into its binary form.
+
+    Supports CIDv0 ('Qm...') and CIDv1 in base32 ('b...') or base58btc ('z...').
+
+    :param cid: The CID, with or without the /ipfs/ prefix.
+    :return: The binary CID.
+    """
+    cid = cid[6:] if cid.startswith('/ipfs/') else cid
+    if len(cid) == 46 and cid.startswith('Qm'):
+        return b58decode(cid)
+    if cid.startswith('b'):
+        padding = '=' * (-(len(cid) - 1) % 8)
+        return base64.b32decode(cid[1:].upper() + padding)
+    if cid.startswith('z'):
+        return b58decode(cid[1:])
+    raise ValueError(f'Unsupported CID: {cid}')
+
+
+def cid_from_bytes(data: bytes) -> str:
+    """
+    Convert a binary CID into its string form.
+
+    CIDv0 is encoded as base58btc, CIDv1 as base32, like the IPFS daemon does by default.
+
+    :param data: The binary CID.
+    :return: The CID as a string, without the /ipfs/ prefix.
+    """
+    if len(data) == 34 and data[0] == SHA2_256 and data[1] == 32:
+        return b58encode(data)
+    return 'b' + base64.b32encode(data).decode().lower().rstrip('=')
+
+
+def cid_codec(data: bytes) -> int:
+    """
+    Get the multicodec of the content a binary CID refers to.
+
+    :param data: The binary CID.
+    :return: The multicodec, e.g. DAG_PB or RAW.
+    """
+    if len(data) == 34 and data[0] == SHA2_256 and data[1] == 32:
+        return DAG_PB
+
+    version, offset = decode_varint(data)
+    if version != 1:
+        raise ValueError(f'Unsupported CID version {version}')
+    codec, _ = decode_varint(data, offset)
+    return codec
+
+
+def cid_multihash(data: bytes) -> bytes:
+    """
+    Get the multihash of a binary CID.
+
+    :param data: The binary CID.
+    :return: The multihash.
+    """
+    if len(data) == 34 and data[0] == SHA2_256 and data[1] == 32:
+        return data
+
+    version, offset = decode_varint(data)
+    if version != 1:
+        raise ValueError(f'Unsupported CID version {version}')
+    _, offset = decode_varint(data, offset)
+    return data[offset:]
+
+
+def verify_block(cid: bytes, block: bytes) -> None:
+    """
+    Verify that a block of data matches the hash in its binary CID.
+
+    :param cid: The binary CID of the block.
+    :param block: The data of the block.
+    :raises ValueError: If the data does not match the CID, the hash function is not supported or the digest is
+                        truncated.
+    """
+    multihash = cid_multihash(cid)
+    code, offset = decode_varint(multihash)
+    length, offset = decode_varint(multihash, offset)
+    digest = multihash[offset:]
+
+    if code == SHA2_256:
+        actual = hashlib.sha256(block).digest()
+    elif code == SHA2_512:
+        actual = hashlib.sha512(block).digest()
+    elif code == IDENTITY:
+        actual = block
+    else:
+        raise ValueError(f'Unsupported multihash function 0x{code:x} in CID {cid_from_bytes(cid)}')
+
+    # A truncated digest, down to an empty one, would let any block whose hash starts with it pass
+    if length != len(actual):
+        raise ValueError(f'Unsupported digest length {length} in CID {cid_from_bytes(cid)}')
+    if digest != actual:
+        raise ValueError(f'Block data does not match CID {cid_from_bytes(cid)}')
@@ -0,0 +1,179 @@
+import hashlib
+import json
+from typing import Any, Dict, List
+
+from .IPFS import IPFSError, add_json, get_json_many, ipfs_cache, normalize_cid
+from .UnixFS import file_cid
+
+# The key of the object that replaces a chunked value in a payload
+CHUNKS_KEY = '_chunks'
+
+# The key under which the text of a chunk is stored
+CHUNK_DATA_KEY = 'chunk'
+
+# String values whose UTF-8 encoding is larger than this are chunked by default
+DEFAULT_CHUNK_THRESHOLD = 65536
+
+MIN_CHUNK_SIZE = 4096
+AVERAGE_CHUNK_SIZE = 16384
+MAX_CHUNK_SIZE = 65536
+
+# The random values of the gear hash for every byte value, derived deterministically so every process finds the
+# same boundaries in the same data
+_GEAR = [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:8], 'big') for value in range(256)]
+_HASH_MASK = (1 << 64) - 1
+
+
+def chunk_boundaries(data: bytes, min_size: int = MIN_CHUNK_SIZE, average_size: int = AVERAGE_CHUNK_SIZE,
+                     max_size: int = MAX_CHUNK_SIZE) -> List[int]:
+    """Find content-defined chunk boundaries in data with a gear rolling hash.
+
+    A boundary is placed where the hash of the preceding bytes has its top bits all zero, so boundaries depend on the
+    content around them rather than on their offset: an insertion or an append only changes the chunks it touches.
+
+    :param data: The data
+    :type data: bytes
+    :param min_size: The minimum size of a chunk, defaults to MIN_CHUNK_SIZE
+    :type min_size: int, optional
+    :param average_size: The average size of a chunk, rounded down to a power of two, defaults to AVERAGE_CHUNK_SIZE
+    :type average_size: int, optional
+    :param max_size: The maximum size of a chunk, defaults to MAX_CHUNK_SIZE
+    :type max_size: int, optional
+    :return: The end offsets of the chunks, the last one is the length of the data
+    :rtype: List[int]
+    """
+    if not 0 < min_size <= average_size <= max_size:
+        raise ValueError(f'Expected 0 < min_size <= average_size <= max_size, got {min_size}, {average_size}, {max_size}')
+
+    bits = average_size.bit_length() - 1
+    mask = ((1 << bits) - 1) << (64 - bits)
+    gear = _GEAR
+
+    boundaries = []
+    start = 0
+    length = len(data)
+    while start < length:
+        end = min(start + max_size, length)
+        position = start + min_size
+        if position >= end:
+            boundaries.append(end)
+            start = end
+            continue
+
+        # Only the last 64 bytes affect the hash, so hashing starts 64 bytes before the first possible boundary
+        value = 0
+        for byte in data[max(start, position - 64):position]:
+            value = ((value << 1) + gear[byte]) & _HASH_MASK
+
+        while position < end:
+            value = ((value << 1) + gear[data[position]]) & _HASH_MASK
+            position += 1
+            if not value & mask:
+                break
+
+        boundaries.append(position)
+        start = position
+
+    return boundaries
+
+
+def chunk_text(text: str, **sizes: int) -> List[str]:
+    """Split text into content-defined chunks, on character boundaries of its UTF-8 encoding.
+
+    :param text: The text
+    :type text: str
+    :param sizes: The min_size, average_size and max_size of chunk_boundaries(), in bytes
+    :type sizes: int
+    :return: The chunks, which join to the text
+    :rtype: List[str]
+    """
+    data = text.encode()
+    chunks = []
+    start = 0
+    for end in chunk_boundaries(data, **sizes):
+        # Move the boundary past UTF-8 continuation bytes, so every chunk is valid text
+        while end < len(data) and data[end] & 0xc0 == 0x80:
+            end += 1
+        if end > start:
+            chunks.append(data[start:end].decode())
+            start = end
+    return chunks
+
+
+def is_chunk_reference(value: Any) -> bool:
+    """Check if a value in a payload is a reference to a chunked value.
+
+    :param value: The value
+    :type value: Any
+    :return: True if the value is an object with only a list of chunk CIDs
+    :rtype: bool
+    """
+    return isinstance(value, dict) and len(value) == 1 and isinstance(value.get(CHUNKS_KEY), list)
+
+
+def store_chunks(text: str) -> Dict[str, List[str]]:
+    """Store text as content-defined chunks and get the reference that replaces it in a payload.
+
+    Chunks that are in the cache, because they were saved or loaded before in this process, are not uploaded again.
+
+    :param text: The text
+    :type text: str
+    :return: The reference to the chunks
+    :rtype: Dict[str, List[str]]
+    """
+    cids = []
+    for chunk in chunk_text(text):
+        document = {CHUNK_DATA_KEY: chunk}
+        cid = file_cid(json.dumps(document).encode())
+        if cid is None or cid not in ipfs_cache:
+            cid = add_json(data=document)
+        cids.append(cid)
+    return {CHUNKS_KEY: cids}
+
+
+def encode_values(data: Dict[str, Any], threshold: int = DEFAULT_CHUNK_THRESHOLD) -> Dict[str, Any]:
+    """Replace the large string values of dictionary data with references to their chunks.
+
+    :param data: The dictionary data
+    :type data: Dict[str, Any]
+    :param threshold: The size in bytes above which string values are chunked, defaults to DEFAULT_CHUNK_THRESHOLD
+    :type threshold: int, optional
+    :return: The data to store, a new dict if any value was chunked
+    :rtype: Dict[str, Any]
+    """
+    # Strings with fewer characters than the threshold can not have more bytes than 4 times that
+    large = [key for key, value in data.items()
+             if isinstance(value, str) and len(value) * 4 > threshold and len(value.encode()) > threshold]
+    if not large:
+        return data
+
+    encoded = dict(data)
+    for key in large:
+        encoded[key] = store_chunks(text=data[key])
+    return encoded
+
+
+def decode_values(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the references to chunked values in stored data with the values, fetching all missing chunks in a batch.
+
+    :param data: The stored data
+    :type data: Dict[str, Any]
+    :return: The dictionary data, a new dict if any value was chunked
+    :rtype: Dict[str, Any]
+    :raises IPFSError: If a chunk can not be retrieved or is invalid
+    """
+    references = [key for key, value in data.items() if is_chunk_reference(value)]
+    if not references:
+        return data
+
+    chunks = get_json_many(cids=[cid for key in references for cid in data[key][CHUNKS_KEY]])
+    decoded = dict(data)
+    for key in references:
+        parts = []
+        for cid in data[key][CHUNKS_KEY]:
+            chunk = chunks[normalize_cid(cid)]
+            if not isinstance(chunk, dict) or not isinstance(chunk.get(CHUNK_DATA_KEY), str):
+                raise IPFSError(f'IPFS cid {cid} does not contain a chunk of the value of {key!r}')
+            parts.append(chunk[CHUNK_DATA_KEY])
+        decoded[key] = ''.join(parts)
+    return decoded
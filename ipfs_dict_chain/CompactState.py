@@ -0,0 +1,128 @@
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .FrozenDict import thaw
+
+# Stands for a key that is not present in a state
+_MISSING = object()
+
+
+class KeyTable:
+    """Share the keys of many CompactState objects, e.g. all versions of one chain.
+
+    Versions with the same keys in the same order share one tuple of keys and one index from key to position, and
+    every key string is interned, so the keys of a version cost nothing once another version had the same keys.
+    """
+
+    __slots__ = ('_tables',)
+
+    def __init__(self):
+        self._tables = {}
+
+    def intern(self, keys: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Dict[str, int]]:
+        """Get the shared tuple of keys and index for the given keys.
+
+        :param keys: The keys of a state, in order
+        :type keys: Tuple[str, ...]
+        :return: The shared tuple of keys and the shared index from key to position
+        :rtype: Tuple[Tuple[str, ...], Dict[str, int]]
+        """
+        table = self._tables.get(keys)
+        if table is None:
+            keys = tuple(sys.intern(key) for key in keys)
+            table = self._tables[keys] = (keys, {key: position for position, key in enumerate(keys)})
+        return table
+
+    def __len__(self) -> int:
+        """Return the number of distinct key tuples in the table."""
+        return len(self._tables)
+
+
+class CompactState(Mapping):
+    """A read-only, memory-compact snapshot of the dictionary data of one state.
+
+    A CompactState holds a reference to a shared key table and a tuple of values, instead of a hash table of its own.
+    When it is built from the data of a state with the next newer (or older) version of the same chain, values that
+    did not change are shared with that version instead of being kept twice. It compares equal to a dict with the
+    same items, and values are the read-only data loaded from IPFS, use :func:`ipfs_dict_chain.FrozenDict.thaw` or
+    :meth:`to_dict` to get a mutable copy.
+
+    :param keys: The shared tuple of keys, as returned by KeyTable.intern()
+    :type keys: Tuple[str, ...]
+    :param index: The shared index from key to position, as returned by KeyTable.intern()
+    :type index: Dict[str, int]
+    :param values: The values, in the order of the keys
+    :type values: Tuple[Any, ...]
+    """
+
+    __slots__ = ('_keys', '_index', '_values')
+
+    def __init__(self, keys: Tuple[str, ...], index: Dict[str, int], values: Tuple[Any, ...]):
+        if len(keys) != len(values):
+            raise ValueError(f'Expected {len(keys)} values, got {len(values)}')
+
+        self._keys = keys
+        self._index = index
+        self._values = values
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], key_table: KeyTable, adjacent: Optional['CompactState'] = None) -> 'CompactState':
+        """Build a CompactState from the dictionary data of a state.
+
+        :param data: The dictionary data
+        :type data: Dict[str, Any]
+        :param key_table: The key table shared by the versions of the chain
+        :type key_table: KeyTable
+        :param adjacent: An adjacent version of the same chain to share unchanged values with, defaults to None
+        :type adjacent: Optional[CompactState], optional
+        :return: The CompactState
+        :rtype: CompactState
+        """
+        keys, index = key_table.intern(tuple(data))
+        if adjacent is None:
+            return cls(keys=keys, index=index, values=tuple(data.values()))
+
+        values = []
+        for key, value in data.items():
+            adjacent_value = adjacent.get(key, _MISSING)
+            if adjacent_value is not _MISSING and adjacent_value is not value and type(adjacent_value) is type(value) \
+                    and adjacent_value == value:
+                value = adjacent_value
+            values.append(value)
+        return cls(keys=keys, index=index, values=tuple(values))
+
+    def __getitem__(self, key: str) -> Any:
+        """Get the value of a key.
+
+        :param key: The key
+        :type key: str
+        :return: The value
+        :rtype: Any
+        :raises KeyError: If the key is not present
+        """
+        return self._values[self._index[key]]
+
+    def __contains__(self, key: object) -> bool:
+        """Check if a key is present."""
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the keys."""
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        """Return the number of keys."""
+        return len(self._keys)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get a mutable copy of the dictionary data.
+
+        :return: The dictionary data, with mutable copies of all values
+        :rtype: Dict[str, Any]
+        """
+        return {key: thaw(value) for key, value in zip(self._keys, self._values)}
+
+    def __repr__(self) -> str:
+        """Return a more informative representation of the CompactState object."""
+        return f'CompactState({dict(self.items())!r})'
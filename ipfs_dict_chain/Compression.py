@@ -0,0 +1,144 @@
+import base64
+import json
+import zlib
+from typing import Any, Dict, Optional, Union
+
+# The key of the object that replaces a compressed payload
+COMPRESSED_KEY = '_compressed'
+
+# The supported compression codecs
+CODECS = ('zlib', 'lzma')
+
+# Payloads whose JSON encoding is smaller than this many bytes are stored uncompressed by default, below it the CPU
+# time of compressing outweighs the transfer time saved on a 10 MB/s link, see benchmarks/compression.py
+DEFAULT_COMPRESSION_THRESHOLD = 4096
+
+
+class Compressor:
+    """Compress JSON payloads into a self-describing form that is detected and decompressed automatically on load.
+
+    A compressed payload is stored as a JSON object with a single '_compressed' key, holding the name of the codec and
+    the base85 encoded compressed JSON. Payloads smaller than the threshold, or that do not get smaller, are stored
+    as they are.
+
+    :param codec: The compression codec, 'zlib' or 'lzma', defaults to 'zlib'
+    :type codec: str, optional
+    :param level: The compression level, 0-9 for both codecs, defaults to None for the default level of the codec
+    :type level: Optional[int], optional
+    :param threshold: The size in bytes below which payloads are stored uncompressed, defaults to DEFAULT_COMPRESSION_THRESHOLD
+    :type threshold: int, optional
+    """
+
+    def __init__(self, codec: str = 'zlib', level: Optional[int] = None, threshold: int = DEFAULT_COMPRESSION_THRESHOLD):
+        if codec not in CODECS:
+            raise ValueError(f'Unknown compression codec {codec!r}, expected one of {CODECS}')
+        if level is not None and not 0 <= level <= 9:
+            raise ValueError(f'Compression level must be between 0 and 9, got {level}')
+
+        self.codec = codec
+        self.level = level
+        self.threshold = threshold
+
+    def compress(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the payload to store for JSON data.
+
+        :param data: The JSON data
+        :type data: Dict[str, Any]
+        :return: The compressed payload, or the data itself if it is too small or does not compress
+        :rtype: Dict[str, Any]
+        """
+        content = json.dumps(data).encode()
+        if len(content) < self.threshold:
+            return data
+
+        compressed = base64.b85encode(compress_bytes(content, codec=self.codec, level=self.level)).decode()
+        # The envelope adds about 40 bytes around the encoded data
+        if len(compressed) + 40 >= len(content):
+            return data
+        return {COMPRESSED_KEY: {'codec': self.codec, 'data': compressed}}
+
+    def __repr__(self) -> str:
+        return f'Compressor(codec={self.codec!r}, level={self.level!r}, threshold={self.threshold!r})'
+
+
+def get_compressor(compression: Optional[Union[str, Compressor]]) -> Optional[Compressor]:
+    """Get the compressor for a compression option.
+
+    :param compression: A Compressor, the name of a codec to use with its default level and threshold, or None
+    :type compression: Optional[Union[str, Compressor]]
+    :return: The compressor, or None for no compression
+    :rtype: Optional[Compressor]
+    """
+    if compression is None or isinstance(compression, Compressor):
+        return compression
+    return Compressor(codec=compression)
+
+
+def compress_bytes(content: bytes, codec: str, level: Optional[int] = None) -> bytes:
+    """Compress bytes with a codec.
+
+    :param content: The bytes to compress
+    :type content: bytes
+    :param codec: The compression codec, 'zlib' or 'lzma'
+    :type codec: str
+    :param level: The compression level, defaults to None for the default level of the codec
+    :type level: Optional[int], optional
+    :return: The compressed bytes
+    :rtype: bytes
+    """
+    if codec == 'zlib':
+        return zlib.compress(content, -1 if level is None else level)
+    if codec == 'lzma':
+        import lzma
+
+        return lzma.compress(content, preset=level)
+    raise ValueError(f'Unknown compression codec {codec!r}, expected one of {CODECS}')
+
+
+def decompress_bytes(content: bytes, codec: str) -> bytes:
+    """Decompress bytes with a codec.
+
+    :param content: The compressed bytes
+    :type content: bytes
+    :param codec: The compression codec, 'zlib' or 'lzma'
+    :type codec: str
+    :return: The decompressed bytes
+    :rtype: bytes
+    """
+    if codec == 'zlib':
+        return zlib.decompress(content)
+    if codec == 'lzma':
+        import lzma
+
+        return lzma.decompress(content)
+    raise ValueError(f'Unknown compression codec {codec!r}, expected one of {CODECS}')
+
+
+def is_compressed(data: Any) -> bool:
+    """Check if a payload is compressed.
+
+    :param data: The payload
+    :type data: Any
+    :return: True if the payload is an object with only a compressed payload
+    :rtype: bool
+    """
+    return isinstance(data, dict) and len(data) == 1 and isinstance(data.get(COMPRESSED_KEY), dict)
+
+
+def decompress(data: Any) -> Any:
+    """Get the JSON data of a payload, decompressing it if it is compressed.
+
+    :param data: The payload
+    :type data: Any
+    :return: The JSON data, the payload itself if it is not compressed
+    :rtype: Any
+    :raises ValueError: If the compressed payload is invalid
+    """
+    if not is_compressed(data):
+        return data
+
+    envelope = data[COMPRESSED_KEY]
+    if not isinstance(envelope.get('data'), str):
+        raise ValueError('Compressed payload has no data')
+    content = decompress_bytes(base64.b85decode(envelope['data']), codec=envelope.get('codec'))
+    return json.loads(content)
@@ -0,0 +1,107 @@
+from typing import Any, NoReturn
+
+
+class FrozenDict(dict):
+    """A read-only dict used for data that is shared between readers, such as the contents of the IPFS cache.
+
+    A FrozenDict compares equal to a dict with the same items and serializes to JSON like one,
+    but every method that would modify it raises a TypeError.
+    """
+
+    def _readonly(self, *args: Any, **kwargs: Any) -> NoReturn:
+        """Refuse to modify the FrozenDict.
+
+        :raises TypeError: Always
+        """
+        raise TypeError('FrozenDict is read-only, use thaw() to get a mutable copy')
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __ior__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __reduce__(self):
+        """Support pickling and copying without going through the blocked mutators."""
+        return FrozenDict, (dict(self),)
+
+    def __repr__(self) -> str:
+        """Return a more informative representation of the FrozenDict object."""
+        return f'FrozenDict({dict.__repr__(self)})'
+
+
+class FrozenList(list):
+    """A read-only list used for data that is shared between readers, such as the contents of the IPFS cache.
+
+    A FrozenList compares equal to a list with the same items and serializes to JSON like one,
+    but every method that would modify it raises a TypeError.
+    """
+
+    def _readonly(self, *args: Any, **kwargs: Any) -> NoReturn:
+        """Refuse to modify the FrozenList.
+
+        :raises TypeError: Always
+        """
+        raise TypeError('FrozenList is read-only, use thaw() to get a mutable copy')
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __iadd__ = _readonly
+    __imul__ = _readonly
+    append = _readonly
+    extend = _readonly
+    insert = _readonly
+    pop = _readonly
+    remove = _readonly
+    clear = _readonly
+    sort = _readonly
+    reverse = _readonly
+
+    def __reduce__(self):
+        """Support pickling and copying without going through the blocked mutators."""
+        return FrozenList, (list(self),)
+
+    def __repr__(self) -> str:
+        """Return a more informative representation of the FrozenList object."""
+        return f'FrozenList({list.__repr__(self)})'
+
+
+FROZEN_TYPES = (FrozenDict, FrozenList)
+
+
+def freeze(data: Any) -> Any:
+    """Return a read-only version of JSON-like data.
+
+    Dicts and lists are converted recursively into FrozenDict and FrozenList objects, data that is already frozen
+    is returned as is, and all other values are immutable already.
+
+    :param data: The data to freeze
+    :type data: Any
+    :return: The frozen data
+    :rtype: Any
+    """
+    if type(data) in FROZEN_TYPES:
+        return data
+    if isinstance(data, dict):
+        return FrozenDict((key, freeze(value)) for key, value in data.items())
+    if isinstance(data, (list, tuple)):
+        return FrozenList(freeze(value) for value in data)
+    return data
+
+
+def thaw(data: Any) -> Any:
+    """Return a mutable deep copy of frozen data.
+
+    :param data: The data to thaw
+    :type data: Any
+    :return: A mutable copy of the data, with plain dicts and lists
+    :rtype: Any
+    """
+    if isinstance(data, dict):
+        return {key: thaw(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [thaw(value) for value in data]
+    return data
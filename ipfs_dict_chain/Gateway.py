@@ -0,0 +1,269 @@
+import http.client
+import io
+import queue
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from . import IPFS
+from .CAR import CARError, CARReader
+from .CID import cid_to_bytes
+from .IPFS import (IPFSError, IPFSNotFoundError, IPFSTimeoutError, _HTTPStatusError, _TransientError, _is_transient,
+                   normalize_cid)
+from .UnixFS import read_file
+
+# The media type of CAR responses of trustless gateways
+CAR_MEDIA_TYPE = 'application/vnd.ipld.car; version=1'
+
+
+class _ConnectionPool:
+    """A pool of keep-alive HTTP connections to one gateway.
+
+    Idle connections are reused newest first, and a request on a reused connection that the server has closed in the
+    meantime is retried once on a new connection.
+
+    :param url: The base URL of the gateway
+    :type url: str
+    :param timeout: The timeout of connecting and of every read, in seconds
+    :type timeout: float
+    :param max_connections: The maximum number of idle connections kept open
+    :type max_connections: int
+    """
+
+    def __init__(self, url: str, timeout: float, max_connections: int):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f'Invalid gateway URL {url!r}, expected an http:// or https:// URL')
+
+        self.url = url
+        self.opened = 0
+        self._connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self._host = parts.hostname
+        self._port = parts.port
+        self._prefix = parts.path.rstrip('/')
+        self._timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=max_connections)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        """Open a new connection to the gateway.
+
+        :return: The connection
+        :rtype: http.client.HTTPConnection
+        """
+        with self._lock:
+            self.opened += 1
+        return self._connection_class(self._host, self._port, timeout=self._timeout)
+
+    def get(self, path: str, headers: Dict[str, str], timeout: Optional[float] = None) -> bytes:
+        """Send a GET request to the gateway and read the whole response.
+
+        :param path: The path of the request, relative to the base URL
+        :type path: str
+        :param headers: The request headers
+        :type headers: Dict[str, str]
+        :param timeout: A shorter timeout of connecting and of every read for this request, in seconds, defaults to
+                        None for the timeout of the pool
+        :type timeout: Optional[float], optional
+        :return: The body of the response
+        :rtype: bytes
+        :raises IPFSNotFoundError: If the gateway answers with status 404
+        :raises IPFSError: If the gateway does not answer with status 200
+        """
+        timeout = self._timeout if timeout is None else min(self._timeout, timeout)
+        for attempt in range(2):
+            try:
+                connection, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                connection, reused = self._connect(), False
+
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+
+            try:
+                connection.request('GET', self._prefix + path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+
+            self._release(connection=connection, reusable=not response.will_close)
+            if response.status == 404:
+                raise IPFSNotFoundError(f'HTTP 404: {body[:200].decode(errors="replace")}')
+            if response.status != 200:
+                raise _HTTPStatusError(status=response.status, message=body[:200].decode(errors='replace'))
+            return body
+
+    def _release(self, connection: http.client.HTTPConnection, reusable: bool) -> None:
+        """Return a connection to the pool, or close it if it can not be reused or the pool is full.
+
+        :param connection: The connection
+        :type connection: http.client.HTTPConnection
+        :param reusable: Whether the server keeps the connection open
+        :type reusable: bool
+        """
+        if not reusable:
+            connection.close()
+            return
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self) -> None:
+        """Close all idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def verified_content(cid: str, car: bytes) -> bytes:
+    """Get the content of a file from CAR data, verifying every block it is made of against its CID.
+
+    :param cid: The Content Identifier (CID) of the file
+    :type cid: str
+    :param car: The CAR data, as returned by a trustless gateway
+    :type car: bytes
+    :return: The content of the file
+    :rtype: bytes
+    :raises CARError: If a block does not match its CID, or a block of the file is missing
+    """
+    blocks = dict(CARReader(stream=io.BytesIO(car)))
+    root = cid_to_bytes(cid)
+    if root not in blocks:
+        raise CARError(f'The CAR data does not contain the block of {cid}')
+
+    try:
+        return read_file(cid=root, get_block=blocks.__getitem__)
+    except KeyError:
+        raise CARError(f'The CAR data does not contain all blocks of {cid}')
+    except ValueError as e:
+        raise CARError(f'Invalid UnixFS data in the blocks of {cid}: {e}')
+
+
+class GatewayReader:
+    """Read file content from IPFS HTTP gateways instead of the RPC API of the daemon.
+
+    Content is requested as a CAR from the trustless gateway API, and every block is verified against its CID before
+    the content is returned, so gateways and caching proxies do not need to be trusted. Every gateway has its own pool
+    of keep-alive connections, which is shared by all threads and event loops. The gateways are tried in order, the
+    next one is only used when a request to the previous one fails.
+
+    :param urls: The base URLs of the gateways, e.g. http://127.0.0.1:8080
+    :type urls: Iterable[str]
+    :param timeout: The timeout of connecting and of every read, in seconds, defaults to 30.0
+    :type timeout: float, optional
+    :param max_connections: The maximum number of idle connections kept open per gateway, defaults to 8
+    :type max_connections: int, optional
+    """
+
+    def __init__(self, urls: Iterable[str], timeout: float = 30.0, max_connections: int = 8):
+        if isinstance(urls, str):
+            urls = [urls]
+        self._pools = [_ConnectionPool(url=url, timeout=timeout, max_connections=max_connections) for url in urls]
+        if not self._pools:
+            raise ValueError('GatewayReader needs at least one gateway URL')
+
+    @property
+    def urls(self) -> List[str]:
+        """The base URLs of the gateways, in the order they are tried."""
+        return [pool.url for pool in self._pools]
+
+    def cat(self, cid: str, timeout: Optional[float] = None) -> bytes:
+        """Retrieve and verify the content of a file.
+
+        :param cid: The Content Identifier (CID) of the file
+        :type cid: str
+        :param timeout: The time the request may take over all gateways, in seconds, defaults to None for no limit
+                        besides the timeout of the connections. It is also the socket timeout, so a request that is
+                        no longer awaited does not keep a thread downloading.
+        :type timeout: Optional[float], optional
+        :return: The content of the file
+        :rtype: bytes
+        :raises IPFSNotFoundError: If every gateway answers that the file can not be found
+        :raises IPFSTimeoutError: If the timeout passes before a gateway returns the content
+        :raises IPFSError: If no gateway returns content that matches the CID, a subclass that is retried by the
+                           request policy if a gateway could not be reached or was overloaded
+        """
+        cid = normalize_cid(cid)
+        expires = time.monotonic() + timeout if timeout is not None else None
+        errors = []
+        for pool in self._pools:
+            remaining = expires - time.monotonic() if expires is not None else None
+            if remaining is not None and remaining <= 0:
+                break
+            try:
+                car = pool.get(path=f'/ipfs/{cid}?format=car', headers={'Accept': CAR_MEDIA_TYPE}, timeout=remaining)
+                return verified_content(cid=cid, car=car)
+            except (OSError, http.client.HTTPException, IPFSError) as e:
+                errors.append((pool.url, e))
+
+        details = '; '.join(f'{url}: {error}' for url, error in errors)
+        if expires is not None and time.monotonic() >= expires:
+            raise IPFSTimeoutError(f'Retrieving IPFS hash {cid} from the gateways timed out after {timeout:.3g} '
+                                   f'seconds: {details}')
+        message = f'Failed to retrieve IPFS hash {cid} from the gateways: {details}'
+        if all(isinstance(error, IPFSNotFoundError) for _, error in errors):
+            raise IPFSNotFoundError(message)
+        if any(_is_transient(error) or isinstance(error, http.client.HTTPException) for _, error in errors):
+            raise _TransientError(message)
+        raise IPFSError(message)
+
+    def close(self) -> None:
+        """Close the idle connections to all gateways."""
+        for pool in self._pools:
+            pool.close()
+
+
+_gateway_lock = threading.Lock()
+
+
+def use_gateway(urls: Iterable[str], timeout: float = 30.0, max_connections: int = 8) -> GatewayReader:
+    """Read files, and with them all JSON data, from HTTP gateways instead of the RPC API of the daemon.
+
+    Writes still go to the daemon through the RPC API.
+
+    :param urls: The base URLs of the gateways, tried in order, e.g. http://127.0.0.1:8080
+    :type urls: Iterable[str]
+    :param timeout: The timeout of connecting and of every read, in seconds, defaults to 30.0
+    :type timeout: float, optional
+    :param max_connections: The maximum number of idle connections kept open per gateway, defaults to 8
+    :type max_connections: int, optional
+    :return: The gateway reader
+    :rtype: GatewayReader
+    """
+    reader = GatewayReader(urls=urls, timeout=timeout, max_connections=max_connections)
+    with _gateway_lock:
+        previous, IPFS._gateway = IPFS._gateway, reader
+
+    if previous is not None:
+        previous.close()
+    return reader
+
+
+def use_rpc() -> None:
+    """Switch reads back to the RPC API of the daemon and close the connections to the gateways."""
+    with _gateway_lock:
+        previous, IPFS._gateway = IPFS._gateway, None
+
+    if previous is not None:
+        previous.close()
+
+
+def current_gateway() -> Optional[GatewayReader]:
+    """Get the gateway reader that is used for reads.
+
+    :return: The gateway reader, or None if reads go through the RPC API
+    :rtype: Optional[GatewayReader]
+    """
+    return IPFS._gateway
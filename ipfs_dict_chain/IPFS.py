@@ -1,29 +1,301 @@
 import asyncio
+import collections
+import contextlib
+import contextvars
+import functools
 import json
-import aioipfs
-from multiaddr import Multiaddr
-from typing import Dict
+import math
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, \
+    Union
+
+from .Compression import COMPRESSED_KEY, decompress, is_compressed
+from .FrozenDict import freeze
+from .JSONStream import JSONObjectParser
+
+# aioipfs, aiohttp and multiaddr are only imported on the first network call, so CID-only and cache-only users
+# start up without loading them
+if TYPE_CHECKING:
+    import aioipfs
+    from multiaddr import Multiaddr
+
+    from .Gateway import GatewayReader
 
 DEFAULT_HOST = '127.0.0.1'
 DEFAULT_PORT = 5001
-multi_address = Multiaddr(f'/ip4/{DEFAULT_HOST}/tcp/{DEFAULT_PORT}')
+# The size of the chunks in which file content is streamed from the IPFS daemon
+STREAM_CHUNK_SIZE = 65536
+_connection_lock = threading.Lock()
+# The connection kept open by connect(keep_alive=True)
+_keep_alive = None
+
+
+def __getattr__(name: str) -> Any:
+    """Build the default multi_address the first time it is used, instead of at import time.
+
+    :param name: The name of the module attribute
+    :type name: str
+    :return: The value of the attribute
+    :rtype: Any
+    :raises AttributeError: If the module has no such attribute
+    """
+    if name == 'multi_address':
+        return _multi_address()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
-def connect(host: str, port: int) -> None:
+def _multi_address() -> 'Multiaddr':
+    """Get the address of the connected daemon, defaulting to the local daemon.
+
+    :return: The multiaddress of the IPFS daemon.
+    :rtype: Multiaddr
+    """
+    address = globals().get('multi_address')
+    if address is None:
+        with _connection_lock:
+            address = globals().get('multi_address')
+            if address is None:
+                from multiaddr import Multiaddr
+                address = globals()['multi_address'] = Multiaddr(f'/ip4/{DEFAULT_HOST}/tcp/{DEFAULT_PORT}')
+    return address
+
+
+def connect(host: str, port: int, keep_alive: bool = False) -> Dict[str, Any]:
     """Connect to an IPFS daemon.
 
+    The daemon is verified with a read-only probe, see :func:`probe`, and the new address is only installed after
+    the probe succeeded, so a failed connect leaves the previous address in place. Operations that are already
+    running keep using the address they started with.
+
+    With keep_alive, the probed connection is kept open on a background event loop and reused by all synchronous
+    calls, instead of opening a new connection on a new event loop for every call. Use :func:`close_connection`
+    to close it again.
+
     :param host: The host of the IPFS daemon.
     :type host: str
     :param port: The port of the IPFS daemon.
     :type port: int
+    :param keep_alive: Keep the connection open for reuse, defaults to False
+    :type keep_alive: bool, optional
+    :return: The daemon information returned by the probe.
+    :rtype: Dict[str, Any]
     :raises IPFSError: If the connection to the IPFS daemon fails.
     """
-    global multi_address
-    multi_address = Multiaddr(f'/ip4/{host}/tcp/{port}')
+    global multi_address, _keep_alive
+    from multiaddr import Multiaddr
+
+    address = Multiaddr(f'/ip4/{host}/tcp/{port}')
+    with _connection_lock:
+        runner = _KeepAlive(maddr=address) if keep_alive else None
+        try:
+            if runner is not None:
+                info = runner.run(_probe(maddr=address, client=_SharedClient(runner.client)))
+            else:
+                info = _run_once(_probe(maddr=address))
+        except Exception as e:
+            if runner is not None:
+                runner.close()
+            raise IPFSError(f'Failed to connect to IPFS daemon at {address}: {e}')
+
+        multi_address = address
+        previous_runner, _keep_alive = _keep_alive, runner
+
+    if previous_runner is not None:
+        previous_runner.close()
+    return info
+
+
+def connect_fastest(addresses: Iterable[Tuple[str, int]], keep_alive: bool = False) -> Dict[str, Any]:
+    """Probe several IPFS daemons concurrently and connect to the one with the lowest latency.
+
+    :param addresses: The (host, port) pairs of the IPFS daemons.
+    :type addresses: Iterable[Tuple[str, int]]
+    :param keep_alive: Keep the connection open for reuse, defaults to False
+    :type keep_alive: bool, optional
+    :return: The daemon information of the daemon that was connected to.
+    :rtype: Dict[str, Any]
+    :raises IPFSError: If none of the daemons can be reached.
+    """
+    from multiaddr import Multiaddr
+
+    addresses = list(addresses)
+    maddrs = [Multiaddr(f'/ip4/{host}/tcp/{port}') for host, port in addresses]
+
+    async def probe_all() -> List[Any]:
+        return await asyncio.gather(*[_probe(maddr=maddr) for maddr in maddrs], return_exceptions=True)
+
+    results = _run_once(probe_all())
+    reachable = [(info['latency'], index) for index, info in enumerate(results) if not isinstance(info, BaseException)]
+    if not reachable:
+        raise IPFSError(f'Failed to connect to any IPFS daemon: {", ".join(str(maddr) for maddr in maddrs)}')
+
+    _, fastest = min(reachable)
+    host, port = addresses[fastest]
+    return connect(host=host, port=port, keep_alive=keep_alive)
+
+
+def close_connection() -> None:
+    """Close the connection kept open by connect(keep_alive=True).
+
+    Synchronous calls go back to opening a connection per call. The connected address is not changed.
+    """
+    global _keep_alive
+
+    with _connection_lock:
+        runner, _keep_alive = _keep_alive, None
+
+    if runner is not None:
+        runner.close()
+
+
+def probe(host: str, port: int) -> Dict[str, Any]:
+    """Check an IPFS daemon with read-only requests, without connecting to it.
+
+    :param host: The host of the IPFS daemon.
+    :type host: str
+    :param port: The port of the IPFS daemon.
+    :type port: int
+    :return: The address, the latency in seconds, the peer ID, agent version, version and supported protocols of the daemon.
+    :rtype: Dict[str, Any]
+    :raises IPFSError: If the IPFS daemon can not be reached.
+    """
+    from multiaddr import Multiaddr
+
+    address = Multiaddr(f'/ip4/{host}/tcp/{port}')
     try:
-        _ = add_json(data={'key': 'value'})
+        return _run_once(_probe(maddr=address))
     except Exception as e:
-        raise IPFSError(f'Failed to connect to IPFS daemon at {multi_address}: {e}')
+        raise IPFSError(f'Failed to probe IPFS daemon at {address}: {e}')
+
+
+async def _probe(maddr: 'Multiaddr', client: Optional[Any] = None) -> Dict[str, Any]:
+    """Check an IPFS daemon with the read-only id and version requests and measure its latency.
+
+    The id request opens the connection, the latency is the round-trip time of the version request that follows it
+    on the same connection.
+
+    :param maddr: The multiaddress of the IPFS daemon.
+    :type maddr: Multiaddr
+    :param client: The client to probe with, defaults to a new client for maddr
+    :type client: Optional[Any], optional
+    :return: The address, the latency in seconds, the peer ID, agent version, version and supported protocols of the daemon.
+    :rtype: Dict[str, Any]
+    """
+    if client is None:
+        client = _client(maddr=maddr)
+
+    try:
+        identity = await client.core.id()
+        start = time.perf_counter()
+        version = await client.core.version()
+        latency = time.perf_counter() - start
+    finally:
+        await client.close()
+
+    return {
+        'address': str(maddr),
+        'latency': latency,
+        'id': identity.get('ID'),
+        'agent_version': identity.get('AgentVersion'),
+        'version': version.get('Version'),
+        'protocols': identity.get('Protocols') or [],
+    }
+
+
+class _KeepAlive:
+    """A background event loop with a single client for one daemon, used by all synchronous calls.
+
+    :param maddr: The multiaddress of the IPFS daemon.
+    :type maddr: Multiaddr
+    """
+
+    def __init__(self, maddr: 'Multiaddr'):
+        self.maddr = maddr
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='ipfs-keep-alive', daemon=True)
+        self._thread.start()
+
+        async def create_client() -> 'aioipfs.AsyncIPFS':
+            import aioipfs
+            return aioipfs.AsyncIPFS(maddr=maddr)
+
+        self.client = self.run(create_client())
+
+    def run(self, coroutine: Any) -> Any:
+        """Run a coroutine on the background event loop and wait for its result.
+
+        :param coroutine: The coroutine to run.
+        :type coroutine: Any
+        :return: The result of the coroutine.
+        :rtype: Any
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self) -> None:
+        """Wait for the running operations, then close the client and stop the background event loop."""
+        async def shutdown() -> None:
+            others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if others:
+                await asyncio.wait(others)
+            await self.client.close()
+
+        try:
+            self.run(shutdown())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+
+
+class _SharedClient:
+    """A client that shares the connection of a _KeepAlive, closing it does not close the connection.
+
+    :param client: The shared client.
+    :type client: aioipfs.AsyncIPFS
+    """
+
+    def __init__(self, client: 'aioipfs.AsyncIPFS'):
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+    async def close(self) -> None:
+        """Keep the shared connection open."""
+
+
+def _run(coroutine: Any) -> Any:
+    """Run a coroutine for a synchronous wrapper, on the kept-alive event loop if there is one.
+
+    :param coroutine: The coroutine to run.
+    :type coroutine: Any
+    :return: The result of the coroutine.
+    :rtype: Any
+    """
+    runner = _keep_alive
+    if runner is not None:
+        return runner.run(coroutine)
+    return _run_once(coroutine)
+
+
+def _run_once(coroutine: Any) -> Any:
+    """Run a coroutine on a new event loop.
+
+    :param coroutine: The coroutine to run.
+    :type coroutine: Any
+    :return: The result of the coroutine.
+    :rtype: Any
+    """
+    event_loop = asyncio.new_event_loop()
+    try:
+        return event_loop.run_until_complete(coroutine)
+    finally:
+        event_loop.close()
 
 
 class IPFSError(Exception):
@@ -31,125 +303,1326 @@ class IPFSError(Exception):
     pass
 
 
+class IPFSTimeoutError(IPFSError):
+    """Raised when a request to IPFS does not finish within its timeout, or the deadline of the operation passes."""
+    pass
+
+
+class IPFSNotFoundError(IPFSError):
+    """Raised when the IPFS daemon answers that content can not be found."""
+    pass
+
+
+class _TransientError(IPFSError):
+    """Raised when a request failed in a way that may succeed when it is retried, e.g. no gateway could be reached."""
+    pass
+
+
+class _HTTPStatusError(IPFSError):
+    """Raised when the IPFS daemon answers a request with an HTTP error status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f'HTTP {status}: {message}')
+        self.status = status
+
+
+def _wrap_error(error: BaseException, context: str) -> IPFSError:
+    """Add context to the message of an error, keeping the type of timeouts and missing content.
+
+    :param error: The error
+    :type error: BaseException
+    :param context: The context, e.g. the operation that failed
+    :type context: str
+    :return: The error to raise
+    :rtype: IPFSError
+    """
+    error_type = type(error) if isinstance(error, (IPFSTimeoutError, IPFSNotFoundError)) else IPFSError
+    return error_type(f'{context}: {error}')
+
+
+def normalize_cid(cid: str) -> str:
+    """Normalize a Content Identifier (CID) to its short form, without the /ipfs/ prefix.
+
+    :param cid: The Content Identifier (CID), with or without the /ipfs/ prefix.
+    :type cid: str
+    :return: The short form of the CID.
+    :rtype: str
+    """
+    return cid[6:] if cid.startswith('/ipfs/') else cid
+
+
 class IPFSCache:
-    """A simple cache for IPFS data."""
+    """A thread-safe cache for IPFS data.
 
-    def __init__(self):
-        self._cache = {}
+    Entries are spread over a number of independently locked stripes, so threads working on different
+    CIDs rarely contend for the same lock. Data is stored frozen (see :mod:`ipfs_dict_chain.FrozenDict`),
+    so every reader can share the cached object without copying it and without being able to corrupt it.
+    Entries are keyed on the normalized CID, so '/ipfs/Qm...' and 'Qm...' refer to the same entry.
 
-    def get(self, cid: str) -> Dict:
+    :param stripes: The number of lock stripes, defaults to 16
+    :type stripes: int, optional
+    """
+
+    def __init__(self, stripes: int = 16):
+        if stripes < 1:
+            raise ValueError(f'IPFSCache needs at least one stripe, got {stripes}')
+
+        self._stripes = [{} for _ in range(stripes)]
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def _stripe(self, cid: str) -> int:
+        """Get the index of the stripe that holds the given Content Identifier (CID).
+
+        :param cid: The Content Identifier (CID) of the data in the cache.
+        :type cid: str
+        :return: The stripe index.
+        :rtype: int
+        """
+        return hash(cid) % len(self._stripes)
+
+    def get(self, cid: str, default: Any = None) -> Dict:
         """Retrieve data from the cache by its Content Identifier (CID).
 
         :param cid: The Content Identifier (CID) of the data in the cache.
         :type cid: str
+        :param default: The value to return if the CID is not in the cache, defaults to None
+        :type default: Any, optional
         :return: The data retrieved from the cache.
         :rtype: Dict
         """
-        return self._cache.get(cid)
+        cid = normalize_cid(cid)
+        index = self._stripe(cid)
+        with self._locks[index]:
+            return self._stripes[index].get(cid, default)
 
     def set(self, cid: str, data: Dict) -> None:
-        """Store data in the cache with its Content Identifier (CID).
+        """Store a frozen copy of data in the cache with its Content Identifier (CID).
 
         :param cid: The Content Identifier (CID) of the data.
         :type cid: str
         :param data: The data to be stored in the cache.
         :type data: Dict
         """
-        self._cache[cid] = data
+        cid = normalize_cid(cid)
+        data = freeze(data)
+        index = self._stripe(cid)
+        with self._locks[index]:
+            self._stripes[index][cid] = data
+
+    def delete(self, cid: str) -> None:
+        """Remove data from the cache by its Content Identifier (CID), if present.
+
+        :param cid: The Content Identifier (CID) of the data in the cache.
+        :type cid: str
+        """
+        cid = normalize_cid(cid)
+        index = self._stripe(cid)
+        with self._locks[index]:
+            self._stripes[index].pop(cid, None)
+
+    def clear(self) -> None:
+        """Remove all data from the cache."""
+        for lock, stripe in zip(self._locks, self._stripes):
+            with lock:
+                stripe.clear()
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """Get a snapshot of the entries of the cache.
+
+        :return: The Content Identifiers (CIDs) and their frozen data.
+        :rtype: List[Tuple[str, Any]]
+        """
+        entries = []
+        for lock, stripe in zip(self._locks, self._stripes):
+            with lock:
+                entries.extend(stripe.items())
+        return entries
+
+    def __contains__(self, cid: str) -> bool:
+        """Return True if data for the Content Identifier (CID) is in the cache, False otherwise."""
+        return self.get(cid, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        """Return the number of entries in the cache."""
+        return sum(len(stripe) for stripe in self._stripes)
 
 
+# Sentinel for cache misses, so that falsy payloads such as {} are still cache hits
+_MISSING = object()
+
 ipfs_cache = IPFSCache()
 
 
-async def get_file_content(cid: str) -> str:
+class _InFlightCall:
+    """A call in progress whose outcome is shared with every thread asking for the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into a single execution.
+
+    The first thread to ask for a key runs the function; every other thread asking for the same key while
+    that call is still running waits for it and receives the same result (or exception). A waiting thread gives
+    up when its own deadline passes, while the call goes on for the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """Run func for the given key, or wait for the call already in flight for that key.
+
+        :param key: The key identifying the call, e.g. a CID.
+        :type key: str
+        :param func: The function to execute if no call for the key is in flight.
+        :type func: Callable[[], Any]
+        :return: The result of the (shared) call.
+        :rtype: Any
+        :raises IPFSTimeoutError: If the deadline of a waiting thread passes before the call in flight finishes
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _InFlightCall()
+
+        if not leader:
+            expires = _deadline.get()
+            if not call.done.wait(timeout=None if expires is None else max(expires - time.monotonic(), 0)):
+                raise IPFSTimeoutError(f'Waiting for the call in flight for {key}: the deadline has passed')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+
+class _LimitedRequest:
+    """A request to the IPFS daemon that holds a slot of a RequestLimiter while it is in progress."""
+
+    __slots__ = ('_limiter', '_sequence', '_start', '_latency')
+
+    def __init__(self, limiter: 'RequestLimiter'):
+        self._limiter = limiter
+        self._sequence = 0
+        self._start = 0.0
+        self._latency = None
+
+    def responded(self) -> None:
+        """Record that the daemon has started to answer, e.g. for a streamed response, so the time it takes to
+        transfer the rest of the response does not count as latency."""
+        if self._latency is None:
+            self._latency = time.monotonic() - self._start
+
+    async def __aenter__(self) -> '_LimitedRequest':
+        self._sequence = await self._limiter._acquire()
+        self._start = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        if self._latency is None:
+            self._latency = time.monotonic() - self._start
+
+        if exc_type is None:
+            failed = False
+        elif issubclass(exc_type, (asyncio.CancelledError, GeneratorExit)):
+            # A request that is abandoned, e.g. a stream that is closed early, only tells something if it got an answer
+            failed = None if self._latency is None else False
+        else:
+            failed = not _is_application_error(exc)
+
+        self._limiter._release(sequence=self._sequence, latency=self._latency, failed=failed)
+
+
+def _is_application_error(error: BaseException) -> bool:
+    """Check if an error is an answer of the daemon, such as an invalid or unknown CID, rather than a sign of overload.
+
+    :param error: The error
+    :type error: BaseException
+    :return: True if the daemon answered the request with the error
+    :rtype: bool
+    """
+    if isinstance(error, _HTTPStatusError):
+        return error.status not in _OVERLOAD_STATUSES
+    if isinstance(error, IPFSError):
+        return True
+    aioipfs = sys.modules.get('aioipfs')
+    return aioipfs is not None and isinstance(error, aioipfs.APIError)
+
+
+class RequestLimiter:
+    """Limit the concurrency and the rate of the requests to the IPFS daemon, across all threads and event loops.
+
+    Every add and cat holds a slot while it is in progress, and waits for one when all slots are taken. With a rate,
+    requests also take a token from a bucket that holds up to burst tokens and is refilled at rate tokens per second.
+
+    When adaptive, the number of slots, the window, is adjusted between min_concurrency and max_concurrency like TCP
+    congestion control: it starts at min_concurrency and doubles every round trip until the daemon shows overload,
+    then grows by one slot per round trip and is halved, at most once per round trip, when a request fails or its
+    latency exceeds latency_tolerance times the baseline, the lowest recently observed latency. Errors that are
+    answers of the daemon, such as an unknown CID, do not count as overload.
+
+    :param max_concurrency: The maximum number of requests in progress, defaults to DEFAULT_MAX_CONCURRENCY, None for no limit
+    :type max_concurrency: Optional[int], optional
+    :param rate: The maximum number of requests started per second, defaults to None for no limit
+    :type rate: Optional[float], optional
+    :param burst: The number of requests that can start at once within the rate, defaults to None for the rate rounded up
+    :type burst: Optional[int], optional
+    :param adaptive: Adapt the window to the observed latency and errors, defaults to False
+    :type adaptive: bool, optional
+    :param min_concurrency: The minimum window when adaptive, defaults to 1
+    :type min_concurrency: int, optional
+    :param latency_tolerance: The factor over the baseline latency that counts as overload, defaults to 2.0
+    :type latency_tolerance: float, optional
+    """
+
+    # How fast the baseline latency follows higher latencies, as a fraction of the difference per request
+    BASELINE_DRIFT = 0.01
+    # Latencies within this many seconds of the baseline never count as overload, to ignore jitter on a fast daemon
+    LATENCY_SLACK = 0.01
+
+    def __init__(self, max_concurrency: Optional[int] = None, rate: Optional[float] = None, burst: Optional[int] = None,
+                 adaptive: bool = False, min_concurrency: int = 1, latency_tolerance: float = 2.0):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(f'max_concurrency must be at least 1, got {max_concurrency}')
+        if adaptive and max_concurrency is None:
+            raise ValueError('An adaptive limiter needs a max_concurrency')
+        if not 1 <= min_concurrency <= (max_concurrency or min_concurrency):
+            raise ValueError(f'min_concurrency must be between 1 and max_concurrency, got {min_concurrency}')
+        if rate is not None and rate <= 0:
+            raise ValueError(f'rate must be positive, got {rate}')
+        if burst is not None and burst < 1:
+            raise ValueError(f'burst must be at least 1, got {burst}')
+        if latency_tolerance <= 1:
+            raise ValueError(f'latency_tolerance must be greater than 1, got {latency_tolerance}')
+
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.rate = rate
+        self.burst = burst if burst is not None else (math.ceil(rate) if rate is not None else None)
+        self.adaptive = adaptive
+        self.latency_tolerance = latency_tolerance
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters = collections.deque()
+        self._started = 0
+        self._window = float(min_concurrency if adaptive else max_concurrency or 0)
+        self._slow_start = True
+        self._decreased_at = 0
+        self._baseline = None
+        self._tokens = float(self.burst or 0)
+        self._refilled = time.monotonic()
+
+    @property
+    def window(self) -> Optional[int]:
+        """The current maximum number of requests in progress, None if there is no limit."""
+        return int(self._window) if self.max_concurrency is not None else None
+
+    @property
+    def active(self) -> int:
+        """The number of requests in progress."""
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        """The number of requests waiting for a slot."""
+        return len(self._waiters)
+
+    def request(self) -> _LimitedRequest:
+        """Get an async context manager that holds a slot for a request to the daemon.
+
+        :return: The request, which can record when the daemon responded
+        :rtype: _LimitedRequest
+        """
+        return _LimitedRequest(limiter=self)
+
+    def _has_slot(self) -> bool:
+        return self.max_concurrency is None or self._active < int(self._window)
+
+    async def _take_token(self) -> None:
+        """Wait until the rate allows another request to start."""
+        if self.rate is None:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            # Tokens are reserved ahead, so concurrent waiters start one after the other at the rate
+            self._tokens -= 1
+            delay = -self._tokens / self.rate
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _acquire(self) -> int:
+        """Wait for a slot.
+
+        :return: The sequence number of the request, in the order requests got their slot
+        :rtype: int
+        """
+        await self._take_token()
+
+        with self._lock:
+            if not self._waiters and self._has_slot():
+                self._active += 1
+                self._started += 1
+                return self._started
+            future = asyncio.get_running_loop().create_future()
+            waiter = (asyncio.get_running_loop(), future)
+            self._waiters.append(waiter)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    granted = False
+                except ValueError:
+                    granted = True
+            # A slot granted to a cancelled future is released by _grant()
+            if granted and future.done() and not future.cancelled():
+                self._release(sequence=0, latency=None, failed=None)
+            raise
+
+        with self._lock:
+            self._started += 1
+            return self._started
+
+    def _release(self, sequence: int, latency: Optional[float], failed: Optional[bool]) -> None:
+        """Release a slot and adapt the window to the outcome of the request.
+
+        :param sequence: The sequence number of the request
+        :type sequence: int
+        :param latency: The latency of the request in seconds, None if unknown
+        :type latency: Optional[float]
+        :param failed: Whether the request failed because of overload, None if the outcome is unknown
+        :type failed: Optional[bool]
+        """
+        with self._lock:
+            self._active -= 1
+            if self.adaptive and failed is not None:
+                self._adapt(sequence=sequence, latency=latency, failed=failed)
+            granted = self._wake()
+        self._notify(granted=granted)
+
+    def _adapt(self, sequence: int, latency: Optional[float], failed: bool) -> None:
+        """Adapt the window to the outcome of a request, with the lock held.
+
+        :param sequence: The sequence number of the request
+        :type sequence: int
+        :param latency: The latency of the request in seconds, None if unknown
+        :type latency: Optional[float]
+        :param failed: Whether the request failed because of overload
+        :type failed: bool
+        """
+        congested = failed
+        if latency is not None and not failed:
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                self._baseline += (latency - self._baseline) * self.BASELINE_DRIFT
+            congested = latency > self._baseline * self.latency_tolerance and latency - self._baseline > self.LATENCY_SLACK
+
+        if congested:
+            # Requests that started before the last decrease were sent with the larger window, they do not count again
+            if sequence > self._decreased_at:
+                self._window = max(float(self.min_concurrency), self._window / 2)
+                self._slow_start = False
+                self._decreased_at = self._started
+        elif self._slow_start:
+            self._window = min(float(self.max_concurrency), self._window + 1)
+        else:
+            self._window = min(float(self.max_concurrency), self._window + 1 / self._window)
+
+    def _wake(self) -> List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]:
+        """Grant free slots to waiting requests, with the lock held.
+
+        :return: The waiters that got a slot, to notify once the lock is released
+        :rtype: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]
+        """
+        granted = []
+        while self._waiters and self._has_slot():
+            granted.append(self._waiters.popleft())
+            self._active += 1
+        return granted
+
+    def _notify(self, granted: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]) -> None:
+        """Wake waiting requests on their own event loops.
+
+        :param granted: The waiters that got a slot
+        :type granted: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]
+        """
+        for loop, future in granted:
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:
+                # The event loop of the waiter has been closed
+                self._release(sequence=0, latency=None, failed=None)
+
+    def _grant(self, future: asyncio.Future) -> None:
+        """Hand a slot to a waiting request, on its event loop.
+
+        :param future: The future the request waits for
+        :type future: asyncio.Future
+        """
+        if future.done():
+            self._release(sequence=0, latency=None, failed=None)
+        else:
+            future.set_result(None)
+
+
+# The default maximum number of concurrent requests to the IPFS daemon
+DEFAULT_MAX_CONCURRENCY = 64
+
+# The HTTP statuses with which a daemon or a proxy in front of it signals overload
+_OVERLOAD_STATUSES = (429, 503)
+
+# The limiter of all requests to the IPFS daemon, replaced by limit_requests()
+_request_limiter = RequestLimiter(max_concurrency=DEFAULT_MAX_CONCURRENCY)
+
+
+def limit_requests(max_concurrency: Optional[int] = DEFAULT_MAX_CONCURRENCY, rate: Optional[float] = None,
+                   burst: Optional[int] = None, adaptive: bool = False, min_concurrency: int = 1,
+                   latency_tolerance: float = 2.0) -> RequestLimiter:
+    """Set the limits of the requests to the IPFS daemon, shared by all threads and event loops of the process.
+
+    Requests that are already waiting for the previous limiter are started by it.
+
+    :param max_concurrency: The maximum number of requests in progress, defaults to DEFAULT_MAX_CONCURRENCY, None for no limit
+    :type max_concurrency: Optional[int], optional
+    :param rate: The maximum number of requests started per second, defaults to None for no limit
+    :type rate: Optional[float], optional
+    :param burst: The number of requests that can start at once within the rate, defaults to None for the rate rounded up
+    :type burst: Optional[int], optional
+    :param adaptive: Adapt the concurrency to the observed latency and errors, see RequestLimiter, defaults to False
+    :type adaptive: bool, optional
+    :param min_concurrency: The minimum concurrency when adaptive, defaults to 1
+    :type min_concurrency: int, optional
+    :param latency_tolerance: The factor over the baseline latency that counts as overload, defaults to 2.0
+    :type latency_tolerance: float, optional
+    :return: The new limiter
+    :rtype: RequestLimiter
+    """
+    global _request_limiter
+    _request_limiter = RequestLimiter(max_concurrency=max_concurrency, rate=rate, burst=burst, adaptive=adaptive,
+                                      min_concurrency=min_concurrency, latency_tolerance=latency_tolerance)
+    return _request_limiter
+
+
+def request_limiter() -> RequestLimiter:
+    """Get the limiter of the requests to the IPFS daemon.
+
+    :return: The limiter
+    :rtype: RequestLimiter
+    """
+    return _request_limiter
+
+
+class RequestPolicy:
+    """The timeout and the retries of the requests to the IPFS daemon.
+
+    A request that fails with a transient error, such as a lost connection or HTTP 429, 502, 503 or 504, is retried
+    up to retries times, after a random delay of up to backoff * 2 ** attempt seconds, capped at max_backoff. Requests
+    that time out are not retried, and neither are answers of the daemon such as an invalid or unknown CID.
+
+    :param timeout: The timeout of a request in seconds, for streamed content the maximum time without progress,
+        defaults to DEFAULT_TIMEOUT, None for no timeout
+    :type timeout: Optional[float], optional
+    :param retries: The maximum number of retries of a request, defaults to DEFAULT_RETRIES
+    :type retries: int, optional
+    :param backoff: The maximum delay before the first retry in seconds, defaults to 0.1
+    :type backoff: float, optional
+    :param max_backoff: The maximum delay before a retry in seconds, defaults to 2.0
+    :type max_backoff: float, optional
+    """
+
+    def __init__(self, timeout: Optional[float] = None, retries: int = 0, backoff: float = 0.1, max_backoff: float = 2.0):
+        if timeout is not None and timeout <= 0:
+            raise ValueError(f'timeout must be positive, got {timeout}')
+        if retries < 0:
+            raise ValueError(f'retries must not be negative, got {retries}')
+        if backoff < 0 or max_backoff < 0:
+            raise ValueError(f'backoff and max_backoff must not be negative, got {backoff} and {max_backoff}')
+
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt: int) -> float:
+        """Get the delay before a retry, with full jitter so that clients that failed together do not retry together.
+
+        :param attempt: The number of the attempt that failed, starting at 0
+        :type attempt: int
+        :return: The delay in seconds
+        :rtype: float
+        """
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+# The default timeout of a request to the IPFS daemon in seconds
+DEFAULT_TIMEOUT = 60.0
+
+# The default maximum number of retries of a request to the IPFS daemon that failed with a transient error
+DEFAULT_RETRIES = 2
+
+# The HTTP statuses of transient errors, after which a request is retried
+_TRANSIENT_STATUSES = (429, 502, 503, 504)
+
+# The timeout and the retries of all requests to the IPFS daemon, replaced by set_request_policy()
+_request_policy = RequestPolicy(timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES)
+
+# The deadline of the IPFS operations of the current context, in time.monotonic() seconds, set by deadline()
+_deadline = contextvars.ContextVar('ipfs_deadline', default=None)
+
+
+def set_request_policy(timeout: Optional[float] = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                       backoff: float = 0.1, max_backoff: float = 2.0) -> RequestPolicy:
+    """Set the timeout and the retries of the requests to the IPFS daemon, see RequestPolicy.
+
+    :param timeout: The timeout of a request in seconds, defaults to DEFAULT_TIMEOUT, None for no timeout
+    :type timeout: Optional[float], optional
+    :param retries: The maximum number of retries of a request, defaults to DEFAULT_RETRIES
+    :type retries: int, optional
+    :param backoff: The maximum delay before the first retry in seconds, defaults to 0.1
+    :type backoff: float, optional
+    :param max_backoff: The maximum delay before a retry in seconds, defaults to 2.0
+    :type max_backoff: float, optional
+    :return: The new policy
+    :rtype: RequestPolicy
+    """
+    global _request_policy
+    _request_policy = RequestPolicy(timeout=timeout, retries=retries, backoff=backoff, max_backoff=max_backoff)
+    return _request_policy
+
+
+def request_policy() -> RequestPolicy:
+    """Get the timeout and the retries of the requests to the IPFS daemon.
+
+    :return: The policy
+    :rtype: RequestPolicy
+    """
+    return _request_policy
+
+
+@contextlib.contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """Limit the total time of the IPFS operations in a block, including all their requests and retries.
+
+    The deadline applies to the synchronous and asynchronous operations of the current thread or task, also to
+    operations that make many requests such as IPFSDictChain.get_previous_states(), and raises IPFSTimeoutError
+    when it passes. Nested deadlines can only shorten the deadline.
+
+    :param seconds: The time the operations may take, in seconds
+    :type seconds: float
+    """
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(expires if current is None else min(current, expires))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _timeout(what: str) -> Optional[float]:
+    """Get the timeout of the next request, or of the next step of a streamed request.
+
+    :param what: A description of the operation, for the error message
+    :type what: str
+    :return: The timeout of the request policy, shortened to the time left until the deadline, None for no timeout
+    :rtype: Optional[float]
+    :raises IPFSTimeoutError: If the deadline has passed
+    """
+    timeout = _request_policy.timeout
+    expires = _deadline.get()
+    if expires is not None:
+        remaining = expires - time.monotonic()
+        if remaining <= 0:
+            raise IPFSTimeoutError(f'{what}: the deadline has passed')
+        timeout = remaining if timeout is None else min(timeout, remaining)
+    return timeout
+
+
+async def _timed(what: str, awaitable: Callable[[], Awaitable[Any]]) -> Any:
+    """Await a request, or a step of a streamed request, within its timeout.
+
+    :param what: A description of the operation, for the error message
+    :type what: str
+    :param awaitable: A function that returns the awaitable
+    :type awaitable: Callable[[], Awaitable[Any]]
+    :return: The result of the awaitable
+    :rtype: Any
+    :raises IPFSTimeoutError: If the timeout or the deadline passes
+    """
+    timeout = _timeout(what)
+    try:
+        return await asyncio.wait_for(awaitable(), timeout)
+    except asyncio.TimeoutError:
+        raise IPFSTimeoutError(f'{what} timed out after {timeout:.3g} seconds') from None
+
+
+def _is_transient(error: BaseException) -> bool:
+    """Check if a request that failed with an error may succeed when it is retried.
+
+    :param error: The error
+    :type error: BaseException
+    :return: True for lost connections and for HTTP statuses that signal overload or a failing proxy
+    :rtype: bool
+    """
+    if isinstance(error, _HTTPStatusError):
+        return error.status in _TRANSIENT_STATUSES
+    if isinstance(error, _TransientError):
+        return True
+    if isinstance(error, IPFSError):
+        return False
+    aioipfs = sys.modules.get('aioipfs')
+    if aioipfs is not None and isinstance(error, aioipfs.APIError):
+        return getattr(error, 'http_status', None) in _TRANSIENT_STATUSES
+    aiohttp = sys.modules.get('aiohttp')
+    return isinstance(error, OSError) or (aiohttp is not None and isinstance(error, (aiohttp.ClientConnectionError,
+                                                                                    aiohttp.ClientPayloadError)))
+
+
+def _not_found(error: BaseException) -> Optional[IPFSNotFoundError]:
+    """Get the IPFSNotFoundError for an answer of the daemon that content can not be found.
+
+    :param error: The error of a request
+    :type error: BaseException
+    :return: The error to raise instead, or None if the error is about something else
+    :rtype: Optional[IPFSNotFoundError]
+    """
+    if isinstance(error, IPFSNotFoundError) or not _is_application_error(error):
+        return None
+    message = getattr(error, 'message', None) or str(error)
+    return IPFSNotFoundError(message.strip()) if 'not found' in message.lower() else None
+
+
+async def _backoff(what: str, attempt: int) -> None:
+    """Wait before retrying a request, without waiting past the deadline.
+
+    :param what: A description of the operation, for the error message
+    :type what: str
+    :param attempt: The number of the attempt that failed, starting at 0
+    :type attempt: int
+    :raises IPFSTimeoutError: If the deadline passes before the retry
+    """
+    delay = _request_policy.delay(attempt=attempt)
+    expires = _deadline.get()
+    if expires is not None and time.monotonic() + delay >= expires:
+        raise IPFSTimeoutError(f'{what}: the deadline passes before the request can be retried')
+    await asyncio.sleep(delay)
+
+
+async def _call(what: str, request: Callable[[], Awaitable[Any]]) -> Any:
+    """Make a request to the IPFS daemon within the request limits, the timeout and the deadline, with retries.
+
+    :param what: A description of the operation, for the error message
+    :type what: str
+    :param request: A function that makes the request, it is called again for every retry
+    :type request: Callable[[], Awaitable[Any]]
+    :return: The result of the request
+    :rtype: Any
+    :raises IPFSTimeoutError: If the request times out or the deadline passes
+    :raises IPFSNotFoundError: If the daemon answers that the content can not be found
+    """
+    async def attempt_once() -> Any:
+        async with _request_limiter.request():
+            return await request()
+
+    attempt = 0
+    while True:
+        try:
+            return await _timed(what, attempt_once)
+        except IPFSTimeoutError:
+            raise
+        except Exception as e:
+            not_found = _not_found(e)
+            if not_found is not None:
+                raise not_found from e
+            if attempt >= _request_policy.retries or not _is_transient(e):
+                raise
+        await _backoff(what, attempt)
+        attempt += 1
+
+
+# The queue of write-behind mode, set by ipfs_dict_chain.WriteBehind.enable_write_behind()
+_write_behind = None
+
+# The gateways that files are read from instead of the RPC API, set by ipfs_dict_chain.Gateway.use_gateway()
+_gateway = None
+
+# Fetches shared between threads on the synchronous path
+_get_json_flight = SingleFlight()
+
+# Fetches shared between coroutines on the asynchronous path, one table per event loop
+_inflight_fetches = weakref.WeakKeyDictionary()
+_inflight_fetches_lock = threading.Lock()
+
+
+def _client(maddr: Optional['Multiaddr'] = None) -> 'aioipfs.AsyncIPFS':
+    """Create a client for the IPFS daemon.
+
+    The module-level address is read exactly once, so a concurrent connect() can not change the daemon
+    in the middle of an operation. On the event loop of a kept-alive connection to the same daemon, the
+    connection is shared instead.
+
+    :param maddr: The multiaddress of the IPFS daemon, defaults to the connected daemon
+    :type maddr: Optional[Multiaddr], optional
+    :return: The client.
+    :rtype: aioipfs.AsyncIPFS
+    """
+    import aioipfs
+
+    address = maddr if maddr is not None else _multi_address()
+    runner = _keep_alive
+    if runner is not None and address is runner.maddr and _running_loop() is runner.loop:
+        return _SharedClient(runner.client)
+    return aioipfs.AsyncIPFS(maddr=address)
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    """Get the running event loop of the current thread.
+
+    :return: The running event loop, or None
+    :rtype: Optional[asyncio.AbstractEventLoop]
+    """
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _reader(gateway: Optional[Union['GatewayReader', bool]]) -> Optional['GatewayReader']:
+    """Get the gateway reader to read from.
+
+    :param gateway: A GatewayReader, False for the RPC API, or None for the reads selected with use_gateway()
+    :type gateway: Optional[Union[GatewayReader, bool]]
+    :return: The gateway reader, or None to read through the RPC API
+    :rtype: Optional[GatewayReader]
+    """
+    if gateway is None:
+        return _gateway
+    return gateway or None
+
+
+async def _gateway_cat(what: str, gateway: 'GatewayReader', cid: str) -> bytes:
+    """Retrieve the content of a file from gateways, within the request limits, the timeout and the deadline, with
+    retries, like a request to the daemon.
+
+    :param what: A description of the operation, for the error message
+    :type what: str
+    :param gateway: The gateway reader
+    :type gateway: GatewayReader
+    :param cid: The Content Identifier (CID) of the file in IPFS.
+    :type cid: str
+    :return: The verified content of the file.
+    :rtype: bytes
+    """
+    loop = asyncio.get_running_loop()
+
+    # The gateway client blocks, so it runs in the default executor to keep the event loop responsive. The time
+    # left for the attempt is its socket timeout, so a request that timed out does not keep downloading
+    def request() -> Awaitable[bytes]:
+        return loop.run_in_executor(None, functools.partial(gateway.cat, cid, timeout=_timeout(what)))
+
+    return await _call(what, request)
+
+
+async def get_file_content(cid: str, gateway: Optional[Union['GatewayReader', bool]] = None) -> str:
     """Retrieve the content of a file from IPFS by its Content Identifier (CID).
 
     :param cid: The Content Identifier (CID) of the file in IPFS.
     :type cid: str
+    :param gateway: The GatewayReader to read from, False to read through the RPC API, defaults to None for the
+                    reads selected with use_gateway(), see :mod:`ipfs_dict_chain.Gateway`
+    :type gateway: Optional[Union[GatewayReader, bool]], optional
     :return: The content of the file.
     :rtype: str
+    :raises IPFSTimeoutError: If the request times out or the deadline passes
+    :raises IPFSNotFoundError: If the daemon or the gateways answer that the file can not be found
     """
-    client = aioipfs.AsyncIPFS(maddr=multi_address)
+    what = f'Retrieving IPFS hash {cid}'
+    reader = _reader(gateway)
+    if reader is not None:
+        content = await _gateway_cat(what, reader, cid)
+        return content.decode()
+
+    client = _client()
 
-    content = await client.cat(cid)
-    await client.close()
+    try:
+        content = await _call(what, lambda: client.cat(cid))
+    finally:
+        await client.close()
 
     return content.decode()
 
 
-async def _add_json(data: Dict) -> str:
+async def iter_file_content(cid: str, chunk_size: int = STREAM_CHUNK_SIZE,
+                            gateway: Optional[Union['GatewayReader', bool]] = None) -> AsyncIterator[bytes]:
+    """Stream the content of a file from IPFS by its Content Identifier (CID), without buffering the whole file.
+
+    When reading from gateways, see :mod:`ipfs_dict_chain.Gateway`, the file is verified as a whole before the first
+    chunk is returned.
+
+    :param cid: The Content Identifier (CID) of the file in IPFS.
+    :type cid: str
+    :param chunk_size: The maximum size of the chunks, defaults to STREAM_CHUNK_SIZE
+    :type chunk_size: int, optional
+    :param gateway: The GatewayReader to read from, False to read through the RPC API, defaults to None for the
+                    reads selected with use_gateway(), see :mod:`ipfs_dict_chain.Gateway`
+    :type gateway: Optional[Union[GatewayReader, bool]], optional
+    :return: An async iterator over the chunks of the file.
+    :rtype: AsyncIterator[bytes]
+    :raises IPFSTimeoutError: If the response or the next chunk does not arrive in time, or the deadline passes
+    :raises IPFSNotFoundError: If the daemon or the gateways answer that the file can not be found
+    """
+    what = f'Retrieving IPFS hash {cid}'
+    reader = _reader(gateway)
+    if reader is not None:
+        content = await _gateway_cat(what, reader, cid)
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size]
+        return
+
+    client = _client()
+
+    try:
+        attempt = 0
+        while True:
+            received = False
+            try:
+                # The slot is held until the stream is finished or closed
+                async with contextlib.AsyncExitStack() as stack:
+                    request = await _timed(what, lambda: stack.enter_async_context(_request_limiter.request()))
+                    response = await _timed(what, lambda: stack.enter_async_context(
+                        client.session.post(client.core.url('cat'), params={'arg': cid})))
+                    request.responded()
+                    if response.status != 200:
+                        raise _HTTPStatusError(status=response.status, message=await _timed(what, response.text))
+
+                    chunks = response.content.iter_chunked(chunk_size)
+                    while True:
+                        try:
+                            chunk = await _timed(what, chunks.__anext__)
+                        except StopAsyncIteration:
+                            break
+                        received = True
+                        yield chunk
+                return
+            except IPFSTimeoutError:
+                raise
+            except Exception as e:
+                not_found = _not_found(e)
+                if not_found is not None:
+                    raise not_found from e
+                # Once content has been returned, the stream can not be restarted
+                if received or attempt >= _request_policy.retries or not _is_transient(e):
+                    raise
+            await _backoff(what, attempt)
+            attempt += 1
+    finally:
+        await client.close()
+
+
+async def _stream_json(cid: str, keys: Optional[Iterable[str]] = None, gateway: Optional[Union['GatewayReader', bool]] = None) -> Any:
+    """Stream JSON data from IPFS and parse it incrementally into frozen data.
+
+    Top-level members are decoded as they arrive, so the peak memory use is close to the size of the result. With
+    keys, only those members are decoded and the stream is closed as soon as all of them have been found. A
+    compressed payload, see :mod:`ipfs_dict_chain.Compression`, is returned as it is, also when keys are given.
+
+    :param cid: The Content Identifier (CID) of the JSON data in IPFS.
+    :type cid: str
+    :param keys: The top-level keys to extract, defaults to None for the whole document
+    :type keys: Optional[Iterable[str]], optional
+    :param gateway: The GatewayReader to read from, False to read through the RPC API, defaults to None for the
+                    reads selected with use_gateway(), see :mod:`ipfs_dict_chain.Gateway`
+    :type gateway: Optional[Union[GatewayReader, bool]], optional
+    :return: The frozen JSON data, or a FrozenDict of the keys that were found
+    :rtype: Any
+    :raises IPFSError: If the data can not be retrieved or parsed
+    """
+    wanted = set(keys) if keys is not None else None
+    # A compressed payload has a single key, so it is recognized by its first key
+    parser = JSONObjectParser(keys=wanted | {COMPRESSED_KEY} if wanted is not None else None, convert=freeze)
+    chunks = iter_file_content(cid=cid, gateway=gateway)
+
+    try:
+        while not (parser.keys is not None and parser.done):
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            except Exception as e:
+                raise _wrap_error(e, f'Failed to retrieve json data from IPFS hash {cid}')
+
+            try:
+                parser.feed(chunk)
+            except ValueError as e:
+                raise IPFSError(f'Failed to parse json data from IPFS hash {cid}: {e}')
+
+            if wanted is not None and parser.first_key not in (None, COMPRESSED_KEY) and parser.keys != wanted:
+                parser.keys = wanted
+                if COMPRESSED_KEY not in wanted:
+                    parser.result.pop(COMPRESSED_KEY, None)
+    finally:
+        await chunks.aclose()
+
+    if parser.keys is not None and parser.done:
+        return freeze(parser.result)
+
+    try:
+        return freeze(parser.close())
+    except ValueError as e:
+        raise IPFSError(f'Failed to parse json data from IPFS hash {cid}: {e}')
+
+
+async def _add_json(data: Dict, maddr: Optional['Multiaddr'] = None) -> str:
     """Add JSON data to IPFS and return its Content Identifier (CID).
 
+    The data is written through to the cache, so loading it again does not need a round-trip to the daemon.
+
     :param data: The JSON data to be added to IPFS.
     :type data: Dict
+    :param maddr: The multiaddress of the IPFS daemon, defaults to the connected daemon
+    :type maddr: Optional[Multiaddr], optional
     :return: The Content Identifier (CID) of the added JSON data.
     :rtype: str
+    :raises IPFSTimeoutError: If the request times out or the deadline passes
     """
-    client = aioipfs.AsyncIPFS(maddr=multi_address)
+    client = _client(maddr=maddr)
 
     try:
-        response = await client.add_json(data=data)
+        # Adding is idempotent, so a failed request can be retried
+        response = await _call('Adding JSON data to IPFS', lambda: client.add_json(data=data))
     except Exception as e:
-        raise IPFSError(f'Failed to add JSON data to IPFS: {e}')
+        raise _wrap_error(e, 'Failed to add JSON data to IPFS')
     finally:
         await client.close()
 
-    return response.get('Hash', None)
+    cid = response.get('Hash', None)
+    if cid is not None:
+        # Cache the data the way it will be read back, e.g. with tuples as lists and all keys as strings
+        try:
+            ipfs_cache.set(cid, _decompressed(cid=cid, data=json.loads(json.dumps(data))))
+        except IPFSError:
+            # Data that only looks compressed is stored as it is, but fails to load like any other invalid data
+            pass
+
+    return cid
 
 
-async def _get_json(cid: str) -> Dict:
+async def _get_json(cid: str, gateway: Optional[Union['GatewayReader', bool]] = None) -> Dict:
     """Retrieve JSON data from IPFS by its Content Identifier (CID) and cache the result.
 
+    Concurrent requests for the same CID and source on the same event loop share a single fetch. The returned data is
+    the frozen object held by the cache, use :func:`ipfs_dict_chain.FrozenDict.thaw` to get a mutable copy.
+
     :param cid: The Content Identifier (CID) of the JSON data in IPFS.
     :type cid: str
+    :param gateway: The GatewayReader to read from, False to read through the RPC API, defaults to None for the
+                    reads selected with use_gateway(), see :mod:`ipfs_dict_chain.Gateway`
+    :type gateway: Optional[Union[GatewayReader, bool]], optional
     :return: The JSON data retrieved from IPFS.
     :rtype: Dict
     """
-    cached_data = ipfs_cache.get(cid)
-    if cached_data:
+    cached_data = ipfs_cache.get(cid, _MISSING)
+    if cached_data is not _MISSING:
         return cached_data
 
-    try:
-        data = await get_file_content(cid=cid)
-    except Exception as e:
-        raise IPFSError(f'Failed to retrieve json data from IPFS hash {cid}: {e}')
+    cid = normalize_cid(cid)
+    loop = asyncio.get_running_loop()
+    with _inflight_fetches_lock:
+        fetches = _inflight_fetches.setdefault(loop, {})
+        key = cid if gateway is None else (cid, id(gateway) if gateway else False)
+        task = fetches.get(key)
+        if task is None:
+            task = fetches[key] = loop.create_task(_fetch_json(cid=cid, gateway=gateway))
+            task.add_done_callback(lambda _: fetches.pop(key, None))
 
-    try:
-        json_data = json.loads(data)
-    except Exception as e:
-        raise IPFSError(f'Failed to parse json data from IPFS hash {cid}: {e}')
+    # Shield the shared fetch so that one cancelled waiter does not cancel it for the others
+    return await asyncio.shield(task)
+
+
+async def _fetch_json(cid: str, gateway: Optional[Union['GatewayReader', bool]] = None) -> Dict:
+    """Fetch and parse JSON data from IPFS by its Content Identifier (CID) and cache the result.
+
+    The data is streamed and parsed incrementally, instead of holding the raw bytes, the decoded text and the parsed
+    data in memory at the same time.
+
+    :param cid: The Content Identifier (CID) of the JSON data in IPFS.
+    :type cid: str
+    :param gateway: The GatewayReader to read from, False to read through the RPC API, defaults to None for the
+                    reads selected with use_gateway(), see :mod:`ipfs_dict_chain.Gateway`
+    :type gateway: Optional[Union[GatewayReader, bool]], optional
+    :return: The JSON data retrieved from IPFS.
+    :rtype: Dict
+    """
+    json_data = _decompressed(cid=cid, data=await _stream_json(cid=cid, gateway=gateway))
 
     ipfs_cache.set(cid, json_data)
     return json_data
 
 
-def add_json(data: Dict) -> str:
+def _decompressed(cid: str, data: Any) -> Any:
+    """Get the JSON data of a payload retrieved from IPFS, decompressing it if it was stored compressed.
+
+    See :mod:`ipfs_dict_chain.Compression`.
+
+    :param cid: The Content Identifier (CID) of the payload
+    :type cid: str
+    :param data: The payload
+    :type data: Any
+    :return: The frozen JSON data, the payload itself if it is not compressed
+    :rtype: Any
+    :raises IPFSError: If the payload is compressed but can not be decompressed
+    """
+    if not is_compressed(data):
+        return data
+
+    try:
+        return freeze(decompress(data))
+    except Exception as e:
+        raise IPFSError(f'Failed to decompress json data from IPFS hash {cid}: {e}')
+
+
+async def _get_json_keys(cid: str, keys: Iterable[str]) -> Dict:
+    """Retrieve selected top-level keys of JSON data from IPFS by its Content Identifier (CID).
+
+    Cached data is used when available. Otherwise only the selected keys are decoded, the rest of the data is
+    skipped and the download stops as soon as all keys have been found. Partial results are not cached, compressed
+    data is decompressed and cached as a whole.
+
+    :param cid: The Content Identifier (CID) of the JSON data in IPFS.
+    :type cid: str
+    :param keys: The top-level keys to retrieve.
+    :type keys: Iterable[str]
+    :return: The selected keys that are present in the data, as a FrozenDict.
+    :rtype: Dict
+    :raises IPFSError: If the data can not be retrieved or is not a JSON object
+    """
+    keys = set(keys)
+    cached_data = ipfs_cache.get(cid, _MISSING)
+    if cached_data is _MISSING:
+        cid = normalize_cid(cid)
+        result = await _stream_json(cid=cid, keys=keys)
+        if not is_compressed(result):
+            return result
+
+        # A compressed payload has to be decompressed as a whole, so it is cached like a full retrieval
+        cached_data = _decompressed(cid=cid, data=result)
+        ipfs_cache.set(cid, cached_data)
+
+    if not isinstance(cached_data, dict):
+        raise IPFSError(f'Can not retrieve keys from IPFS hash {cid}: data is not a JSON object')
+    return freeze({key: value for key, value in cached_data.items() if key in keys})
+
+
+def add_json(data: Dict, maddr: Optional['Multiaddr'] = None) -> str:
     """Add JSON data to IPFS and return its Content Identifier (CID) using a synchronous wrapper.
 
+    In write-behind mode, see :mod:`ipfs_dict_chain.WriteBehind`, data for the connected daemon is queued and
+    uploaded in the background instead.
+
     :param data: The JSON data to be added to IPFS.
     :type data: Dict
+    :param maddr: The multiaddress of the IPFS daemon, defaults to the connected daemon
+    :type maddr: Optional[Multiaddr], optional
     :return: The Content Identifier (CID) of the added JSON data.
     :rtype: str
     """
-    event_loop = asyncio.new_event_loop()
-    cid = event_loop.run_until_complete(_add_json(data=data))
-    event_loop.close()
-    return cid
+    write_behind = _write_behind
+    if write_behind is not None and maddr is None:
+        return write_behind.submit(data=data)
 
+    return _run(_add_json(data=data, maddr=maddr))
 
-def get_json(cid: str) -> Dict:
+
+def get_json(cid: str, gateway: Optional[Union['GatewayReader', bool]] = None) -> Dict:
     """Retrieve JSON data from IPFS by its Content Identifier (CID) using a synchronous wrapper.
 
+    Concurrent requests for the same CID and source from different threads share a single fetch. The returned data is
+    the frozen object held by the cache, use :func:`ipfs_dict_chain.FrozenDict.thaw` to get a mutable copy. Cached
+    data is returned without a request, whatever the source.
+
     :param cid: The Content Identifier (CID) of the JSON data in IPFS.
     :type cid: str
+    :param gateway: The GatewayReader to read from, False to read through the RPC API, defaults to None for the
+                    reads selected with use_gateway(), see :mod:`ipfs_dict_chain.Gateway`
+    :type gateway: Optional[Union[GatewayReader, bool]], optional
     :return: The JSON data retrieved from IPFS.
     :rtype: Dict
     """
-    cached_data = ipfs_cache.get(cid)
-    if cached_data:
+    cached_data = ipfs_cache.get(cid, _MISSING)
+    if cached_data is not _MISSING:
         return cached_data
 
-    event_loop = asyncio.new_event_loop()
-    json_data = event_loop.run_until_complete(_get_json(cid=cid))
-    event_loop.close()
-    return json_data
+    cid = normalize_cid(cid)
+    key = cid if gateway is None else (cid, id(gateway) if gateway else False)
+    return _get_json_flight.do(key, lambda: _run_get_json(cid=cid, gateway=gateway))
+
+
+def _run_get_json(cid: str, gateway: Optional[Union['GatewayReader', bool]] = None) -> Dict:
+    """Run _get_json for the synchronous wrapper.
+
+    :param cid: The Content Identifier (CID) of the JSON data in IPFS.
+    :type cid: str
+    :param gateway: The GatewayReader to read from, False to read through the RPC API, defaults to None for the
+                    reads selected with use_gateway(), see :mod:`ipfs_dict_chain.Gateway`
+    :type gateway: Optional[Union[GatewayReader, bool]], optional
+    :return: The JSON data retrieved from IPFS.
+    :rtype: Dict
+    """
+    return _run(_get_json(cid=cid, gateway=gateway))
+
+
+def get_json_keys(cid: str, keys: Iterable[str]) -> Dict:
+    """Retrieve selected top-level keys of JSON data from IPFS by its Content Identifier (CID) using a synchronous wrapper.
+
+    :param cid: The Content Identifier (CID) of the JSON data in IPFS.
+    :type cid: str
+    :param keys: The top-level keys to retrieve.
+    :type keys: Iterable[str]
+    :return: The selected keys that are present in the data, as a FrozenDict.
+    :rtype: Dict
+    """
+    return _run(_get_json_keys(cid=cid, keys=keys))
+
+
+async def _get_json_many(cids: List[str], concurrency: int) -> Dict[str, Dict]:
+    """Retrieve JSON data for several Content Identifiers (CIDs) from IPFS concurrently and cache the results.
+
+    :param cids: The normalized Content Identifiers (CIDs) of the JSON data in IPFS.
+    :type cids: List[str]
+    :param concurrency: The maximum number of concurrent fetches.
+    :type concurrency: int
+    :return: The JSON data retrieved from IPFS, by CID.
+    :rtype: Dict[str, Dict]
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(cid: str) -> Dict:
+        async with semaphore:
+            return await _get_json(cid=cid)
+
+    results = await asyncio.gather(*[fetch(cid) for cid in cids])
+    return dict(zip(cids, results))
+
+
+def get_json_many(cids: Iterable[str], concurrency: int = 16) -> Dict[str, Dict]:
+    """Retrieve JSON data for several Content Identifiers (CIDs) from IPFS using a synchronous wrapper.
+
+    Cached data is used when available, and the other CIDs are fetched concurrently in a single batch instead of
+    one after the other. The returned data are the frozen objects held by the cache.
+
+    :param cids: The Content Identifiers (CIDs) of the JSON data in IPFS.
+    :type cids: Iterable[str]
+    :param concurrency: The maximum number of concurrent fetches, defaults to 16
+    :type concurrency: int, optional
+    :return: The JSON data retrieved from IPFS, by normalized CID.
+    :rtype: Dict[str, Dict]
+    """
+    results = {}
+    missing = []
+    for cid in cids:
+        cid = normalize_cid(cid)
+        cached_data = ipfs_cache.get(cid, _MISSING)
+        if cached_data is _MISSING:
+            missing.append(cid)
+        else:
+            results[cid] = cached_data
+
+    if missing:
+        results.update(_run(_get_json_many(cids=list(dict.fromkeys(missing)), concurrency=concurrency)))
+    return results
+
+
+async def _dag_export(cid: str) -> bytes:
+    """Export the DAG of a Content Identifier (CID) from IPFS as CAR (Content Addressable aRchive) data.
+
+    :param cid: The Content Identifier (CID) of the root of the DAG.
+    :type cid: str
+    :return: The CAR data.
+    :rtype: bytes
+    """
+    client = _client()
+
+    try:
+        return await _call(f'Exporting DAG of IPFS hash {cid}', lambda: client.dag.export(normalize_cid(cid)))
+    except Exception as e:
+        raise _wrap_error(e, f'Failed to export DAG of IPFS hash {cid}')
+    finally:
+        await client.close()
+
+
+async def _dag_import(path: str) -> Dict:
+    """Import a CAR (Content Addressable aRchive) file into IPFS.
+
+    The file is streamed to the daemon instead of being read into memory.
+
+    :param path: The path of the CAR file.
+    :type path: str
+    :return: The response of the IPFS daemon.
+    :rtype: Dict
+    """
+    import aiohttp
+
+    client = _client()
+
+    async def request() -> Dict:
+        # Every attempt streams the file from the start
+        with open(path, 'rb') as car_file, aiohttp.MultipartWriter('form-data') as multipart:
+            part = multipart.append(car_file, {'Content-Type': 'application/octet-stream'})
+            part.set_content_disposition('form-data', name='file', filename=os.path.basename(path))
+            async with client.session.post(client.dag.url('dag/import'), data=multipart) as response:
+                if response.status != 200:
+                    raise _HTTPStatusError(status=response.status, message=await response.text())
+                return await response.json(content_type=None)
+
+    try:
+        return await _call(f'Importing CAR file {path}', request)
+    except Exception as e:
+        raise _wrap_error(e, f'Failed to import CAR file {path} into IPFS')
+    finally:
+        await client.close()
+
+
+def dag_export(cid: str) -> bytes:
+    """Export the DAG of a Content Identifier (CID) from IPFS as CAR data using a synchronous wrapper.
+
+    :param cid: The Content Identifier (CID) of the root of the DAG.
+    :type cid: str
+    :return: The CAR data.
+    :rtype: bytes
+    """
+    return _run(_dag_export(cid=cid))
+
+
+def dag_import(path: str) -> Dict:
+    """Import a CAR file into IPFS using a synchronous wrapper.
+
+    :param path: The path of the CAR file.
+    :type path: str
+    :return: The response of the IPFS daemon.
+    :rtype: Dict
+    """
+    return _run(_dag_import(path=path))
@@ -1,26 +1,79 @@
-from typing import Optional, Dict, Any, List, Tuple
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Tuple, Union
 
-from .IPFS import IPFSError, add_json, get_json
+from .IPFS import IPFSError, _wrap_error, add_json, get_json
 from .CID import CID
+from .Chunking import decode_values, encode_values
+from .Compression import Compressor, get_compressor
+from .FrozenDict import FROZEN_TYPES, thaw
+
+if TYPE_CHECKING:
+    from .Index import Index
 
 
 class IPFSDict(Dict):
     """A dictionary-like object that stores its data on IPFS.
 
+    Loaded values are the frozen data held by the IPFS cache, shared with every other reader of the same CID and read
+    without copying. Modifying a loaded dict or list in place raises a TypeError: assign a new value, or call
+    thaw(key) to replace the value with a private mutable copy first.
+
+    With a chunk threshold, string values larger than the threshold are stored as content-defined chunks that are
+    referenced by CID, see :mod:`ipfs_dict_chain.Chunking`, so unchanged parts of large values are not uploaded or
+    cached again. Chunked values are loaded transparently, with or without a threshold.
+
+    With compression, payloads larger than the threshold of the compressor are stored compressed, see
+    :mod:`ipfs_dict_chain.Compression`. Compressed payloads are detected and decompressed transparently on load,
+    with or without compression.
+
+    With an index, see :mod:`ipfs_dict_chain.Index`, the values of the indexed fields are added to the index on every
+    save and load, so dictionaries can be found by value without loading them.
+
     :param cid: The IPFS content identifier (CID) of the dictionary data, defaults to None
     :type cid: Optional[str], optional
+    :param chunk_threshold: The size in bytes above which string values are stored as chunks, defaults to None
+    :type chunk_threshold: Optional[int], optional
+    :param compression: A Compressor or the name of a codec, 'zlib' or 'lzma', defaults to None for no compression
+    :type compression: Optional[Union[str, Compressor]], optional
+    :param index: The index to keep up to date with the saved and loaded data, defaults to None
+    :type index: Optional[Index], optional
     """
 
-    def __init__(self, cid: Optional[str] = None):
+    def __init__(self, cid: Optional[str] = None, chunk_threshold: Optional[int] = None,
+                 compression: Optional[Union[str, Compressor]] = None, index: Optional['Index'] = None):
+        if chunk_threshold is not None and chunk_threshold < 1:
+            raise ValueError(f'chunk_threshold must be at least 1, got {chunk_threshold}')
+
         super().__init__()
+        self._chunk_threshold = chunk_threshold
+        self._compressor = get_compressor(compression=compression)
+        self._index = index
         self._cid = CID(cid).__str__() if cid is not None else None
 
         if self._cid is not None:
             self.load(cid=self._cid)
 
+    def thaw(self, key: str) -> Any:
+        """Get a value to modify it, replacing a shared frozen value with a private mutable copy.
+
+        The copy is made once, later reads of the key return the copy.
+
+        :param key: The key
+        :type key: str
+        :return: The mutable value
+        :rtype: Any
+        :raises AttributeError: If the dictionary has no value for the key
+        """
+        value = getattr(self, key)
+        if type(value) in FROZEN_TYPES:
+            value = thaw(value)
+            self.__setattr__(key, value)
+        return value
+
     def items(self) -> List[Tuple[str, Any]]:
         """Get the dictionary data. This is a list of key-value pairs with all the data except values that start with an underscore.
 
+        Values loaded from IPFS are returned as the shared read-only data of the cache, without copying them.
+
         :return: The dictionary data
         :rtype: List[Tuple[str, Any]]
         """
@@ -40,7 +93,9 @@ class IPFSDict(Dict):
         :return: The new CID
         :rtype: str
         """
-        self._cid = add_json(data=dict(self.items()))
+        previous_cid = self._cid
+        self._cid = add_json(data=self._compress_payload(payload=self._encode_payload(data=dict(self.items()))))
+        self._update_index(replaces=previous_cid)
         return self._cid
 
     def load(self, cid: str) -> None:
@@ -57,17 +112,62 @@ class IPFSDict(Dict):
         try:
             data = get_json(cid=cid)
         except IPFSError as e:
-            raise IPFSError(f'Can not retrieve IPFS data of {cid}: {e}')
+            raise _wrap_error(e, f'Can not retrieve IPFS data of {cid}')
 
         if not isinstance(data, dict):
             raise IPFSError(f'IPFS cid {cid} does not contain a dict!')
 
         self._cid = CID(cid).__str__()
 
-        for key, value in data.items():
+        for key, value in self._decode_payload(data=data).items():
             if key != '_cid':
                 self.__setattr__(key, value)
 
+    def _update_index(self, replaces: Optional[str] = None) -> None:
+        """Add the dictionary data to the index of the dictionary, if it has one.
+
+        :param replaces: The CID of the previous version of the dictionary, defaults to None
+        :type replaces: Optional[str], optional
+        """
+        if self._index is not None:
+            self._index.add(cid=self._cid, data=dict(self.items()), replaces=replaces)
+
+    def _encode_payload(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the payload to store for the dictionary data, with large values replaced by chunk references.
+
+        :param data: The dictionary data
+        :type data: Dict[str, Any]
+        :return: The payload
+        :rtype: Dict[str, Any]
+        """
+        if self._chunk_threshold is None:
+            return data
+        return encode_values(data=data, threshold=self._chunk_threshold)
+
+    def _compress_payload(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the data to add to IPFS for a payload, compressed if the dictionary uses compression.
+
+        :param payload: The payload
+        :type payload: Dict[str, Any]
+        :return: The data to add to IPFS
+        :rtype: Dict[str, Any]
+        """
+        if self._compressor is None:
+            return payload
+        return self._compressor.compress(data=payload)
+
+    def _decode_payload(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the dictionary data stored in a payload loaded from IPFS.
+
+        Subclasses that store their data in another form override this to decode it.
+
+        :param data: The payload loaded from IPFS
+        :type data: Dict[str, Any]
+        :return: The dictionary data
+        :rtype: Dict[str, Any]
+        """
+        return decode_values(data=data)
+
     def __str__(self) -> str:
         """Convert the IPFSDict object to a string representation.
 
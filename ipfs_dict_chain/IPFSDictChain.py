@@ -1,75 +1,338 @@
-from typing import Optional, Dict, Any, List
+import io
+import json
+import os
+import tempfile
+import time
+from collections import deque
+from datetime import datetime
+from typing import TYPE_CHECKING, Optional, Dict, Any, Iterator, List, Tuple, Union, BinaryIO, Callable
 
-from .IPFS import add_json
+from . import IPFS
+from .CAR import CARError, CARReader, CARWriter
+from .Chunking import CHUNKS_KEY, decode_values, is_chunk_reference
+from .CompactState import CompactState, KeyTable
+from .Compression import Compressor, get_compressor
+from .CID import DAG_PB, cid_codec, cid_from_bytes, cid_to_bytes
+from .FrozenDict import thaw
+from .IPFS import IPFSError, _decompressed, add_json, dag_export, dag_import, get_json, get_json_keys, get_json_many, ipfs_cache, normalize_cid
 from .IPFSDict import IPFSDict
+from .UnixFS import UNIXFS_FILE, decode_pbnode, decode_unixfs, encode_file_block, file_cid, read_file
+
+if TYPE_CHECKING:
+    from .Index import Index
+
+
+# The key under which chain metadata is stored in the payload of a state
+CHAIN_METADATA_KEY = '_chain'
+
+# The names of the built-in conflict resolution strategies of IPFSDictChain.merge()
+MERGE_STRATEGIES = ('ours', 'theirs', 'last-writer-wins')
+
+
+class _Missing:
+    """The type of MISSING, which stands for a key that is not present in a state."""
+
+    def __repr__(self) -> str:
+        return 'MISSING'
+
+
+# Passed to and returned from merge callbacks for keys that are not present in a state
+MISSING = _Missing()
+
+
+def diff_states(old_data: Dict[str, Any], new_data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Compute the key-level changes between two states.
+
+    :param old_data: The dictionary data of the old state
+    :type old_data: Dict[str, Any]
+    :param new_data: The dictionary data of the new state
+    :type new_data: Dict[str, Any]
+    :return: A dictionary of changes, with keys as attribute names and values as dictionaries containing the old and
+        new values, without 'old' for added keys and without 'new' for removed keys
+    :rtype: Dict[str, Dict[str, Any]]
+    """
+    changes = {}
+    for key, old_value in old_data.items():
+        if key not in new_data:
+            changes[key] = {'old': old_value}
+        elif old_value != new_data[key]:
+            changes[key] = {'old': old_value, 'new': new_data[key]}
+
+    changes.update({key: {'new': value} for key, value in new_data.items() if key not in old_data})
+    return changes
 
 
 class IPFSDictChain(IPFSDict):
     """A dictionary-like data structure that stores its state on IPFS and keeps track of changes.
 
+    A chain can optionally store metadata with every state: a sequence number and an ancestor shortcut, which make
+    history queries logarithmic instead of linear, and, with a checkpoint interval, delta encoding of the states
+    between full checkpoints. The metadata is stored under the '_chain' key, so it is not part of the dictionary
+    data. Once a chain stores metadata, every later save continues to do so. The same holds for save timestamps,
+    which let at() find the state of the chain at a point in time.
+
     :param cid: The IPFS CID to initialize the dictionary with, defaults to None
     :type cid: Optional[str], optional
+    :param shortcuts: Store sequence numbers and ancestor shortcuts with new states, defaults to False
+    :type shortcuts: bool, optional
+    :param checkpoint_interval: Store a full checkpoint every this many states and deltas in between, defaults to None
+    :type checkpoint_interval: Optional[int], optional
+    :param timestamps: Store the save time with new states, along with sequence numbers and shortcuts, defaults to False
+    :type timestamps: bool, optional
+    :param chunk_threshold: The size in bytes above which string values are stored as chunks, defaults to None
+    :type chunk_threshold: Optional[int], optional
+    :param compression: A Compressor or the name of a codec, 'zlib' or 'lzma', defaults to None for no compression
+    :type compression: Optional[Union[str, Compressor]], optional
+    :param index: The index to keep up to date with the head of the chain, defaults to None
+    :type index: Optional[Index], optional
     """
 
-    def __init__(self, cid: Optional[str] = None):
+    def __init__(self, cid: Optional[str] = None, shortcuts: bool = False, checkpoint_interval: Optional[int] = None,
+                 timestamps: bool = False, chunk_threshold: Optional[int] = None,
+                 compression: Optional[Union[str, Compressor]] = None, index: Optional['Index'] = None):
+        if checkpoint_interval is not None and checkpoint_interval < 1:
+            raise ValueError(f'checkpoint_interval must be at least 1, got {checkpoint_interval}')
+
         self.previous_cid = None
+        self._chain = None
+        self._shortcuts = shortcuts
+        self._checkpoint_interval = checkpoint_interval
+        self._timestamps = timestamps
 
-        super(IPFSDictChain, self).__init__(cid=cid)
+        super(IPFSDictChain, self).__init__(cid=cid, chunk_threshold=chunk_threshold, compression=compression,
+                                            index=index)
 
-    def save(self) -> str:
+    def _decode_payload(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the dictionary data of a state, applying it to its checkpoint if it is delta encoded.
+
+        :param data: The payload loaded from IPFS
+        :type data: Dict[str, Any]
+        :return: The dictionary data
+        :rtype: Dict[str, Any]
+        """
+        metadata = data.get(CHAIN_METADATA_KEY)
+        self._chain = thaw(metadata) if metadata is not None else None
+        if self._chain is not None and self._checkpoint_interval is None:
+            self._checkpoint_interval = self._chain.get('interval')
+
+        return decode_values(data=_materialize(data))
+
+    def save(self, timestamp: Optional[Union[float, datetime]] = None) -> str:
         """Saves the current state of the dictionary to IPFS and returns the new CID.
 
+        The save time is stored with the new state if the chain was created with timestamps=True, if the current
+        state has a save time, or if a timestamp is given.
+
+        :param timestamp: The save time to store, as seconds since the epoch or a datetime, defaults to None for now
+        :type timestamp: Optional[Union[float, datetime]], optional
         :return: The new IPFS CID
         :rtype: str
+        :raises ValueError: If the timestamp is earlier than the save time of the current state
         """
+        return self._save(timestamp=timestamp)
+
+    def _save(self, merge_cid: Optional[str] = None, timestamp: Optional[Union[float, datetime]] = None) -> str:
+        """Saves the current state of the dictionary to IPFS, optionally as a merge with a second parent.
+
+        :param merge_cid: The CID of the second parent of a merge, defaults to None
+        :type merge_cid: Optional[str], optional
+        :param timestamp: The save time to store, defaults to None for now if the chain stores save times
+        :type timestamp: Optional[Union[float, datetime]], optional
+        :return: The new IPFS CID
+        :rtype: str
+        """
+        save_time = self._save_time(timestamp=timestamp)
+
         self.previous_cid = self._cid
-        self._cid = add_json(data=dict(self.items()))
+        if merge_cid is None and save_time is None and self._chain is None and not self._shortcuts and self._checkpoint_interval is None:
+            self._cid = add_json(data=self._compress_payload(payload=self._encode_payload(data=dict(self.items()))))
+        else:
+            payload = _encode_state(state=self._encode_payload(data=dict(self.items())), previous_cid=self.previous_cid,
+                                    checkpoint_interval=self._checkpoint_interval, merge_cid=merge_cid,
+                                    save_time=save_time)
+            self._chain = thaw(payload[CHAIN_METADATA_KEY])
+            self._cid = add_json(data=self._compress_payload(payload=payload))
+        self._update_index(replaces=self.previous_cid)
         return self._cid
 
+    def _save_time(self, timestamp: Optional[Union[float, datetime]]) -> Optional[float]:
+        """Get the save time to store with the next state.
+
+        Save times never decrease along a chain, so at() can search them: an explicit timestamp must not be earlier
+        than the save time of the current state, and the current time is clamped to it, e.g. after a clock change.
+
+        :param timestamp: The save time given to save(), or None
+        :type timestamp: Optional[Union[float, datetime]]
+        :return: The save time, or None if the chain does not store save times
+        :rtype: Optional[float]
+        :raises ValueError: If the timestamp is earlier than the save time of the current state
+        """
+        previous_time = (self._chain or {}).get('time')
+        if timestamp is not None:
+            save_time = _seconds(timestamp)
+            if previous_time is not None and save_time < previous_time:
+                raise ValueError(f'Timestamp {save_time} is earlier than the save time {previous_time} of the current state')
+            return save_time
+
+        if self._timestamps or previous_time is not None:
+            return max(time.time(), previous_time or 0)
+        return None
+
+    def at(self, timestamp: Optional[Union[float, datetime]] = None, depth: Optional[int] = None) -> Optional['IPFSDictChain']:
+        """Loads the state of the chain at a point in time, or a number of states back from the current state.
+
+        With a timestamp, the newest state saved at or before that time is found, where states saved without a save
+        time count as older than any timestamp. Both searches jump back along the ancestor shortcuts, so only a
+        logarithmic number of states is fetched for chains that store them. The previous states of merges are
+        followed, not the merged heads.
+
+        :param timestamp: The point in time, as seconds since the epoch or a datetime, defaults to None
+        :type timestamp: Optional[Union[float, datetime]], optional
+        :param depth: The number of states back from the current state, 0 for the current state, defaults to None
+        :type depth: Optional[int], optional
+        :return: A new IPFSDictChain loaded at the state, or None if the chain has no state that old
+        :rtype: Optional[IPFSDictChain]
+        :raises ValueError: If not exactly one of timestamp and depth is given, or the depth is negative
+        :raises IPFSError: If the current state has not been saved
+        """
+        if (timestamp is None) == (depth is None):
+            raise ValueError('Expected exactly one of timestamp and depth')
+        if depth is not None and depth < 0:
+            raise ValueError(f'depth must be at least 0, got {depth}')
+        if self._cid is None:
+            raise IPFSError('Can not query the history of an IPFSDictChain that has not been saved')
+
+        if depth is not None:
+            seq = _sequence_number(cid=self._cid) - depth
+            cid = _ancestor(cid=self._cid, seq=seq) if seq >= 0 else None
+        else:
+            cid = _ancestor_at_time(cid=self._cid, timestamp=_seconds(timestamp))
+
+        if cid is None:
+            return None
+        return IPFSDictChain(cid=cid)
+
     def changes(self) -> Dict[str, Dict[str, Any]]:
         """Returns a dictionary containing the changes between the current state and the previous state.
 
+        Keys that were removed only have an 'old' value and keys that were added only have a 'new' value.
+
         :return: A dictionary of changes, with keys as attribute names and values as dictionaries containing the old and new values
         :rtype: Dict[str, Dict[str, Any]]
         """
-        if self.previous_cid is not None:
-            old_data = dict(IPFSDictChain(cid=self.previous_cid).items())
+        new_data = dict(self.items())
+        old_data = dict(IPFSDictChain(cid=self.previous_cid).items()) if self.previous_cid is not None else {}
 
-            changes = {
-                key: {'old': old_data[key], 'new': self.__getattribute__(key)}
-                for key in old_data
-                if old_data[key] != self.__getattribute__(key)
-            }
+        return diff_states(old_data=old_data, new_data=new_data)
 
-            changes.update(
-                {
-                    key: {'new': self.__getattribute__(key)}
-                    for key in dict(self.items())
-                    if key not in old_data
-                }
-            )
+    def merge(self, other_cid: str, strategy: Union[str, Callable[[str, Any, Any, Any], Any]] = 'ours') -> str:
+        """Merges another head of the chain into the current state and saves the result.
 
-        else:
-            changes = {key: {'new': self.__getattribute__(key)} for key in dict(self.items())}
+        The key-level changes from the common ancestor to the current state and to the other head are combined. Keys
+        changed on one side only take that change, and keys changed differently on both sides are resolved with the
+        strategy:
+
+        - 'ours': keep the value of the current state
+        - 'theirs': take the value of the other head
+        - 'last-writer-wins': take the value of the head that was saved last, or of the head with the most states
+          since the common ancestor if the heads do not store save times
+        - a callable, called with the key and the ancestor, our and their values, returning the merged value.
+          Missing values are passed as MISSING, and returning MISSING removes the key.
+
+        The merged state records the current state as its previous state and the other head as its second parent.
+        If the other head is already in the history of the current state nothing is saved, and if the current state
+        is in the history of the other head, the chain is fast-forwarded to the other head.
+
+        :param other_cid: The CID of the head to merge
+        :type other_cid: str
+        :param strategy: The conflict resolution strategy, defaults to 'ours'
+        :type strategy: Union[str, Callable[[str, Any, Any, Any], Any]], optional
+        :return: The CID of the merged state
+        :rtype: str
+        :raises ValueError: If the strategy is unknown
+        :raises IPFSError: If the current state has not been saved
+        """
+        if not callable(strategy) and strategy not in MERGE_STRATEGIES:
+            raise ValueError(f'Unknown merge strategy {strategy!r}, expected one of {MERGE_STRATEGIES} or a callable')
+        if self._cid is None:
+            raise IPFSError('Can not merge into an IPFSDictChain that has not been saved')
+
+        our_cid, their_cid = normalize_cid(self._cid), normalize_cid(other_cid)
+        ancestor_cid = IPFSDictChain.common_ancestor(our_cid, their_cid)
+        if ancestor_cid == their_cid:
+            return self._cid
+        if ancestor_cid == our_cid:
+            for key, _ in self.items():
+                delattr(self, key)
+            self.load(cid=their_cid)
+            return self._cid
+
+        base = _load_state(cid=ancestor_cid) if ancestor_cid is not None else {}
+        ours = dict(self.items())
+        theirs = _load_state(cid=their_cid)
+        for data in (base, ours, theirs):
+            data.pop('previous_cid', None)
+
+        our_changes = diff_states(old_data=base, new_data=ours)
+        their_changes = diff_states(old_data=base, new_data=theirs)
+
+        if strategy == 'last-writer-wins':
+            ours_last = _write_order(cid=our_cid, ancestor_cid=ancestor_cid) >= _write_order(cid=their_cid, ancestor_cid=ancestor_cid)
+            strategy = 'ours' if ours_last else 'theirs'
+
+        for key, change in their_changes.items():
+            their_value = change.get('new', MISSING)
+            if key not in our_changes:
+                value = their_value
+            else:
+                our_value = our_changes[key].get('new', MISSING)
+                if our_value == their_value or strategy == 'ours':
+                    continue
+                elif strategy == 'theirs':
+                    value = their_value
+                else:
+                    value = strategy(key, base.get(key, MISSING), our_value, their_value)
 
-        return changes
+            if value is MISSING:
+                try:
+                    delattr(self, key)
+                except AttributeError:
+                    pass
+            else:
+                self.__setattr__(key, value)
 
-    def get_previous_states(self, max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._save(merge_cid=their_cid)
+
+    def get_previous_states(self, max_depth: Optional[int] = None, compact: bool = False) -> List[Dict[str, Any]]:
         """Returns a list of previous states as dictionaries.
 
+        In compact mode the states are returned as read-only CompactState mappings, for loading many versions at once:
+        the versions share one key table, values that did not change between adjacent versions are shared, and states
+        that were not cached are not added to the cache.
+
         :param max_depth: The maximum number of previous states to return, defaults to None
         :type max_depth: Optional[int], optional
+        :param compact: Return memory-compact CompactState mappings instead of dictionaries, defaults to False
+        :type compact: bool, optional
         :return: A list of previous state dictionaries
         :rtype: List[Dict[str, Any]]
         """
         previous_states = []
+        key_table = KeyTable() if compact else None
         current_cid = self.previous_cid
         depth = 0
 
         while current_cid is not None and (max_depth is None or depth < max_depth):
-            previous_state = IPFSDictChain(cid=current_cid)
-            previous_states.append(dict(previous_state.items()))
-            current_cid = previous_state.previous_cid
+            if compact:
+                was_cached = current_cid in ipfs_cache
+                previous_state = CompactState.from_dict(data=_load_state(cid=current_cid), key_table=key_table,
+                                                        adjacent=previous_states[-1] if previous_states else None)
+                if not was_cached:
+                    ipfs_cache.delete(current_cid)
+            else:
+                previous_state = _load_state(cid=current_cid)
+            previous_states.append(previous_state)
+            current_cid = previous_state.get('previous_cid')
             depth += 1
 
         return previous_states
@@ -93,3 +356,947 @@ class IPFSDictChain(IPFSDict):
             depth += 1
 
         return previous_cids
+
+    def key_history(self, key: str, max_depth: Optional[int] = None) -> Iterator[Tuple[str, Any]]:
+        """Yields the values a key has taken, newest first, with the CID of the state where it took each value.
+
+        The history is walked one state at a time, but only the key, the previous_cid and the chain metadata of each
+        state are decoded, and states that are not cached are not added to the cache. Delta encoded states that do
+        not contain the key take its value from their checkpoint, which is fetched once per checkpoint.
+
+        A value of MISSING means the key was removed at that state. The state where the key was first added is the
+        last one yielded, or, with a max_depth, the oldest state that was looked at.
+
+        :param key: The key
+        :type key: str
+        :param max_depth: The maximum number of previous states to look at, defaults to None
+        :type max_depth: Optional[int], optional
+        :return: An iterator of (CID, value) tuples, one for every change of the value
+        :rtype: Iterator[Tuple[str, Any]]
+        :raises IPFSError: If the current state has not been saved
+        """
+        if self._cid is None:
+            raise IPFSError('Can not query the history of an IPFSDictChain that has not been saved')
+
+        run_cid, run_value = None, MISSING
+        base = None
+        current_cid = normalize_cid(self._cid)
+        depth = 0
+
+        while current_cid is not None and (max_depth is None or depth <= max_depth):
+            data = get_json_keys(cid=current_cid, keys=(key, 'previous_cid', CHAIN_METADATA_KEY))
+            metadata = _metadata(data) or {}
+            if key in data:
+                value = data[key]
+            elif metadata.get('base') is not None and key not in metadata.get('deleted', ()):
+                if base is None or base[0] != metadata['base']:
+                    base = (metadata['base'], get_json_keys(cid=metadata['base'], keys=(key,)).get(key, MISSING))
+                value = base[1]
+            else:
+                value = MISSING
+
+            if run_cid is not None and value != run_value:
+                yield run_cid, _decode_value(key=key, value=run_value)
+            run_cid, run_value = current_cid, value
+
+            previous_cid = data.get('previous_cid')
+            current_cid = normalize_cid(previous_cid) if previous_cid is not None else None
+            depth += 1
+
+        # Before it was first added, the key was not removed but never set
+        if run_cid is not None and (run_value is not MISSING or current_cid is not None):
+            yield run_cid, _decode_value(key=key, value=run_value)
+
+    def export_car(self, path_or_stream: Union[str, os.PathLike, BinaryIO], max_depth: Optional[int] = None) -> List[str]:
+        """Exports the current state and its history to a CAR (Content Addressable aRchive).
+
+        Versions are written one at a time, so memory use does not depend on the length of the chain. Versions in the
+        cache are encoded locally, others are exported from the IPFS daemon. Both parents of merges are followed, so
+        the merged branches are exported too. The chunks of chunked values, and the checkpoint of every exported delta
+        encoded state, are exported with the state, also when the checkpoint is older than max_depth, so every
+        exported state can be loaded from the archive.
+
+        :param path_or_stream: The path of the CAR file to write, or a binary stream
+        :type path_or_stream: Union[str, os.PathLike, BinaryIO]
+        :param max_depth: The maximum number of states to go back from the current state, along either parent of a
+                          merge, defaults to None
+        :type max_depth: Optional[int], optional
+        :return: The CIDs of the exported states, breadth first from the current state
+        :rtype: List[str]
+        :raises IPFSError: If the current state has not been saved or a state can not be exported
+        """
+        if self._cid is None:
+            raise IPFSError('Can not export an IPFSDictChain that has not been saved')
+
+        if isinstance(path_or_stream, (str, os.PathLike)):
+            with open(path_or_stream, 'wb') as stream:
+                return self.export_car(path_or_stream=stream, max_depth=max_depth)
+
+        writer = CARWriter(stream=path_or_stream, roots=[cid_to_bytes(self._cid)])
+        return self._write_car(writer=writer, max_depth=max_depth)
+
+    def _write_car(self, writer: CARWriter, max_depth: Optional[int]) -> List[str]:
+        """Write the blocks of the current state and its history to a CAR.
+
+        Subclasses that link to other data by CID override this to write that data too.
+
+        :param writer: The writer of the archive
+        :type writer: CARWriter
+        :param max_depth: The maximum number of states to go back from the current state
+        :type max_depth: Optional[int]
+        :return: The CIDs of the exported states, breadth first from the current state
+        :rtype: List[str]
+        """
+        return _write_history(writer=writer, cid=self._cid, max_depth=max_depth, written=set())
+
+    @classmethod
+    def import_car(cls, path_or_stream: Union[str, os.PathLike, BinaryIO]) -> 'IPFSDictChain':
+        """Imports a chain from a CAR (Content Addressable aRchive) created with export_car().
+
+        Every block is verified against its CID before anything is imported, and the states in the archive are added
+        to the cache, so the returned chain and its history can be loaded without fetching them again.
+
+        :param path_or_stream: The path of the CAR file to read, or a binary stream
+        :type path_or_stream: Union[str, os.PathLike, BinaryIO]
+        :return: The imported chain, loaded at its newest state
+        :rtype: IPFSDictChain
+        :raises CARError: If the archive is invalid or a block does not match its CID
+        :raises IPFSError: If the archive can not be imported into IPFS
+        """
+        return cls(cid=_import_car(path_or_stream=path_or_stream))
+
+    @classmethod
+    def compact(cls, cid: str, checkpoint_interval: Optional[int] = None, max_depth: Optional[int] = None,
+                progress_path: Optional[Union[str, os.PathLike]] = None,
+                compression: Optional[Union[str, Compressor]] = None) -> Dict[str, str]:
+        """Rewrites the chain ending at the given CID into an equivalent chain with ancestor shortcuts.
+
+        Every state of the new chain has the same dictionary data as the corresponding old state, but links to the
+        new chain, and stores a sequence number and an ancestor shortcut, and the save time of the old state if it has
+        one. With a checkpoint interval, the states between checkpoints are stored as deltas. With a max_depth, older
+        history is pruned.
+
+        The history is walked once from the head and spooled to a temporary file, then rewritten oldest first, so only
+        one state, the checkpoint it is based on and the chain metadata of the new states are held in memory at a
+        time. The old states are not left in the cache unless they were cached before, and the new states are not left in
+        it outside write-behind mode. With a progress_path, the mapping from old to new CIDs is appended to
+        that file after every state, and a later call with the same file resumes where the previous one stopped,
+        e.g. after an interruption or when the old chain has grown since.
+
+        :param cid: The CID of the head of the chain to compact
+        :type cid: str
+        :param checkpoint_interval: Store a full checkpoint every this many states and deltas in between, defaults to None
+        :type checkpoint_interval: Optional[int], optional
+        :param max_depth: The maximum number of previous states to keep, defaults to None
+        :type max_depth: Optional[int], optional
+        :param progress_path: The path of a file to record and resume progress, defaults to None
+        :type progress_path: Optional[Union[str, os.PathLike]], optional
+        :param compression: A Compressor or the name of a codec to store the new states compressed, defaults to None
+        :type compression: Optional[Union[str, Compressor]], optional
+        :return: A mapping of old CIDs to new CIDs, the new head is the value for the old head
+        :rtype: Dict[str, str]
+        """
+        if checkpoint_interval is not None and checkpoint_interval < 1:
+            raise ValueError(f'checkpoint_interval must be at least 1, got {checkpoint_interval}')
+
+        compressor = get_compressor(compression=compression)
+        mapping = {}
+        if progress_path is not None and os.path.exists(progress_path):
+            with open(progress_path, 'r') as progress_file:
+                for line in progress_file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        mapping[entry['old']] = entry['new']
+
+        with tempfile.TemporaryFile() as spool:
+            # Walk back from the head until the start of the chain, the pruning depth or a state rewritten before
+            offsets = []
+            old_checkpoints = {}
+            current_cid = normalize_cid(cid)
+            while current_cid not in mapping and (max_depth is None or len(offsets) <= max_depth):
+                payload = _load_uncached(cid=current_cid)
+                state = _materialize(payload, load=lambda base_cid: _load_checkpoint(base_cid, old_checkpoints))
+                save_time = (_metadata(payload) or {}).get('time')
+
+                offsets.append(spool.tell())
+                spool.write(json.dumps([current_cid, state, save_time]).encode() + b'\n')
+
+                current_cid = state.get('previous_cid')
+                if current_cid is None:
+                    break
+                current_cid = normalize_cid(current_cid)
+
+            new_previous_cid = mapping.get(current_cid) if current_cid is not None else None
+
+            # The new states are looked up by the chain metadata kept here instead of through the cache, only the
+            # checkpoint of the next delta is kept whole. States written by a previous call are fetched as needed.
+            new_states = {}
+            new_checkpoints = {}
+            earlier_states = {}
+
+            def load_new(new_cid: str) -> Dict[str, Any]:
+                new_cid = normalize_cid(new_cid)
+                if new_cid in new_checkpoints:
+                    return new_checkpoints[new_cid]
+                if new_cid in new_states:
+                    return new_states[new_cid]
+                return _load_checkpoint(new_cid, earlier_states)
+
+            progress_file = open(progress_path, 'a') if progress_path is not None else None
+            try:
+                for offset in reversed(offsets):
+                    spool.seek(offset)
+                    old_cid, state, save_time = json.loads(spool.readline())
+                    state['previous_cid'] = new_previous_cid
+
+                    payload = _encode_state(state=state, previous_cid=new_previous_cid,
+                                            checkpoint_interval=checkpoint_interval, save_time=save_time, load=load_new)
+                    stored = compressor.compress(data=payload) if compressor is not None else payload
+                    new_cid = add_json(data=stored)
+                    # In write-behind mode the cache holds the state until it is uploaded
+                    if IPFS._write_behind is None:
+                        ipfs_cache.delete(new_cid)
+
+                    metadata = _metadata(payload)
+                    new_states[new_cid] = {'previous_cid': new_previous_cid, CHAIN_METADATA_KEY: metadata}
+                    if checkpoint_interval is not None and metadata.get('base') is None:
+                        new_checkpoints.clear()
+                        new_checkpoints[new_cid] = payload
+                    new_previous_cid = new_cid
+                    mapping[old_cid] = new_previous_cid
+
+                    if progress_file is not None:
+                        progress_file.write(json.dumps({'old': old_cid, 'new': new_previous_cid}) + '\n')
+                        progress_file.flush()
+            finally:
+                if progress_file is not None:
+                    progress_file.close()
+
+        return mapping
+
+    @staticmethod
+    def diff(cid_a: str, cid_b: str) -> Dict[str, Dict[str, Any]]:
+        """Computes the key-level changes between any two states, e.g. two versions of the same chain.
+
+        Both states, and the checkpoints of delta encoded states, are fetched in a single batch and compared locally.
+        The previous_cid is left out, as it differs between any two states.
+
+        :param cid_a: The CID of the old state
+        :type cid_a: str
+        :param cid_b: The CID of the new state
+        :type cid_b: str
+        :return: A dictionary of changes, with keys as attribute names and values as dictionaries containing the old
+            and new values, without 'old' for added keys and without 'new' for removed keys
+        :rtype: Dict[str, Dict[str, Any]]
+        """
+        old_data, new_data = _load_states(cids=[cid_a, cid_b])
+        return thaw(diff_states(old_data=old_data, new_data=new_data))
+
+    @staticmethod
+    def changelog(from_cid: Optional[str], to_cid: str, batch_size: int = 64) -> Iterator[Tuple[str, Dict[str, Dict[str, Any]]]]:
+        """Yields the changes made by every state in a range of the chain, oldest first.
+
+        The range is found by walking back from to_cid, which fetches every state once, and the fetched states are
+        kept for the comparison. The checkpoints of delta encoded states are then fetched in concurrent batches, and
+        every state is compared with the one before it locally. Merged heads are not part of the range, a merge is
+        reported as the changes it made.
+
+        :param from_cid: The CID of the state before the range, or None to start at the beginning of the chain
+        :type from_cid: Optional[str]
+        :param to_cid: The CID of the last state of the range
+        :type to_cid: str
+        :param batch_size: The number of states whose checkpoints are fetched per batch, defaults to 64
+        :type batch_size: int, optional
+        :return: An iterator of (CID, changes) tuples, with changes as returned by diff()
+        :rtype: Iterator[Tuple[str, Dict[str, Dict[str, Any]]]]
+        :raises IPFSError: If from_cid is not in the history of to_cid
+        """
+        if batch_size < 1:
+            raise ValueError(f'batch_size must be at least 1, got {batch_size}')
+
+        target_cid = normalize_cid(from_cid) if from_cid is not None else None
+        cids, payloads = [], []
+        current_cid = normalize_cid(to_cid)
+        while current_cid != target_cid:
+            if current_cid is None:
+                raise IPFSError(f'State {from_cid} is not in the history of {to_cid}')
+            payload = _load_payload(cid=current_cid)
+            cids.append(current_cid)
+            payloads.append(payload)
+            previous_cid = payload.get('previous_cid')
+            current_cid = normalize_cid(previous_cid) if previous_cid is not None else None
+        cids.reverse()
+        payloads.reverse()
+
+        previous_state = _load_states(cids=[target_cid])[0] if target_cid is not None else {}
+        for start in range(0, len(cids), batch_size):
+            batch = cids[start:start + batch_size]
+            for cid, state in zip(batch, _decode_states(payloads=payloads[start:start + batch_size])):
+                yield cid, thaw(diff_states(old_data=previous_state, new_data=state))
+                previous_state = state
+
+    @staticmethod
+    def common_ancestor(cid_a: str, cid_b: str) -> Optional[str]:
+        """Finds the newest state that is in the history of both given states, e.g. to detect and resolve a fork.
+
+        Both histories are walked back alternately and the walk stops as soon as they meet, so the cost depends on
+        how far the states have diverged rather than on the length of the chain. When both states store ancestor
+        shortcuts and have no merges in their history, the newer one first jumps back to the sequence number of the
+        older one. Otherwise both parents of merged states are followed.
+
+        :param cid_a: The CID of the first state
+        :type cid_a: str
+        :param cid_b: The CID of the second state
+        :type cid_b: str
+        :return: The CID of the common ancestor, one of the given CIDs if it is an ancestor of the other, or None if
+            the states do not share any history
+        :rtype: Optional[str]
+        """
+        cid_a, cid_b = normalize_cid(cid_a), normalize_cid(cid_b)
+        if cid_a == cid_b:
+            return cid_a
+
+        metadata_a, metadata_b = _metadata(_load_payload(cid=cid_a)), _metadata(_load_payload(cid=cid_b))
+        if metadata_a is not None and metadata_b is not None and not metadata_a.get('merges') and not metadata_b.get('merges'):
+            return _common_ancestor_with_shortcuts(cid_a=cid_a, seq_a=metadata_a['seq'], cid_b=cid_b, seq_b=metadata_b['seq'])
+
+        return _common_ancestor_by_walking(cid_a=cid_a, cid_b=cid_b)
+
+
+def _skip_height(seq: int) -> int:
+    """Get the sequence number of the ancestor a state with the given sequence number keeps a shortcut to.
+
+    This is the deterministic skip list also used by Bitcoin Core, which reaches any ancestor in a logarithmic number of steps.
+
+    :param seq: The sequence number of the state
+    :type seq: int
+    :return: The sequence number of the ancestor
+    :rtype: int
+    """
+    if seq < 2:
+        return 0
+
+    def invert_lowest_one(n: int) -> int:
+        return n & (n - 1)
+
+    if seq & 1:
+        return invert_lowest_one(invert_lowest_one(seq - 1)) + 1
+    return invert_lowest_one(seq)
+
+
+def _seconds(timestamp: Union[float, datetime]) -> float:
+    """Convert a timestamp to seconds since the epoch.
+
+    :param timestamp: The timestamp, as seconds since the epoch or a datetime
+    :type timestamp: Union[float, datetime]
+    :return: The number of seconds since the epoch
+    :rtype: float
+    """
+    if isinstance(timestamp, datetime):
+        return timestamp.timestamp()
+    return float(timestamp)
+
+
+def _metadata(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Get the chain metadata stored in the payload of a state.
+
+    :param data: The payload of the state
+    :type data: Dict[str, Any]
+    :return: The chain metadata, or None if the state has no metadata
+    :rtype: Optional[Dict[str, Any]]
+    """
+    return data.get(CHAIN_METADATA_KEY)
+
+
+def _load_payload(cid: str) -> Dict[str, Any]:
+    """Load the payload of a state.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :return: The payload, shared with the cache
+    :rtype: Dict[str, Any]
+    """
+    data = get_json(cid=cid)
+    if not isinstance(data, dict):
+        raise IPFSError(f'IPFS cid {cid} does not contain a dict!')
+    return data
+
+
+def _load_uncached(cid: str) -> Dict[str, Any]:
+    """Load the payload of a state without leaving it in the cache, unless it was cached before.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :return: The payload
+    :rtype: Dict[str, Any]
+    """
+    was_cached = cid in ipfs_cache
+    payload = _load_payload(cid=cid)
+    if not was_cached:
+        ipfs_cache.delete(cid)
+    return payload
+
+
+def _load_checkpoint(cid: str, checkpoints: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Load the payload of a checkpoint without leaving it in the cache, keeping only the last one loaded.
+
+    Consecutive delta encoded states share their checkpoint, so it is fetched once for all of them.
+
+    :param cid: The CID of the checkpoint
+    :type cid: str
+    :param checkpoints: The last checkpoint loaded, by CID, updated in place
+    :type checkpoints: Dict[str, Dict[str, Any]]
+    :return: The payload
+    :rtype: Dict[str, Any]
+    """
+    cid = normalize_cid(cid)
+    if cid not in checkpoints:
+        checkpoints.clear()
+        checkpoints[cid] = _load_uncached(cid=cid)
+    return checkpoints[cid]
+
+
+def _materialize(data: Dict[str, Any], load: Callable[[str], Dict[str, Any]] = _load_payload) -> Dict[str, Any]:
+    """Get the dictionary data of a state from its payload, applying delta encoded states to their checkpoint.
+
+    :param data: The payload of the state
+    :type data: Dict[str, Any]
+    :param load: The function that loads the payload of a state, defaults to _load_payload
+    :type load: Callable[[str], Dict[str, Any]], optional
+    :return: The dictionary data, without the chain metadata
+    :rtype: Dict[str, Any]
+    """
+    metadata = _metadata(data)
+    if metadata is None:
+        return dict(data)
+
+    if metadata.get('base') is None:
+        return {key: value for key, value in data.items() if key != CHAIN_METADATA_KEY}
+
+    deleted = set(metadata.get('deleted', []))
+    base = load(metadata['base'])
+    state = {key: data.get(key, value) for key, value in base.items() if key != CHAIN_METADATA_KEY and key not in deleted}
+    state.update({key: value for key, value in data.items() if key != CHAIN_METADATA_KEY})
+    return state
+
+
+def _load_state(cid: str) -> Dict[str, Any]:
+    """Load the dictionary data of a state, with chunked values joined.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :return: The dictionary data, without the chain metadata
+    :rtype: Dict[str, Any]
+    """
+    return decode_values(data=_materialize(_load_payload(cid=cid)))
+
+
+def _decode_value(key: str, value: Any) -> Any:
+    """Get a mutable copy of a value as stored in a payload, joining it if it is chunked.
+
+    :param key: The key of the value
+    :type key: str
+    :param value: The stored value
+    :type value: Any
+    :return: The value
+    :rtype: Any
+    """
+    if is_chunk_reference(value):
+        value = decode_values(data={key: value})[key]
+    return thaw(value)
+
+
+def _load_states(cids: List[str]) -> List[Dict[str, Any]]:
+    """Load the dictionary data of several states, fetching the states and then their checkpoints in a batch.
+
+    :param cids: The CIDs of the states
+    :type cids: List[str]
+    :return: The dictionary data of each state, without the previous_cid and the chain metadata
+    :rtype: List[Dict[str, Any]]
+    """
+    fetched = get_json_many(cids=cids)
+    payloads = [fetched[normalize_cid(cid)] for cid in cids]
+    for cid, payload in zip(cids, payloads):
+        if not isinstance(payload, dict):
+            raise IPFSError(f'IPFS cid {cid} does not contain a dict!')
+    return _decode_states(payloads=payloads)
+
+
+def _decode_states(payloads: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Get the dictionary data of several states from their payloads, fetching their checkpoints in a batch.
+
+    :param payloads: The payloads of the states
+    :type payloads: List[Dict[str, Any]]
+    :return: The dictionary data of each state, without the previous_cid and the chain metadata
+    :rtype: List[Dict[str, Any]]
+    """
+    base_cids = [(_metadata(payload) or {}).get('base') for payload in payloads]
+    get_json_many(cids=[base_cid for base_cid in base_cids if base_cid is not None])
+
+    states = []
+    for payload in payloads:
+        state = decode_values(data=_materialize(payload))
+        state.pop('previous_cid', None)
+        states.append(state)
+    return states
+
+
+def _sequence_number(cid: str, load: Callable[[str], Dict[str, Any]] = _load_payload) -> int:
+    """Get the sequence number of a state, i.e. the number of states before it in the chain.
+
+    States without metadata are counted by walking back to the first state with metadata or the start of the chain.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :param load: The function that loads the payload of a state, defaults to _load_payload
+    :type load: Callable[[str], Dict[str, Any]], optional
+    :return: The sequence number
+    :rtype: int
+    """
+    steps = 0
+    current_cid = cid
+    while True:
+        data = load(current_cid)
+        metadata = _metadata(data)
+        if metadata is not None:
+            return metadata['seq'] + steps
+        if data.get('previous_cid') is None:
+            return steps
+        current_cid = data['previous_cid']
+        steps += 1
+
+
+def _ancestor(cid: str, seq: int, load: Callable[[str], Dict[str, Any]] = _load_payload) -> str:
+    """Get the CID of the ancestor of a state with the given sequence number, following ancestor shortcuts.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :param seq: The sequence number of the ancestor
+    :type seq: int
+    :param load: The function that loads the payload of a state, defaults to _load_payload
+    :type load: Callable[[str], Dict[str, Any]], optional
+    :return: The CID of the ancestor
+    :rtype: str
+    """
+    current_cid = cid
+    data = load(current_cid)
+    height = _sequence_number(cid=current_cid, load=load)
+    if seq < 0 or seq > height:
+        raise IPFSError(f'State {cid} has no ancestor with sequence number {seq}')
+
+    while height > seq:
+        metadata = _metadata(data)
+        skip_height = _skip_height(height)
+        skip_height_previous = _skip_height(height - 1)
+        if metadata is not None and metadata.get('skip') is not None and (
+                skip_height == seq or (skip_height > seq and not (skip_height_previous < skip_height - 2 and skip_height_previous >= seq))):
+            current_cid = metadata['skip']
+            height = skip_height
+        else:
+            current_cid = data['previous_cid']
+            height -= 1
+        data = load(current_cid)
+
+    return normalize_cid(current_cid)
+
+
+def _saved_after(data: Dict[str, Any], timestamp: float) -> bool:
+    """Check if a state was saved after a point in time, states without a save time count as older than any time.
+
+    :param data: The payload of the state
+    :type data: Dict[str, Any]
+    :param timestamp: The point in time, in seconds since the epoch
+    :type timestamp: float
+    :return: True if the save time of the state is later than the timestamp
+    :rtype: bool
+    """
+    save_time = (_metadata(data) or {}).get('time')
+    return save_time is not None and save_time > timestamp
+
+
+def _ancestor_at_time(cid: str, timestamp: float) -> Optional[str]:
+    """Get the CID of the newest state in the history of a state that was saved at or before a point in time.
+
+    Save times never decrease along a chain, so the history is searched like a sorted list: while the state is too
+    new, jump to its ancestor shortcut if that one is too new as well, otherwise step back to the previous state.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :param timestamp: The point in time, in seconds since the epoch
+    :type timestamp: float
+    :return: The normalized CID of the state, or None if every state was saved after the timestamp
+    :rtype: Optional[str]
+    """
+    current_cid = normalize_cid(cid)
+    data = _load_payload(cid=current_cid)
+    while _saved_after(data=data, timestamp=timestamp):
+        skip_cid = _metadata(data).get('skip')
+        if skip_cid is not None:
+            skip_data = _load_payload(cid=skip_cid)
+            if _saved_after(data=skip_data, timestamp=timestamp):
+                current_cid, data = normalize_cid(skip_cid), skip_data
+                continue
+
+        if data.get('previous_cid') is None:
+            return None
+        current_cid = normalize_cid(data['previous_cid'])
+        data = _load_payload(cid=current_cid)
+
+    return current_cid
+
+
+def _previous(cid: str) -> Optional[str]:
+    """Get the CID of the previous state of a state.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :return: The normalized CID of the previous state, or None at the start of the chain
+    :rtype: Optional[str]
+    """
+    previous_cid = _load_payload(cid=cid).get('previous_cid')
+    return normalize_cid(previous_cid) if previous_cid is not None else None
+
+
+def _parents(cid: str) -> List[str]:
+    """Get the CIDs of the parents of a state: its previous state and, for a merge, the merged head.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :return: The normalized CIDs of the parents
+    :rtype: List[str]
+    """
+    data = _load_payload(cid=cid)
+    parents = [data.get('previous_cid'), (_metadata(data) or {}).get('merge')]
+    return [normalize_cid(parent) for parent in parents if parent is not None]
+
+
+def _common_ancestor_by_walking(cid_a: str, cid_b: str) -> Optional[str]:
+    """Find the common ancestor of two states by walking back both histories alternately, one state at a time.
+
+    :param cid_a: The normalized CID of the first state
+    :type cid_a: str
+    :param cid_b: The normalized CID of the second state
+    :type cid_b: str
+    :return: The CID of the common ancestor, or None if the states do not share any history
+    :rtype: Optional[str]
+    """
+    frontiers = [deque([cid_a]), deque([cid_b])]
+    seen = [{cid_a}, {cid_b}]
+
+    while frontiers[0] or frontiers[1]:
+        for side in (0, 1):
+            if not frontiers[side]:
+                continue
+
+            for parent in _parents(cid=frontiers[side].popleft()):
+                if parent in seen[1 - side]:
+                    return parent
+                if parent not in seen[side]:
+                    seen[side].add(parent)
+                    frontiers[side].append(parent)
+
+    return None
+
+
+def _write_order(cid: str, ancestor_cid: Optional[str]) -> Tuple[float, int]:
+    """Get a sort key for a head in a merge, to determine which head was written last.
+
+    :param cid: The normalized CID of the head
+    :type cid: str
+    :param ancestor_cid: The CID of the common ancestor of the merge
+    :type ancestor_cid: Optional[str]
+    :return: The save time of the head, or 0 if it has none, and its number of states since the common ancestor
+    :rtype: Tuple[float, int]
+    """
+    metadata = _metadata(_load_payload(cid=cid)) or {}
+    distance = 0
+    current_cid = cid
+    while current_cid is not None and current_cid != ancestor_cid:
+        current_cid = _previous(cid=current_cid)
+        distance += 1
+    return metadata.get('time', 0), distance
+
+
+def _common_ancestor_with_shortcuts(cid_a: str, seq_a: int, cid_b: str, seq_b: int) -> Optional[str]:
+    """Find the common ancestor of two states that store sequence numbers and ancestor shortcuts.
+
+    The newer state first jumps back to the sequence number of the older one. From there both states are at the same
+    height, so their shortcuts lead to the same height too: if the shortcuts differ the common ancestor is older and
+    both jump, otherwise both step back one state.
+
+    :param cid_a: The normalized CID of the first state
+    :type cid_a: str
+    :param seq_a: The sequence number of the first state
+    :type seq_a: int
+    :param cid_b: The normalized CID of the second state
+    :type cid_b: str
+    :param seq_b: The sequence number of the second state
+    :type seq_b: int
+    :return: The CID of the common ancestor, or None if the states do not share any history
+    :rtype: Optional[str]
+    """
+    if seq_a > seq_b:
+        cid_a = _ancestor(cid=cid_a, seq=seq_b)
+    elif seq_b > seq_a:
+        cid_b = _ancestor(cid=cid_b, seq=seq_a)
+
+    while cid_a != cid_b:
+        if cid_a is None or cid_b is None:
+            return None
+
+        skip_a = (_metadata(_load_payload(cid=cid_a)) or {}).get('skip')
+        skip_b = (_metadata(_load_payload(cid=cid_b)) or {}).get('skip')
+        if skip_a is not None and skip_b is not None and skip_a != skip_b:
+            cid_a, cid_b = skip_a, skip_b
+        else:
+            cid_a, cid_b = _previous(cid=cid_a), _previous(cid=cid_b)
+
+    return cid_a
+
+
+def _encode_state(state: Dict[str, Any], previous_cid: Optional[str], checkpoint_interval: Optional[int],
+                  merge_cid: Optional[str] = None, save_time: Optional[float] = None,
+                  load: Callable[[str], Dict[str, Any]] = _load_payload) -> Dict[str, Any]:
+    """Build the payload of a new state with chain metadata.
+
+    :param state: The dictionary data of the new state, including its previous_cid
+    :type state: Dict[str, Any]
+    :param previous_cid: The CID of the previous state
+    :type previous_cid: Optional[str]
+    :param checkpoint_interval: Store a full checkpoint every this many states and deltas in between
+    :type checkpoint_interval: Optional[int]
+    :param merge_cid: The CID of the second parent if the state is a merge, defaults to None
+    :type merge_cid: Optional[str], optional
+    :param save_time: The save time of the state in seconds since the epoch, defaults to None
+    :type save_time: Optional[float], optional
+    :param load: The function that loads the payload of a state, defaults to _load_payload
+    :type load: Callable[[str], Dict[str, Any]], optional
+    :return: The payload
+    :rtype: Dict[str, Any]
+    """
+    seq = _sequence_number(cid=previous_cid, load=load) + 1 if previous_cid is not None else 0
+    metadata = {'seq': seq}
+    if seq >= 2:
+        metadata['skip'] = _ancestor(cid=previous_cid, seq=_skip_height(seq), load=load)
+
+    # The number of merges in the history, states without merges can use the ancestor shortcuts to find forks
+    merges = (_metadata(load(previous_cid)) or {}).get('merges', 0) if previous_cid is not None else 0
+    if merge_cid is not None:
+        metadata['merge'] = normalize_cid(merge_cid)
+        merges += 1 + (_metadata(load(merge_cid)) or {}).get('merges', 0)
+    if merges:
+        metadata['merges'] = merges
+    if save_time is not None:
+        metadata['time'] = save_time
+
+    if checkpoint_interval is None:
+        return {**state, CHAIN_METADATA_KEY: metadata}
+
+    metadata['interval'] = checkpoint_interval
+    if seq % checkpoint_interval == 0 or previous_cid is None:
+        return {**state, CHAIN_METADATA_KEY: metadata}
+
+    # Delta encode the state against the checkpoint of the previous state
+    previous_metadata = _metadata(load(previous_cid)) or {}
+    base_cid = previous_metadata.get('base') or normalize_cid(previous_cid)
+    # Chunked values are compared by their references, so unchanged ones are left out of the delta
+    base = _materialize(load(base_cid), load=load)
+
+    metadata['base'] = base_cid
+    deleted = [key for key in base if key not in state]
+    if deleted:
+        metadata['deleted'] = deleted
+
+    delta = {key: value for key, value in state.items() if key == 'previous_cid' or key not in base or base[key] != value}
+    return {**delta, CHAIN_METADATA_KEY: metadata}
+
+
+def _write_history(writer: CARWriter, cid: str, max_depth: Optional[int], written: set) -> List[str]:
+    """Write the blocks of a state and its history to a CAR, following both parents of merges.
+
+    :param writer: The writer of the archive
+    :type writer: CARWriter
+    :param cid: The CID of the newest state
+    :type cid: str
+    :param max_depth: The maximum number of states to go back from the newest state, along either parent of a merge
+    :type max_depth: Optional[int]
+    :param written: The CIDs of the states and chunks written so far, which are not encoded or exported again
+    :type written: set
+    :return: The CIDs of the exported states, breadth first from the newest state
+    :rtype: List[str]
+    """
+    exported_cids = []
+    queue = deque([(normalize_cid(cid), 0)])
+    seen = {queue[0][0]}
+
+    while queue:
+        current_cid, depth = queue.popleft()
+        data = _write_state(writer=writer, cid=current_cid, written=written)
+        exported_cids.append(current_cid)
+        if max_depth is not None and depth >= max_depth:
+            continue
+
+        for parent in (data.get('previous_cid'), (_metadata(data) or {}).get('merge')):
+            if parent is not None and normalize_cid(parent) not in seen:
+                seen.add(normalize_cid(parent))
+                queue.append((normalize_cid(parent), depth + 1))
+
+    return exported_cids
+
+
+def _write_state(writer: CARWriter, cid: str, written: set) -> Dict[str, Any]:
+    """Write the blocks of a state to a CAR, with the chunks of its chunked values and, if it is delta encoded, its
+    checkpoint.
+
+    :param writer: The writer of the archive
+    :type writer: CARWriter
+    :param cid: The normalized CID of the state
+    :type cid: str
+    :param written: The CIDs of the states and chunks written so far, which are not encoded or exported again
+    :type written: set
+    :return: The data of the state
+    :rtype: Dict[str, Any]
+    """
+    if cid in written:
+        return _load_payload(cid=cid)
+
+    data = _write_blocks(writer=writer, cid=cid, written=written)
+    for value in data.values():
+        if not is_chunk_reference(value):
+            continue
+        for chunk_cid in map(normalize_cid, value[CHUNKS_KEY]):
+            if chunk_cid not in written:
+                _write_blocks(writer=writer, cid=chunk_cid, written=written)
+
+    base_cid = (_metadata(data) or {}).get('base')
+    if base_cid is not None:
+        _write_state(writer=writer, cid=normalize_cid(base_cid), written=written)
+    return data
+
+
+def _write_blocks(writer: CARWriter, cid: str, written: set) -> Dict[str, Any]:
+    """Write the blocks of a JSON object stored by add_json() to a CAR.
+
+    :param writer: The writer of the archive
+    :type writer: CARWriter
+    :param cid: The normalized CID of the object
+    :type cid: str
+    :param written: The CIDs of the objects written so far, the CID is added to it
+    :type written: set
+    :return: The data of the object
+    :rtype: Dict[str, Any]
+    """
+    data, blocks = _version_blocks(cid=cid)
+    for block_cid, block in blocks:
+        writer.write_block(cid=block_cid, data=block)
+    written.add(cid)
+    return data
+
+
+def _version_blocks(cid: str) -> Tuple[Dict[str, Any], List[Tuple[bytes, bytes]]]:
+    """Get the data of a state, or of a chunk, and the blocks that store it.
+
+    If the state is cached and was stored as a single block by add_json(), the block is encoded locally.
+    Otherwise the blocks are exported from the IPFS daemon and the state is decoded from them.
+
+    :param cid: The CID of the state
+    :type cid: str
+    :return: The data of the state and its blocks as (binary CID, block data) tuples
+    :rtype: Tuple[Dict[str, Any], List[Tuple[bytes, bytes]]]
+    """
+    if cid in ipfs_cache:
+        data = ipfs_cache.get(cid)
+        content = json.dumps(data).encode()
+        if file_cid(content) == normalize_cid(cid):
+            return data, [(cid_to_bytes(cid), encode_file_block(content))]
+
+    blocks = list(CARReader(stream=io.BytesIO(dag_export(cid=cid))))
+    try:
+        data = _decompressed(cid=cid, data=json.loads(read_file(cid=cid_to_bytes(cid), get_block=dict(blocks).__getitem__)))
+    except Exception as e:
+        raise IPFSError(f'Failed to decode state {cid} from its blocks: {e}')
+
+    if not isinstance(data, dict):
+        raise IPFSError(f'IPFS cid {cid} does not contain a dict!')
+
+    ipfs_cache.set(cid, data)
+    return data, blocks
+
+
+def _import_car(path_or_stream: Union[str, os.PathLike, BinaryIO]) -> str:
+    """Verify a CAR, add the states it contains to the cache and import it into IPFS.
+
+    :param path_or_stream: The path of the CAR file to read, or a binary stream
+    :type path_or_stream: Union[str, os.PathLike, BinaryIO]
+    :return: The CID of the root of the archive
+    :rtype: str
+    :raises CARError: If the archive is invalid or a block does not match its CID
+    :raises IPFSError: If the archive can not be imported into IPFS
+    """
+    if isinstance(path_or_stream, (str, os.PathLike)):
+        with open(path_or_stream, 'rb') as stream:
+            root = _verify_car(stream=stream)
+        dag_import(path=os.fspath(path_or_stream))
+        return root
+
+    # Streams are copied to a temporary file while they are verified, so they are only read once
+    with tempfile.NamedTemporaryFile(suffix='.car', delete=False) as temporary_file:
+        try:
+            root = _verify_car(stream=path_or_stream, copy_to=temporary_file)
+        except BaseException:
+            temporary_file.close()
+            os.unlink(temporary_file.name)
+            raise
+
+    try:
+        dag_import(path=temporary_file.name)
+    finally:
+        os.unlink(temporary_file.name)
+
+    return root
+
+
+def _verify_car(stream: BinaryIO, copy_to: Optional[BinaryIO] = None) -> str:
+    """Verify every block in a CAR stream and add the states it contains to the cache.
+
+    :param stream: The binary stream to read the CAR data from
+    :type stream: BinaryIO
+    :param copy_to: A binary stream to copy the verified CAR data to, defaults to None
+    :type copy_to: Optional[BinaryIO], optional
+    :return: The CID of the root of the archive
+    :rtype: str
+    :raises CARError: If the archive is invalid or a block does not match its CID
+    """
+    reader = CARReader(stream=stream)
+    if len(reader.roots) != 1:
+        raise CARError(f'Expected a CAR with exactly one root, got {len(reader.roots)}')
+
+    writer = CARWriter(stream=copy_to, roots=reader.roots) if copy_to is not None else None
+    root_found = False
+
+    for cid, block in reader:
+        if writer is not None:
+            writer.write_block(cid=cid, data=block)
+        root_found = root_found or cid == reader.roots[0]
+
+        # A state stored by add_json() is a single dag-pb block holding the whole JSON document
+        if cid_codec(cid) != DAG_PB:
+            continue
+        try:
+            links, node_data = decode_pbnode(block)
+            node_type, content = decode_unixfs(node_data or b'')
+        except ValueError:
+            continue
+        if links or node_type != UNIXFS_FILE:
+            continue
+        try:
+            data = _decompressed(cid=cid_from_bytes(cid), data=json.loads(content))
+        except (ValueError, IPFSError):
+            continue
+        if isinstance(data, dict):
+            ipfs_cache.set(cid_from_bytes(cid), data)
+
+    if not root_found:
+        raise CARError(f'The root {cid_from_bytes(reader.roots[0])} of the CAR is missing from its blocks')
+
+    return cid_from_bytes(reader.roots[0])
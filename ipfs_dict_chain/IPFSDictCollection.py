@@ -0,0 +1,346 @@
+import concurrent.futures
+import hashlib
+import os
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+
+from .CAR import CARWriter
+from .Compression import Compressor
+from .FrozenDict import thaw
+from .IPFS import IPFSError, add_json, get_json, get_json_many, normalize_cid
+from .IPFSDict import IPFSDict
+from .IPFSDictChain import IPFSDictChain, _import_car, _load_state, _write_blocks, _write_history, _write_state
+
+
+class IPFSDictCollection(IPFSDictChain):
+    """A named collection of many IPFSDicts, addressed, versioned and replicated by a single root CID.
+
+    The collection maps names to the CIDs of its members. The mapping is split into shards by a prefix of the
+    SHA-256 hash of the names, and every shard is stored as its own JSON object, so a change to a few members only
+    uploads the shards they are in. The root, with the CIDs of the shards, is a state of an IPFSDictChain, so every
+    saved version of the collection can be loaded, compared and exported like any other chain.
+
+    Shards are loaded on first use. Members are loaded in batches: the shards and the members of a batch are fetched
+    concurrently before the members are created.
+
+    :param cid: The IPFS CID of the root of the collection, defaults to None for a new collection
+    :type cid: Optional[str], optional
+    :param dict_class: The class the members are loaded with, defaults to IPFSDict
+    :type dict_class: Type[IPFSDict], optional
+    :param prefix_length: The number of hex digits of the name hash that select the shard of a name, 1 to 4, for
+                          16 ** prefix_length shards, defaults to 2. Loading a saved collection uses its stored value.
+    :type prefix_length: int, optional
+    :param shortcuts: Store sequence numbers and ancestor shortcuts with new versions, defaults to False
+    :type shortcuts: bool, optional
+    :param timestamps: Store the save time with new versions, defaults to False
+    :type timestamps: bool, optional
+    :param compression: A Compressor or the name of a codec for the root, defaults to None for no compression
+    :type compression: Optional[Union[str, Compressor]], optional
+    """
+
+    def __init__(self, cid: Optional[str] = None, dict_class: Type[IPFSDict] = IPFSDict, prefix_length: int = 2,
+                 shortcuts: bool = False, timestamps: bool = False,
+                 compression: Optional[Union[str, Compressor]] = None):
+        if not 1 <= prefix_length <= 4:
+            raise ValueError(f'prefix_length must be between 1 and 4, got {prefix_length}')
+
+        self.shards = {}
+        self.count = 0
+        self.prefix_length = prefix_length
+        self._dict_class = dict_class
+        self._loaded_shards = {}
+        self._dirty_shards = set()
+
+        super(IPFSDictCollection, self).__init__(cid=cid, shortcuts=shortcuts, timestamps=timestamps,
+                                                 compression=compression)
+
+    def load(self, cid: str) -> None:
+        """Load a version of the collection, discarding changes that were not saved.
+
+        :param cid: The IPFS CID of the root of the collection
+        :type cid: str
+        :raises IPFSError: If the root can not be retrieved or is not the root of a collection
+        """
+        for key in ('shards', 'count', 'prefix_length'):
+            self.__dict__.pop(key, None)
+
+        super(IPFSDictCollection, self).load(cid=cid)
+        if not all(isinstance(getattr(self, key, None), expected)
+                   for key, expected in (('shards', dict), ('count', int), ('prefix_length', int))):
+            raise IPFSError(f'IPFS cid {cid} is not the root of a collection')
+
+        self.thaw('shards')
+        self._loaded_shards = {}
+        self._dirty_shards = set()
+
+    def add(self, name: str, member: Union[str, IPFSDict]) -> None:
+        """Add a member to the collection, or replace the member with the same name.
+
+        The change is stored by the next save().
+
+        :param name: The name of the member
+        :type name: str
+        :param member: The member, a saved IPFSDict or the CID of one
+        :type member: Union[str, IPFSDict]
+        :raises ValueError: If the member has not been saved
+        """
+        cid = member.cid() if isinstance(member, IPFSDict) else member
+        if not isinstance(cid, str):
+            raise ValueError(f'Can not add {name!r} to the collection: the member has not been saved')
+        cid = normalize_cid(cid)
+
+        key = self._shard_key(name=name)
+        shard = self._shard(key=key)
+        if name not in shard:
+            self.count += 1
+        shard[name] = cid
+        self._dirty_shards.add(key)
+
+    def remove(self, name: str) -> None:
+        """Remove a member from the collection.
+
+        The change is stored by the next save().
+
+        :param name: The name of the member
+        :type name: str
+        :raises KeyError: If the collection has no member with the name
+        """
+        key = self._shard_key(name=name)
+        del self._shard(key=key)[name]
+        self.count -= 1
+        self._dirty_shards.add(key)
+
+    def cid_of(self, name: str) -> Optional[str]:
+        """Get the CID of a member.
+
+        :param name: The name of the member
+        :type name: str
+        :return: The CID, or None if the collection has no member with the name
+        :rtype: Optional[str]
+        """
+        return self._shard(key=self._shard_key(name=name)).get(name)
+
+    def names(self) -> Iterator[str]:
+        """Iterate over the names of the members, shard by shard.
+
+        :return: An iterator over the names, sorted within each shard
+        :rtype: Iterator[str]
+        """
+        for key in self._shard_keys():
+            yield from sorted(self._shard(key=key))
+
+    def load_member(self, name: str) -> IPFSDict:
+        """Load a member.
+
+        :param name: The name of the member
+        :type name: str
+        :return: The member, loaded with the dict_class of the collection
+        :rtype: IPFSDict
+        :raises KeyError: If the collection has no member with the name
+        """
+        return self.load_members(names=[name])[name]
+
+    def load_members(self, names: Iterable[str], concurrency: int = 16) -> Dict[str, IPFSDict]:
+        """Load several members in one batch.
+
+        The shards of the names and then the members are fetched concurrently, before the members are created.
+
+        :param names: The names of the members
+        :type names: Iterable[str]
+        :param concurrency: The maximum number of concurrent fetches, defaults to 16
+        :type concurrency: int, optional
+        :return: The members by name, loaded with the dict_class of the collection
+        :rtype: Dict[str, IPFSDict]
+        :raises KeyError: If the collection has no member with one of the names
+        """
+        names = list(dict.fromkeys(names))
+        self._prefetch_shards(keys=[self._shard_key(name=name) for name in names], concurrency=concurrency)
+
+        cids = {}
+        for name in names:
+            cid = self.cid_of(name=name)
+            if cid is None:
+                raise KeyError(name)
+            cids[name] = cid
+
+        get_json_many(cids=cids.values(), concurrency=concurrency)
+        return {name: self._dict_class(cid=cid) for name, cid in cids.items()}
+
+    def members(self, batch_size: int = 64, concurrency: int = 16) -> Iterator[Tuple[str, IPFSDict]]:
+        """Iterate over the members, loading them in batches, so only one batch is held at a time.
+
+        :param batch_size: The number of members loaded per batch, defaults to 64
+        :type batch_size: int, optional
+        :param concurrency: The maximum number of concurrent fetches, defaults to 16
+        :type concurrency: int, optional
+        :return: An iterator over the names and the members, in the order of names()
+        :rtype: Iterator[Tuple[str, IPFSDict]]
+        """
+        if batch_size < 1:
+            raise ValueError(f'batch_size must be at least 1, got {batch_size}')
+
+        keys = self._shard_keys()
+        batch = []
+        for index, key in enumerate(keys):
+            if index % batch_size == 0:
+                self._prefetch_shards(keys=keys[index:index + batch_size], concurrency=concurrency)
+
+            for name in sorted(self._shard(key=key)):
+                batch.append(name)
+                if len(batch) == batch_size:
+                    yield from self.load_members(names=batch, concurrency=concurrency).items()
+                    batch = []
+
+        if batch:
+            yield from self.load_members(names=batch, concurrency=concurrency).items()
+
+    def save_members(self, members: Dict[str, IPFSDict], concurrency: int = 8,
+                     timestamp: Optional[Union[float, datetime]] = None) -> str:
+        """Save several members concurrently, add them to the collection and save the collection once.
+
+        :param members: The members to save, by name
+        :type members: Dict[str, IPFSDict]
+        :param concurrency: The maximum number of members saved at the same time, defaults to 8
+        :type concurrency: int, optional
+        :param timestamp: The save time to store with the new version of the collection, defaults to None
+        :type timestamp: Optional[Union[float, datetime]], optional
+        :return: The new CID of the collection
+        :rtype: str
+        :raises IPFSError: If a member can not be saved, the collection is not changed
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            cids = dict(zip(members, executor.map(lambda member: member.save(), members.values())))
+
+        for name, cid in cids.items():
+            self.add(name=name, member=cid)
+        return self.save(timestamp=timestamp)
+
+    def save(self, timestamp: Optional[Union[float, datetime]] = None) -> str:
+        """Save the changed shards and a new version of the collection.
+
+        :param timestamp: The save time to store, as seconds since the epoch or a datetime, defaults to None for now
+        :type timestamp: Optional[Union[float, datetime]], optional
+        :return: The new CID of the collection
+        :rtype: str
+        """
+        for key in sorted(self._dirty_shards):
+            shard = self._loaded_shards[key]
+            if shard:
+                self.shards[key] = add_json(data=dict(sorted(shard.items())))
+            else:
+                self.shards.pop(key, None)
+        self.shards = dict(sorted(self.shards.items()))
+        self._dirty_shards = set()
+
+        return super(IPFSDictCollection, self).save(timestamp=timestamp)
+
+    def export_car(self, path_or_stream: Union[str, os.PathLike, BinaryIO],
+                   max_depth: Optional[int] = None) -> List[str]:
+        """Exports the collection to a CAR (Content Addressable aRchive).
+
+        The shards and the members are linked by CIDs stored as strings, which IPFS does not follow, so they are
+        written to the archive explicitly: the history of the root, and the shards of every exported version and the
+        members in them. Members that are chains are exported with their full history. Blocks shared between versions
+        are written once.
+
+        :param path_or_stream: The path of the CAR file to write, or a binary stream
+        :type path_or_stream: Union[str, os.PathLike, BinaryIO]
+        :param max_depth: The maximum number of versions of the collection to go back from the current version,
+                          defaults to None
+        :type max_depth: Optional[int], optional
+        :return: The CIDs of the exported versions of the collection, breadth first from the current version
+        :rtype: List[str]
+        :raises IPFSError: If the collection has not been saved or a version, shard or member can not be exported
+        """
+        return super(IPFSDictCollection, self).export_car(path_or_stream=path_or_stream, max_depth=max_depth)
+
+    @classmethod
+    def import_car(cls, path_or_stream: Union[str, os.PathLike, BinaryIO],
+                   dict_class: Type[IPFSDict] = IPFSDict) -> 'IPFSDictCollection':
+        """Imports a collection from a CAR (Content Addressable aRchive) created with export_car().
+
+        :param path_or_stream: The path of the CAR file to read, or a binary stream
+        :type path_or_stream: Union[str, os.PathLike, BinaryIO]
+        :param dict_class: The class the members are loaded with, defaults to IPFSDict
+        :type dict_class: Type[IPFSDict], optional
+        :return: The imported collection, loaded at its newest version
+        :rtype: IPFSDictCollection
+        :raises CARError: If the archive is invalid or a block does not match its CID
+        :raises IPFSError: If the archive can not be imported into IPFS
+        """
+        return cls(cid=_import_car(path_or_stream=path_or_stream), dict_class=dict_class)
+
+    def _write_car(self, writer: CARWriter, max_depth: Optional[int]) -> List[str]:
+        """Write the versions of the collection, their shards and the members in them to a CAR.
+
+        :param writer: The writer of the archive
+        :type writer: CARWriter
+        :param max_depth: The maximum number of versions to go back from the current version
+        :type max_depth: Optional[int]
+        :return: The CIDs of the exported versions, breadth first from the current version
+        :rtype: List[str]
+        """
+        written = set()
+        exported_cids = _write_history(writer=writer, cid=self._cid, max_depth=max_depth, written=written)
+        for root_cid in exported_cids:
+            for shard_cid in map(normalize_cid, _load_state(cid=root_cid)['shards'].values()):
+                if shard_cid in written:
+                    continue
+                shard = _write_blocks(writer=writer, cid=shard_cid, written=written)
+                for member_cid in map(normalize_cid, shard.values()):
+                    if member_cid in written:
+                        continue
+                    if issubclass(self._dict_class, IPFSDictChain):
+                        _write_history(writer=writer, cid=member_cid, max_depth=None, written=written)
+                    else:
+                        _write_state(writer=writer, cid=member_cid, written=written)
+        return exported_cids
+
+    def _shard_key(self, name: str) -> str:
+        """Get the key of the shard of a name.
+
+        :param name: The name of a member
+        :type name: str
+        :return: The first prefix_length hex digits of the SHA-256 hash of the name
+        :rtype: str
+        """
+        if not isinstance(name, str):
+            raise ValueError(f'The name of a member must be a string, got {type(name)} instead')
+        return hashlib.sha256(name.encode()).hexdigest()[:self.prefix_length]
+
+    def _shard_keys(self) -> List[str]:
+        """Get the keys of the stored shards and of the shards changed since the last save.
+
+        :return: The keys, sorted
+        :rtype: List[str]
+        """
+        return sorted(set(self.shards) | set(self._loaded_shards))
+
+    def _shard(self, key: str) -> Dict[str, str]:
+        """Get the mapping of names to CIDs of a shard, loading it on first use.
+
+        :param key: The key of the shard
+        :type key: str
+        :return: The mutable mapping of the shard
+        :rtype: Dict[str, str]
+        :raises IPFSError: If the shard can not be retrieved or is not a mapping
+        """
+        shard = self._loaded_shards.get(key)
+        if shard is None:
+            cid = self.shards.get(key)
+            shard = thaw(get_json(cid=cid)) if cid is not None else {}
+            if not isinstance(shard, dict):
+                raise IPFSError(f'Shard {key} of the collection at {cid} is not a mapping')
+            self._loaded_shards[key] = shard
+        return shard
+
+    def _prefetch_shards(self, keys: Iterable[str], concurrency: int) -> None:
+        """Fetch the shards that are not loaded yet concurrently, so loading them hits the cache.
+
+        :param keys: The keys of the shards
+        :type keys: Iterable[str]
+        :param concurrency: The maximum number of concurrent fetches
+        :type concurrency: int
+        """
+        get_json_many(cids=[self.shards[key] for key in set(keys)
+                            if key not in self._loaded_shards and key in self.shards], concurrency=concurrency)
@@ -0,0 +1,257 @@
+import math
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Type, Union
+
+from .IPFS import get_json_many, normalize_cid
+
+# The types of values that are indexed, other values such as lists and nested dicts are not
+INDEXED_TYPES = (str, int, float, bool, type(None))
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (cid TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS entries (cid TEXT NOT NULL, field TEXT NOT NULL, value);
+CREATE INDEX IF NOT EXISTS entries_by_value ON entries (field, value);
+CREATE INDEX IF NOT EXISTS entries_by_cid ON entries (cid);
+'''
+
+
+class Index:
+    """A local secondary index of the values of chosen fields, to find dictionaries by value without loading them.
+
+    The index maps the values of the fields to the CIDs of the dictionaries that have them, in a SQLite database in
+    memory or in a file. An IPFSDict or IPFSDictChain created with the index adds itself on every save(), replacing
+    the entries of the CID the dictionary had before, so the index holds the latest version of the dictionaries saved
+    in this process, and for chains only their heads. Loading a dictionary does not index it, as the loaded CID may be
+    an older version of one that is already indexed. Use add() or rebuild() to index dictionaries that were not
+    saved in this process.
+
+    Strings, numbers, booleans and None are indexed, other values are not. Booleans compare equal to the numbers 0
+    and 1, as they do in Python. After changing the fields of an existing index file, use rebuild() to index the
+    new fields of the dictionaries that are already in it.
+
+    :param fields: The names of the fields to index
+    :type fields: Iterable[str]
+    :param path: The path of the database file, defaults to ':memory:' for an index that is not kept
+    :type path: str, optional
+    """
+
+    def __init__(self, fields: Iterable[str], path: str = ':memory:'):
+        self.fields = tuple(dict.fromkeys(fields))
+        if not self.fields:
+            raise ValueError('An index needs at least one field')
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            if path != ':memory:':
+                # Without a sync on every commit, saving many dictionaries does not wait for the disk
+                self._connection.execute('PRAGMA journal_mode=WAL')
+                self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(_SCHEMA)
+
+    def __len__(self) -> int:
+        """Get the number of indexed dictionaries.
+
+        :return: The number of indexed CIDs
+        :rtype: int
+        """
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+
+    def __contains__(self, cid: str) -> bool:
+        """Check if a CID is indexed.
+
+        :param cid: The CID
+        :type cid: str
+        :return: True if the CID is indexed
+        :rtype: bool
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT 1 FROM documents WHERE cid = ?', (normalize_cid(cid),)).fetchone()
+        return row is not None
+
+    def add(self, cid: str, data: Dict[str, Any], replaces: Optional[str] = None) -> None:
+        """Index the data of a dictionary, replacing the entries the CID had before.
+
+        :param cid: The CID of the dictionary
+        :type cid: str
+        :param data: The dictionary data
+        :type data: Dict[str, Any]
+        :param replaces: The CID of a previous version of the dictionary to remove from the index, defaults to None
+        :type replaces: Optional[str], optional
+        """
+        with self._lock, self._connection:
+            if replaces is not None:
+                self._remove(cid=normalize_cid(replaces))
+            self._add(cid=normalize_cid(cid), data=data)
+
+    def remove(self, cid: str) -> None:
+        """Remove a dictionary from the index.
+
+        :param cid: The CID of the dictionary
+        :type cid: str
+        """
+        with self._lock, self._connection:
+            self._remove(cid=normalize_cid(cid))
+
+    def cids(self) -> List[str]:
+        """Get the CIDs of all indexed dictionaries.
+
+        :return: The CIDs, sorted
+        :rtype: List[str]
+        """
+        with self._lock:
+            return [row[0] for row in self._connection.execute('SELECT cid FROM documents ORDER BY cid')]
+
+    def find(self, field: str, value: Any) -> List[str]:
+        """Find the dictionaries in which a field has a value.
+
+        :param field: The name of the field
+        :type field: str
+        :param value: The value, a string, number, boolean or None
+        :type value: Any
+        :return: The CIDs of the dictionaries, sorted
+        :rtype: List[str]
+        :raises ValueError: If the field is not indexed or the value can not be indexed
+        """
+        self._check_field(field=field)
+        if not _indexable(value):
+            raise ValueError(f'Can not look up {value!r}: only strings, numbers, booleans and None are indexed')
+
+        with self._lock:
+            rows = self._connection.execute('SELECT cid FROM entries WHERE field = ? AND value IS ? ORDER BY cid',
+                                            (field, value))
+            return [row[0] for row in rows]
+
+    def find_range(self, field: str, start: Optional[Union[int, float, str]] = None,
+                   end: Optional[Union[int, float, str]] = None, include_end: bool = False) -> List[str]:
+        """Find the dictionaries in which a field has a value in a range.
+
+        A range of numbers only matches numbers and a range of strings only matches strings. Strings are compared by
+        their code points.
+
+        :param field: The name of the field
+        :type field: str
+        :param start: The smallest value, defaults to None for no lower bound
+        :type start: Optional[Union[int, float, str]], optional
+        :param end: The end of the range, defaults to None for no upper bound
+        :type end: Optional[Union[int, float, str]], optional
+        :param include_end: Whether the end belongs to the range, defaults to False
+        :type include_end: bool, optional
+        :return: The CIDs of the dictionaries, sorted by value
+        :rtype: List[str]
+        :raises ValueError: If the field is not indexed, or the bounds are missing or of different kinds
+        """
+        self._check_field(field=field)
+        bounds = [bound for bound in (start, end) if bound is not None]
+        kinds = {'text' if isinstance(bound, str) else 'number' for bound in bounds}
+        if not bounds or len(kinds) > 1 or any(isinstance(bound, bool) or not _indexable(bound) for bound in bounds):
+            raise ValueError('A range needs a start or an end, both numbers or both strings')
+
+        query = 'SELECT cid FROM entries WHERE field = ?'
+        parameters = [field]
+        query += " AND typeof(value) = 'text'" if kinds == {'text'} else " AND typeof(value) IN ('integer', 'real')"
+        if start is not None:
+            query += ' AND value >= ?'
+            parameters.append(start)
+        if end is not None:
+            query += ' AND value <= ?' if include_end else ' AND value < ?'
+            parameters.append(end)
+
+        with self._lock:
+            return [row[0] for row in self._connection.execute(query + ' ORDER BY value, cid', parameters)]
+
+    def rebuild(self, heads: Iterable[str], dict_class: Optional[Type] = None, concurrency: int = 32) -> int:
+        """Replace the contents of the index with the dictionaries at the given CIDs, e.g. the heads of chains.
+
+        The payloads of the heads are fetched concurrently before they are loaded.
+
+        :param heads: The CIDs of the dictionaries
+        :type heads: Iterable[str]
+        :param dict_class: The class to load the dictionaries with, defaults to None for IPFSDictChain
+        :type dict_class: Optional[Type], optional
+        :param concurrency: The maximum number of concurrent fetches, defaults to 32
+        :type concurrency: int, optional
+        :return: The number of indexed dictionaries
+        :rtype: int
+        :raises IPFSError: If a dictionary can not be loaded, the index is left unchanged
+        """
+        if dict_class is None:
+            from .IPFSDictChain import IPFSDictChain
+
+            dict_class = IPFSDictChain
+
+        heads = list(dict.fromkeys(normalize_cid(cid) for cid in heads))
+        get_json_many(cids=heads, concurrency=concurrency)
+        loaded = [(cid, dict(dict_class(cid=cid).items())) for cid in heads]
+
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM entries')
+            self._connection.execute('DELETE FROM documents')
+            for cid, data in loaded:
+                self._add(cid=cid, data=data)
+        return len(loaded)
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> 'Index':
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _add(self, cid: str, data: Dict[str, Any]) -> None:
+        """Index the data of a dictionary, in the current transaction.
+
+        :param cid: The normalized CID of the dictionary
+        :type cid: str
+        :param data: The dictionary data
+        :type data: Dict[str, Any]
+        """
+        self._remove(cid=cid)
+        self._connection.execute('INSERT INTO documents (cid) VALUES (?)', (cid,))
+        self._connection.executemany('INSERT INTO entries (cid, field, value) VALUES (?, ?, ?)',
+                                     [(cid, field, data[field]) for field in self.fields
+                                      if field in data and _indexable(data[field])])
+
+    def _remove(self, cid: str) -> None:
+        """Remove a dictionary from the index, in the current transaction.
+
+        :param cid: The normalized CID of the dictionary
+        :type cid: str
+        """
+        self._connection.execute('DELETE FROM entries WHERE cid = ?', (cid,))
+        self._connection.execute('DELETE FROM documents WHERE cid = ?', (cid,))
+
+    def _check_field(self, field: str) -> None:
+        """Check that a field is indexed.
+
+        :param field: The name of the field
+        :type field: str
+        :raises ValueError: If the field is not indexed
+        """
+        if field not in self.fields:
+            raise ValueError(f'Field {field!r} is not indexed, the indexed fields are {self.fields}')
+
+    def __repr__(self) -> str:
+        return f'Index(fields={self.fields!r}, path={self.path!r})'
+
+
+def _indexable(value: Any) -> bool:
+    """Check if a value can be indexed.
+
+    :param value: The value
+    :type value: Any
+    :return: True for strings, numbers except NaN and integers beyond 64 bits, booleans and None
+    :rtype: bool
+    """
+    if type(value) is float:
+        return not math.isnan(value)
+    if type(value) is int:
+        return -2 ** 63 <= value < 2 ** 63
+    return type(value) in INDEXED_TYPES
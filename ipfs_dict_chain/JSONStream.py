@@ -0,0 +1,234 @@
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Characters that matter when looking for the end of a value, outside and inside of strings
+_STRUCTURE = re.compile(rb'["\[\]{},]')
+_STRING = re.compile(rb'["\\]')
+_WHITESPACE = b' \t\r\n'
+
+
+class JSONObjectParser:
+    """An incremental parser for a JSON document that is received in chunks, such as a large file streamed from IPFS.
+
+    The top-level members of a JSON object are decoded as soon as they are complete, so only the raw bytes of one
+    member are buffered at a time. When only some keys are wanted, the values of the other keys are skipped without
+    being decoded, and :attr:`done` becomes True as soon as all wanted keys have been found.
+
+    Documents that are not JSON objects are buffered and decoded when the parser is closed.
+
+    :param keys: The top-level keys to extract, defaults to None for all keys
+    :type keys: Optional[Iterable[str]], optional
+    :param convert: A function applied to every decoded member value before it is stored, defaults to None
+    :type convert: Optional[Callable[[Any], Any]], optional
+    :ivar first_key: The first top-level key of the object, None until it has been parsed
+    """
+
+    def __init__(self, keys: Optional[Iterable[str]] = None, convert: Optional[Callable[[Any], Any]] = None):
+        self.keys = set(keys) if keys is not None else None
+        self.convert = convert
+        self.result = {}
+        self.first_key = None
+
+        self._buffer = bytearray()
+        self._position = 0
+        self._state = 'start'
+        self._key = None
+
+        # The position up to which the current value has been scanned, and the scanner state at that position
+        self._scan = 0
+        self._depth = 0
+        self._in_string = False
+
+    @property
+    def done(self) -> bool:
+        """Whether the document is complete, or all wanted keys have been found."""
+        return self._state == 'end' or (self.keys is not None and self.keys.issubset(self.result))
+
+    def feed(self, data: bytes) -> List[Tuple[str, Any]]:
+        """Parse the next chunk of the document.
+
+        :param data: The next chunk
+        :type data: bytes
+        :return: The (key, value) pairs of the wanted members that were completed by this chunk
+        :rtype: List[Tuple[str, Any]]
+        :raises ValueError: If the document is not valid JSON
+        """
+        self._buffer += data
+        try:
+            return self._parse()
+        finally:
+            # Drop the parsed data once per chunk instead of once per member
+            del self._buffer[:self._position]
+            self._scan -= self._position
+            self._position = 0
+
+    def close(self) -> Any:
+        """Finish parsing the document.
+
+        :return: The parsed document: a dict of the wanted members for an object, or the decoded value otherwise
+        :rtype: Any
+        :raises ValueError: If the document is incomplete or not valid JSON
+        """
+        if self._state == 'document':
+            self.result = json.loads(bytes(self._buffer))
+            self._buffer = bytearray()
+            if self.convert is not None:
+                self.result = self.convert(self.result)
+            return self.result
+
+        self._skip_whitespace()
+        if self._state != 'end' or self._position < len(self._buffer):
+            raise ValueError('Incomplete JSON document')
+        return self.result
+
+    def _parse(self) -> List[Tuple[str, Any]]:
+        """Parse as much of the buffered data as possible.
+
+        :return: The (key, value) pairs of the wanted members that were completed
+        :rtype: List[Tuple[str, Any]]
+        """
+        members = []
+        buffer = self._buffer
+
+        while True:
+            if self._state == 'document':
+                return members
+
+            self._skip_whitespace()
+            if self._position >= len(buffer):
+                return members
+            character = buffer[self._position:self._position + 1]
+
+            if self._state == 'start':
+                if character != b'{':
+                    if self.keys is not None:
+                        raise ValueError('Can not extract keys from a JSON document that is not an object')
+                    self._state = 'document'
+                    continue
+                self._position += 1
+                self._state = 'first_key'
+            elif self._state in ('first_key', 'key'):
+                if self._state == 'first_key' and character == b'}':
+                    self._position += 1
+                    self._state = 'end'
+                    continue
+                if character != b'"':
+                    raise ValueError(f'Expected a key in JSON object, got {bytes(buffer[self._position:self._position + 20])!r}')
+                end, _ = self._string_end(start=self._position + 1)
+                if end is None:
+                    return members
+                self._key = json.loads(bytes(buffer[self._position:end]))
+                if self._state == 'first_key':
+                    self.first_key = self._key
+                self._position = end
+                self._state = 'colon'
+            elif self._state == 'colon':
+                if character != b':':
+                    raise ValueError(f'Expected ":" after key {self._key!r} in JSON object')
+                self._position += 1
+                self._scan = self._position
+                self._state = 'value'
+            elif self._state == 'value':
+                end = self._value_end()
+                if end is None:
+                    return members
+                if self.keys is None or self._key in self.keys:
+                    value = json.loads(bytes(buffer[self._position:end]))
+                    if self.convert is not None:
+                        value = self.convert(value)
+                    self.result[self._key] = value
+                    members.append((self._key, value))
+                self._position = end
+                self._state = 'separator'
+            elif self._state == 'separator':
+                self._position += 1
+                if character == b',':
+                    self._state = 'key'
+                elif character == b'}':
+                    self._state = 'end'
+                else:
+                    raise ValueError(f'Expected "," or "}}" after the value of {self._key!r} in JSON object')
+            elif self._state == 'end':
+                raise ValueError('Extra data after the end of the JSON object')
+
+    def _skip_whitespace(self) -> None:
+        """Skip whitespace between the tokens of the top-level object."""
+        if self._state in ('document', 'value'):
+            return
+        while self._position < len(self._buffer) and self._buffer[self._position] in _WHITESPACE:
+            self._position += 1
+
+    def _string_end(self, start: int) -> Tuple[Optional[int], int]:
+        """Find the end of a string in the buffer.
+
+        :param start: The position right after the opening quote, or any later position outside of an escape sequence
+        :type start: int
+        :return: The position right after the closing quote, or None if the string is not complete yet, and the
+            position to resume searching from when more data arrives
+        :rtype: Tuple[Optional[int], int]
+        """
+        position = start
+        while True:
+            match = _STRING.search(self._buffer, position)
+            if match is None:
+                return None, len(self._buffer)
+            if match.group() == b'"':
+                return match.end(), match.end()
+            if match.end() >= len(self._buffer):
+                return None, match.start()
+            position = match.end() + 1
+
+    def _value_end(self) -> Optional[int]:
+        """Find the end of the current value, continuing the scan of previous chunks.
+
+        :return: The position right after the value, or None if the value is not complete yet
+        :rtype: Optional[int]
+        """
+        while True:
+            if self._in_string:
+                end, self._scan = self._string_end(start=self._scan)
+                if end is None:
+                    return None
+                self._in_string = False
+                if self._depth == 0:
+                    return end
+                continue
+
+            match = _STRUCTURE.search(self._buffer, self._scan)
+            if match is None:
+                self._scan = len(self._buffer)
+                return None
+
+            character = match.group()
+            self._scan = match.end()
+            if character == b'"':
+                self._in_string = True
+            elif character in (b'[', b'{'):
+                self._depth += 1
+            elif character in (b']', b'}') and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    return match.end()
+            elif self._depth == 0:
+                # A ',' or the '}' of the top-level object ends a scalar value
+                return match.start()
+
+
+def parse_json_object(chunks: Iterable[bytes], keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Parse a JSON object from an iterable of chunks, stopping early once all wanted keys have been found.
+
+    :param chunks: The chunks of the document
+    :type chunks: Iterable[bytes]
+    :param keys: The top-level keys to extract, defaults to None for all keys
+    :type keys: Optional[Iterable[str]], optional
+    :return: The parsed document, with only the wanted keys that were found
+    :rtype: Dict[str, Any]
+    :raises ValueError: If the document is not valid JSON
+    """
+    parser = JSONObjectParser(keys=keys)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done and parser.keys is not None:
+            return parser.result
+    return parser.close()
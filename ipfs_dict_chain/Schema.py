@@ -0,0 +1,366 @@
+import types
+import typing
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .FrozenDict import thaw
+from .IPFS import IPFSError
+from .IPFSDict import IPFSDict
+from .IPFSDictChain import MISSING, IPFSDictChain
+
+# The policies for keys that are not declared as fields
+EXTRA_POLICIES = ('allow', 'ignore', 'forbid')
+
+
+class SchemaError(IPFSError):
+    """Raised when the data of a schema dictionary does not match its fields."""
+    pass
+
+
+class Field:
+    """The declaration of a field with a default, see field().
+
+    :param default: The default value, defaults to MISSING for a required field
+    :type default: Any, optional
+    :param default_factory: A function that creates the default value, for mutable defaults, defaults to None
+    :type default_factory: Optional[Callable[[], Any]], optional
+    """
+
+    __slots__ = ('default', 'default_factory')
+
+    def __init__(self, default: Any = MISSING, default_factory: Optional[Callable[[], Any]] = None):
+        if default is not MISSING and default_factory is not None:
+            raise ValueError('A field can not have both a default and a default_factory')
+        if isinstance(default, (list, dict)):
+            raise ValueError(f'Mutable default {default!r} is shared by all instances, use default_factory')
+
+        self.default = default
+        self.default_factory = default_factory
+
+    @property
+    def required(self) -> bool:
+        """Whether the field has no default."""
+        return self.default is MISSING and self.default_factory is None
+
+    def make_default(self) -> Any:
+        """Get the default value of the field.
+
+        :return: The default value
+        :rtype: Any
+        """
+        return self.default_factory() if self.default_factory is not None else self.default
+
+
+def field(default: Any = MISSING, default_factory: Optional[Callable[[], Any]] = None) -> Any:
+    """Declare a field with a default, e.g. ``tags: List[str] = field(default_factory=list)``.
+
+    :param default: The default value, defaults to MISSING for a required field
+    :type default: Any, optional
+    :param default_factory: A function that creates the default value, for mutable defaults, defaults to None
+    :type default_factory: Optional[Callable[[], Any]], optional
+    :return: The field declaration
+    :rtype: Any
+    """
+    return Field(default=default, default_factory=default_factory)
+
+
+def _is_class_var(annotation: Any) -> bool:
+    """Check if an annotation declares a class variable instead of a field.
+
+    :param annotation: The annotation, or its string form
+    :type annotation: Any
+    :return: True for ClassVar annotations
+    :rtype: bool
+    """
+    if isinstance(annotation, str):
+        return annotation.startswith(('ClassVar', 'typing.ClassVar'))
+    return annotation is typing.ClassVar or typing.get_origin(annotation) is typing.ClassVar
+
+
+def _coercer(annotation: Any) -> Callable[[Any], Any]:
+    """Build the function that validates a value against a type and converts it.
+
+    :param annotation: The type
+    :type annotation: Any
+    :return: The function, which raises TypeError or ValueError for invalid values
+    :rtype: Callable[[Any], Any]
+    """
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if annotation is Any:
+        return thaw
+    if origin is typing.Union or origin is types.UnionType:
+        return _union_coercer(options=args)
+    if annotation in (list, tuple) or origin in (list, tuple):
+        return _list_coercer(item=_coercer(args[0]) if args and origin is list else thaw)
+    if annotation is dict or origin is dict:
+        return _dict_coercer(value=_coercer(args[1]) if len(args) == 2 else thaw)
+    if annotation is bool:
+        return _checked(bool)
+    if annotation is int:
+        return _to_int
+    if annotation is float:
+        return _to_float
+    if annotation is str:
+        return _checked(str)
+    if annotation is type(None):
+        return _checked(type(None))
+    raise TypeError(f'Unsupported field type {annotation!r}')
+
+
+def _checked(expected: type) -> Callable[[Any], Any]:
+    """Build a function that checks the exact type of a value.
+
+    :param expected: The type
+    :type expected: type
+    :return: The function
+    :rtype: Callable[[Any], Any]
+    """
+    def check(value: Any) -> Any:
+        if type(value) is not expected:
+            raise TypeError(f'expected {expected.__name__}, got {type(value).__name__}')
+        return value
+
+    return check
+
+
+def _to_int(value: Any) -> int:
+    """Check that a value is an integer, converting integral floats.
+
+    :param value: The value
+    :type value: Any
+    :return: The integer
+    :rtype: int
+    """
+    if type(value) is int:
+        return value
+    if type(value) is float and value.is_integer():
+        return int(value)
+    raise TypeError(f'expected int, got {type(value).__name__} {value!r}')
+
+
+def _to_float(value: Any) -> float:
+    """Check that a value is a number, converting integers.
+
+    :param value: The value
+    :type value: Any
+    :return: The float
+    :rtype: float
+    """
+    if type(value) in (int, float):
+        return float(value)
+    raise TypeError(f'expected float, got {type(value).__name__}')
+
+
+def _union_coercer(options: Tuple[Any, ...]) -> Callable[[Any], Any]:
+    """Build a function that accepts a value of any of several types, trying them in order.
+
+    :param options: The types
+    :type options: Tuple[Any, ...]
+    :return: The function
+    :rtype: Callable[[Any], Any]
+    """
+    coercers = [_coercer(option) for option in options if option is not type(None)]
+    optional = type(None) in options
+
+    def coerce(value: Any) -> Any:
+        if value is None and optional:
+            return None
+        errors = []
+        for coercer in coercers:
+            try:
+                return coercer(value)
+            except (TypeError, ValueError) as e:
+                errors.append(str(e))
+        raise TypeError(' or '.join(errors) if errors else f'expected None, got {type(value).__name__}')
+
+    return coerce
+
+
+def _list_coercer(item: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Build a function that checks a list and converts its items.
+
+    :param item: The function for the items
+    :type item: Callable[[Any], Any]
+    :return: The function, which returns a new mutable list
+    :rtype: Callable[[Any], Any]
+    """
+    def coerce(value: Any) -> List[Any]:
+        if not isinstance(value, (list, tuple)):
+            raise TypeError(f'expected list, got {type(value).__name__}')
+        return [item(element) for element in value]
+
+    return coerce
+
+
+def _dict_coercer(value: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Build a function that checks a dict and converts its values.
+
+    :param value: The function for the values
+    :type value: Callable[[Any], Any]
+    :return: The function, which returns a new mutable dict
+    :rtype: Callable[[Any], Any]
+    """
+    def coerce(data: Any) -> Dict[str, Any]:
+        if not isinstance(data, dict):
+            raise TypeError(f'expected dict, got {type(data).__name__}')
+        return {key: value(element) for key, element in data.items()}
+
+    return coerce
+
+
+class _SchemaMeta(type):
+    """Turn the annotated class attributes of a schema dictionary into slots with a type and a default."""
+
+    def __new__(mcs, name: str, bases: Tuple[type, ...], namespace: Dict[str, Any], extra: Optional[str] = None):
+        inherited = {}
+        for base in reversed(bases):
+            inherited.update(getattr(base, '__fields__', {}))
+
+        declared = {}
+        for key, annotation in namespace.get('__annotations__', {}).items():
+            if _is_class_var(annotation):
+                continue
+            value = namespace.pop(key, MISSING)
+            declared[key] = value if isinstance(value, Field) else Field(default=value)
+
+        if extra is None:
+            extra = next((base.__extra__ for base in bases if hasattr(base, '__extra__')), 'allow')
+        if extra not in EXTRA_POLICIES:
+            raise ValueError(f'Unknown extra policy {extra!r}, expected one of {EXTRA_POLICIES}')
+
+        namespace['__slots__'] = tuple(namespace.get('__slots__', ())) + tuple(key for key in declared
+                                                                             if key not in inherited)
+        namespace['__extra__'] = extra
+        cls = super().__new__(mcs, name, bases, namespace)
+
+        hints = typing.get_type_hints(cls) if declared else {}
+        fields = dict(inherited)
+        coercers = dict(getattr(cls, '__coercers__', {}))
+        for key, declaration in declared.items():
+            fields[key] = declaration
+            coercers[key] = _coercer(annotation=hints[key])
+        cls.__fields__ = fields
+        cls.__coercers__ = coercers
+        return cls
+
+    def __init__(cls, name: str, bases: Tuple[type, ...], namespace: Dict[str, Any], extra: Optional[str] = None):
+        super().__init__(name, bases, namespace)
+
+
+class SchemaDict(IPFSDict, metaclass=_SchemaMeta):
+    """An IPFSDict with declared, typed fields that are stored in slots.
+
+    Fields are declared like the fields of a dataclass, as annotated class attributes with an optional default::
+
+        class Order(SchemaDict, extra='forbid'):
+            status: str
+            priority: int = 0
+            tags: List[str] = field(default_factory=list)
+
+    The values are validated and converted to the declared types once, when the dictionary is loaded: integral floats
+    become ints, ints become floats, and lists and dicts become mutable copies, so fields can be modified in place and
+    reading a field is a plain slot access. Supported types are str, int, float, bool, list, dict, List[T],
+    Dict[str, T], Optional[T], Union and Any. Fields without a default are required. Saving validates the fields again.
+
+    Keys that are not declared as fields are handled according to the extra policy of the class: 'allow' keeps them
+    as shared read-only attributes like IPFSDict does, 'ignore' drops them and 'forbid' rejects the data.
+
+    Instances still have a __dict__, because IPFSDict and dict do not declare __slots__. It stays empty unless there
+    are extra keys, but its pointer, and the memory of the dict subclass itself, limit the memory saved per record.
+
+    :raises SchemaError: If loaded or saved data does not match the fields
+    """
+
+    __slots__ = ('_chunk_threshold', '_compressor', '_index', '_cid')
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        for key, declaration in self.__fields__.items():
+            if not declaration.required:
+                object.__setattr__(self, key, declaration.make_default())
+        super(SchemaDict, self).__init__(*args, **kwargs)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        """Get the dictionary data: the fields that are set, in the order they are declared, and then the other data.
+
+        :return: The dictionary data
+        :rtype: List[Tuple[str, Any]]
+        """
+        return list(self._field_items()) + super(SchemaDict, self).items()
+
+    def _field_items(self) -> Iterator[Tuple[str, Any]]:
+        """Iterate over the fields that are set.
+
+        :return: An iterator over the names and values of the fields
+        :rtype: Iterator[Tuple[str, Any]]
+        """
+        for key in self.__fields__:
+            value = getattr(self, key, MISSING)
+            if value is not MISSING:
+                yield key, value
+
+    def _decode_payload(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the dictionary data of a payload, validated and converted to the types of the fields.
+
+        :param data: The payload loaded from IPFS
+        :type data: Dict[str, Any]
+        :return: The dictionary data, with the defaults of missing fields
+        :rtype: Dict[str, Any]
+        :raises SchemaError: If the data does not match the fields
+        """
+        return self._validate(data=super(SchemaDict, self)._decode_payload(data=data), loading=True)
+
+    def _encode_payload(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the payload to store for the dictionary data, after validating it.
+
+        :param data: The dictionary data
+        :type data: Dict[str, Any]
+        :return: The payload
+        :rtype: Dict[str, Any]
+        :raises SchemaError: If the data does not match the fields
+        """
+        return super(SchemaDict, self)._encode_payload(data=self._validate(data=data, loading=False))
+
+    def _validate(self, data: Dict[str, Any], loading: bool) -> Dict[str, Any]:
+        """Validate data against the fields and convert it to their types.
+
+        :param data: The dictionary data
+        :type data: Dict[str, Any]
+        :param loading: Whether the data is loaded, then missing fields get their defaults
+        :type loading: bool
+        :return: The validated data
+        :rtype: Dict[str, Any]
+        :raises SchemaError: If a required field is missing, a value has the wrong type, or an extra key is forbidden
+        """
+        cls = type(self)
+        result = {}
+        for key, declaration in cls.__fields__.items():
+            if key in data:
+                try:
+                    result[key] = cls.__coercers__[key](data[key])
+                except (TypeError, ValueError) as e:
+                    raise SchemaError(f'Invalid value of field {key!r} of {cls.__name__}: {e}')
+            elif not declaration.required:
+                if loading:
+                    result[key] = declaration.make_default()
+            else:
+                raise SchemaError(f'Missing required field {key!r} of {cls.__name__}')
+
+        extra = [key for key in data if key not in cls.__fields__]
+        if extra and cls.__extra__ == 'forbid':
+            raise SchemaError(f'Unknown keys {extra} for {cls.__name__}')
+        if cls.__extra__ == 'allow':
+            for key in extra:
+                result[key] = data[key]
+        return result
+
+
+class SchemaChain(SchemaDict, IPFSDictChain):
+    """An IPFSDictChain with declared, typed fields that are stored in slots, see SchemaDict.
+
+    The previous_cid of the chain is a field, so it is also allowed when other keys are forbidden.
+    """
+
+    __slots__ = ('_chain', '_shortcuts', '_checkpoint_interval', '_timestamps')
+
+    previous_cid: Optional[str] = None
@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import IPFS
+from .Compression import CODECS, Compressor
+from .IPFS import IPFSError, _decompressed, ipfs_cache, normalize_cid
+from .UnixFS import file_cid
+
+# The first bytes of a snapshot file
+SNAPSHOT_MAGIC = b'IPDCSNAP'
+SNAPSHOT_VERSION = 2
+
+# Magic, version, number of entries and length of the JSON encoded heads
+_HEADER = struct.Struct('<8sHII')
+# Length of the CID and length of the payload of an entry
+_ENTRY = struct.Struct('<HI')
+
+
+class SnapshotError(IPFSError):
+    """Custom exception for invalid or corrupted snapshot files."""
+    pass
+
+
+def save_snapshot(path: str, heads: Optional[Dict[str, str]] = None) -> int:
+    """Write the contents of the IPFS cache and the given heads to a snapshot file, for a fast restart.
+
+    Every entry holds a CID and the payload stored under it, encoded the way add_json() uploads it, so the CID can be
+    computed from the payload again when the snapshot is loaded. Compressed payloads are compressed again with the
+    default level of their codec. Entries whose payload can not be reproduced, such as payloads larger than one block
+    or compressed at another level, are left out and fetched from the daemon again on first use. In write-behind
+    mode, the queue is flushed first, so the snapshot never holds data that is not on the daemon. The file is
+    replaced atomically. Use load_snapshot() to load it again.
+
+    :param path: The path of the snapshot file
+    :type path: str
+    :param heads: CIDs to keep by name, e.g. the heads of the chains a worker has loaded, defaults to None
+    :type heads: Optional[Dict[str, str]], optional
+    :return: The number of entries written
+    :rtype: int
+    """
+    write_behind = IPFS._write_behind
+    if write_behind is not None:
+        write_behind.flush()
+
+    entries = [(cid, _payload(cid=cid, data=data)) for cid, data in ipfs_cache.items()]
+    entries = [(cid, content) for cid, content in entries if content is not None]
+    heads_data = json.dumps({name: normalize_cid(cid) for name, cid in (heads or {}).items()}).encode()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(descriptor, 'wb') as snapshot_file:
+            snapshot_file.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(entries), len(heads_data)))
+            snapshot_file.write(heads_data)
+            for cid, content in entries:
+                cid_bytes = cid.encode()
+                snapshot_file.write(_ENTRY.pack(len(cid_bytes), len(content)) + cid_bytes)
+                snapshot_file.write(content)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+    return len(entries)
+
+
+def load_snapshot(path: str) -> Dict[str, str]:
+    """Fill the IPFS cache from a snapshot file written by save_snapshot().
+
+    The file is memory-mapped and read sequentially. Every entry is verified against its CID before anything is added
+    to the cache, so a corrupted snapshot leaves the cache unchanged. Compressed payloads are decompressed.
+
+    :param path: The path of the snapshot file
+    :type path: str
+    :return: The heads stored with the snapshot, by name
+    :rtype: Dict[str, str]
+    :raises SnapshotError: If the file is not a snapshot, is truncated, or an entry does not match its CID
+    """
+    with open(path, 'rb') as snapshot_file:
+        if os.fstat(snapshot_file.fileno()).st_size < _HEADER.size:
+            raise SnapshotError(f'{path} is not a snapshot file')
+        with mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            heads, entries = _read_snapshot(data=data, path=path)
+
+    for cid, entry in entries:
+        ipfs_cache.set(cid, entry)
+    return heads
+
+
+def _read_snapshot(data: mmap.mmap, path: str) -> Tuple[Dict[str, str], List[Tuple[str, object]]]:
+    """Parse and verify the contents of a snapshot file.
+
+    :param data: The mapped file
+    :type data: mmap.mmap
+    :param path: The path of the file, for error messages
+    :type path: str
+    :return: The heads and the verified entries
+    :rtype: Tuple[Dict[str, str], List[Tuple[str, object]]]
+    :raises SnapshotError: If the file is invalid
+    """
+    magic, version, count, heads_length = _HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError(f'{path} is not a snapshot file')
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f'Unsupported snapshot version {version} in {path}')
+
+    offset = _HEADER.size
+    entries = []
+    try:
+        heads = json.loads(_read(data=data, offset=offset, length=heads_length))
+        offset += heads_length
+
+        for _ in range(count):
+            cid_length, content_length = _ENTRY.unpack_from(data, offset)
+            offset += _ENTRY.size
+            cid = _read(data=data, offset=offset, length=cid_length).decode()
+            offset += cid_length
+
+            content = _read(data=data, offset=offset, length=content_length)
+            offset += content_length
+            if file_cid(content) != cid:
+                raise SnapshotError(f'The data of {cid} in {path} does not match its CID')
+            entries.append((cid, _decompressed(cid=cid, data=json.loads(content))))
+    except SnapshotError:
+        raise
+    except (struct.error, ValueError, IPFSError) as e:
+        raise SnapshotError(f'Invalid snapshot file {path}: {e}')
+
+    if not isinstance(heads, dict):
+        raise SnapshotError(f'Invalid snapshot file {path}: the heads are not a mapping')
+
+    if offset != len(data):
+        raise SnapshotError(f'Invalid snapshot file {path}: unexpected data after the last entry')
+    return heads, entries
+
+
+def _payload(cid: str, data: Any) -> Optional[bytes]:
+    """Get the payload that add_json() uploaded for cached data, if it can be reproduced.
+
+    :param cid: The CID of the cached data
+    :type cid: str
+    :param data: The cached data, decompressed
+    :type data: Any
+    :return: The encoded payload whose CID is the given CID, or None if it can not be reproduced
+    :rtype: Optional[bytes]
+    """
+    content = json.dumps(data).encode()
+    if file_cid(content) == cid:
+        return content
+
+    if isinstance(data, dict):
+        for codec in CODECS:
+            compressed = Compressor(codec=codec, threshold=0).compress(data)
+            if compressed is not data:
+                content = json.dumps(compressed).encode()
+                if file_cid(content) == cid:
+                    return content
+    return None
+
+
+def _read(data: mmap.mmap, offset: int, length: int) -> bytes:
+    """Read bytes from the mapped file.
+
+    :param data: The mapped file
+    :type data: mmap.mmap
+    :param offset: The offset to read from
+    :type offset: int
+    :param length: The number of bytes to read
+    :type length: int
+    :return: The bytes
+    :rtype: bytes
+    :raises ValueError: If the file ends before the bytes
+    """
+    if offset + length > len(data):
+        raise ValueError('the file is truncated')
+    return data[offset:offset + length]
@@ -0,0 +1,178 @@
+import hashlib
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from .CID import DAG_PB, RAW, SHA2_256, b58encode, cid_codec, cid_from_bytes, decode_varint, encode_varint
+
+# The default chunk size of the IPFS daemon, files up to this size are stored in a single block
+CHUNK_SIZE = 262144
+
+# UnixFS node types
+UNIXFS_RAW = 0
+UNIXFS_DIRECTORY = 1
+UNIXFS_FILE = 2
+
+
+class PBLink:
+    """A link from a dag-pb node to another block.
+
+    :param cid: The binary CID of the linked block
+    :type cid: bytes
+    :param name: The name of the link
+    :type name: str
+    :param size: The cumulative size of the linked DAG
+    :type size: int
+    """
+
+    def __init__(self, cid: bytes, name: str = '', size: int = 0):
+        self.cid = cid
+        self.name = name
+        self.size = size
+
+
+def _fields(data: bytes) -> Iterator[Tuple[int, int, object]]:
+    """Iterate over the fields of a protobuf message.
+
+    :param data: The encoded message
+    :type data: bytes
+    :return: An iterator of (field number, wire type, value) tuples, with an int value for varints and bytes otherwise
+    :rtype: Iterator[Tuple[int, int, object]]
+    """
+    offset = 0
+    while offset < len(data):
+        key, offset = decode_varint(data, offset)
+        number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, offset = decode_varint(data, offset)
+        elif wire_type == 2:
+            length, offset = decode_varint(data, offset)
+            value = data[offset:offset + length]
+            if len(value) != length:
+                raise ValueError('Truncated protobuf field')
+            offset += length
+        elif wire_type == 1:
+            value, offset = data[offset:offset + 8], offset + 8
+        elif wire_type == 5:
+            value, offset = data[offset:offset + 4], offset + 4
+        else:
+            raise ValueError(f'Unsupported protobuf wire type {wire_type}')
+        yield number, wire_type, value
+
+
+def decode_pbnode(block: bytes) -> Tuple[List[PBLink], Optional[bytes]]:
+    """Decode a dag-pb node.
+
+    :param block: The encoded node
+    :type block: bytes
+    :return: The links of the node and its data
+    :rtype: Tuple[List[PBLink], Optional[bytes]]
+    """
+    links = []
+    data = None
+    for number, wire_type, value in _fields(block):
+        if number == 1 and wire_type == 2:
+            data = value
+        elif number == 2 and wire_type == 2:
+            link = PBLink(cid=b'')
+            for link_number, link_wire_type, link_value in _fields(value):
+                if link_number == 1 and link_wire_type == 2:
+                    link.cid = link_value
+                elif link_number == 2 and link_wire_type == 2:
+                    link.name = link_value.decode()
+                elif link_number == 3 and link_wire_type == 0:
+                    link.size = link_value
+            links.append(link)
+    return links, data
+
+
+def decode_unixfs(data: bytes) -> Tuple[int, bytes]:
+    """Decode the UnixFS data of a dag-pb node.
+
+    :param data: The encoded UnixFS data
+    :type data: bytes
+    :return: The UnixFS node type and the file data it contains
+    :rtype: Tuple[int, bytes]
+    """
+    node_type = None
+    file_data = b''
+    for number, wire_type, value in _fields(data):
+        if number == 1 and wire_type == 0:
+            node_type = value
+        elif number == 2 and wire_type == 2:
+            file_data = value
+    if node_type is None:
+        raise ValueError('UnixFS data has no type')
+    return node_type, file_data
+
+
+def iter_file(cid: bytes, get_block: Callable[[bytes], bytes]) -> Iterator[bytes]:
+    """Iterate over the content of a UnixFS file, in order.
+
+    :param cid: The binary CID of the root of the file
+    :type cid: bytes
+    :param get_block: A function returning the data of a block for its binary CID
+    :type get_block: Callable[[bytes], bytes]
+    :return: An iterator over the chunks of the file
+    :rtype: Iterator[bytes]
+    """
+    codec = cid_codec(cid)
+    block = get_block(cid)
+    if codec == RAW:
+        yield block
+        return
+    if codec != DAG_PB:
+        raise ValueError(f'Unsupported codec 0x{codec:x} for file {cid_from_bytes(cid)}')
+
+    links, data = decode_pbnode(block)
+    node_type, file_data = decode_unixfs(data or b'')
+    if node_type not in (UNIXFS_RAW, UNIXFS_FILE):
+        raise ValueError(f'{cid_from_bytes(cid)} is not a file')
+
+    if file_data:
+        yield file_data
+    for link in links:
+        yield from iter_file(cid=link.cid, get_block=get_block)
+
+
+def read_file(cid: bytes, get_block: Callable[[bytes], bytes]) -> bytes:
+    """Read the content of a UnixFS file.
+
+    :param cid: The binary CID of the root of the file
+    :type cid: bytes
+    :param get_block: A function returning the data of a block for its binary CID
+    :type get_block: Callable[[bytes], bytes]
+    :return: The content of the file
+    :rtype: bytes
+    """
+    return b''.join(iter_file(cid=cid, get_block=get_block))
+
+
+def encode_file_block(content: bytes) -> bytes:
+    """Encode file content as a single dag-pb block, the way the IPFS daemon adds small files.
+
+    :param content: The content of the file, at most CHUNK_SIZE bytes
+    :type content: bytes
+    :return: The encoded block
+    :rtype: bytes
+    :raises ValueError: If the content does not fit in a single block
+    """
+    if len(content) > CHUNK_SIZE:
+        raise ValueError(f'Content of {len(content)} bytes does not fit in a single block of {CHUNK_SIZE} bytes')
+
+    unixfs = b'\x08' + encode_varint(UNIXFS_FILE)
+    if content:
+        unixfs += b'\x12' + encode_varint(len(content)) + content
+    unixfs += b'\x18' + encode_varint(len(content))
+    return b'\x0a' + encode_varint(len(unixfs)) + unixfs
+
+
+def file_cid(content: bytes) -> Optional[str]:
+    """Compute the CIDv0 the IPFS daemon assigns to file content when it is added with the default settings.
+
+    :param content: The content of the file
+    :type content: bytes
+    :return: The CID, or None if the content does not fit in a single block
+    :rtype: Optional[str]
+    """
+    if len(content) > CHUNK_SIZE:
+        return None
+    return b58encode(bytes([SHA2_256, 32]) + hashlib.sha256(encode_file_block(content)).digest())
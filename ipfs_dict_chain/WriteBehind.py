@@ -0,0 +1,298 @@
+import asyncio
+import concurrent.futures
+import json
+import threading
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from . import IPFS
+from .Chunking import CHUNKS_KEY, is_chunk_reference
+from .IPFS import IPFSError, _client, _decompressed, ipfs_cache, normalize_cid
+from .UnixFS import file_cid
+
+if TYPE_CHECKING:
+    from multiaddr import Multiaddr
+
+# The keys of chain metadata that link to other states
+_LINK_KEYS = ('merge', 'base', 'skip')
+
+
+class WriteBehindQueue:
+    """Upload JSON data to IPFS in the background, so saving does not wait for the daemon.
+
+    The CID of the data is computed locally, the data is written to the cache and the upload is queued, so submit()
+    returns right away. A background thread uploads queued data concurrently over a single client. Data that links
+    to other queued data, through its previous_cid or chain metadata, is only uploaded after the data it links to,
+    so the history of a chain is always on the daemon before the state that refers to it.
+
+    A failed upload is removed from the cache, and the data that links to it is not uploaded but fails as well, so the
+    daemon never holds a state whose history is missing. Submitting data that links to a failed upload raises an
+    IPFSError, until the failed data is submitted again.
+
+    Data that is too large for its CID to be computed locally is also uploaded in the background, but submit() waits
+    for its upload to finish.
+
+    :param max_pending: The maximum number of queued uploads, submit() blocks while the queue is full, defaults to 1000
+    :type max_pending: int, optional
+    :param concurrency: The maximum number of concurrent uploads, defaults to 8
+    :type concurrency: int, optional
+    :param on_error: A function called with the CID, the data and the exception of every failed upload, defaults to None
+    :type on_error: Optional[Callable[[str, Dict, Exception], None]], optional
+    :param maddr: The multiaddress of the IPFS daemon, defaults to the connected daemon
+    :type maddr: Optional[Multiaddr], optional
+    """
+
+    def __init__(self, max_pending: int = 1000, concurrency: int = 8,
+                 on_error: Optional[Callable[[str, Dict, Exception], None]] = None, maddr: Optional['Multiaddr'] = None):
+        if max_pending < 1 or concurrency < 1:
+            raise ValueError('max_pending and concurrency must be at least 1')
+
+        self.on_error = on_error
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._failed = set()
+        self._errors = []
+        self._closed = False
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='ipfs-write-behind', daemon=True)
+        self._thread.start()
+
+        async def start() -> None:
+            self._client = _client(maddr=maddr)
+            self._concurrency = asyncio.Semaphore(concurrency)
+
+        asyncio.run_coroutine_threadsafe(start(), self._loop).result()
+
+    @property
+    def pending(self) -> int:
+        """The number of queued uploads that have not finished yet."""
+        with self._lock:
+            return len(self._pending)
+
+    def submit(self, data: Dict) -> str:
+        """Queue JSON data for upload and return its CID.
+
+        :param data: The JSON data to be added to IPFS.
+        :type data: Dict
+        :return: The Content Identifier (CID) the data will have.
+        :rtype: str
+        :raises IPFSError: If the queue is closed, the data links to data whose upload failed, or the data is too large
+                           to compute its CID and the upload fails
+        """
+        payload = json.dumps(data)
+        cid = file_cid(payload.encode())
+        # The data the way it will be read back, the links of compressed data are only visible after decompressing it
+        decompressed = _decompressed(cid=cid, data=json.loads(payload))
+
+        self._slots.acquire()
+        with self._lock:
+            if self._closed:
+                self._slots.release()
+                raise IPFSError('Can not add JSON data to IPFS: the write-behind queue is closed')
+
+            if cid is not None and cid in self._pending:
+                self._slots.release()
+                return cid
+
+            links = _links(decompressed)
+            failed = [link for link in links if link in self._failed]
+            if failed:
+                self._slots.release()
+                raise IPFSError(f'Can not add JSON data to IPFS: it links to {failed[0]}, whose upload failed')
+
+            self._failed.discard(cid)
+            dependencies = [self._pending[link] for link in links if link in self._pending]
+            future = concurrent.futures.Future()
+            if cid is not None:
+                self._pending[cid] = future
+                # Cache the data, so it can be loaded before it is uploaded
+                ipfs_cache.set(cid, decompressed)
+
+        asyncio.run_coroutine_threadsafe(self._upload(cid=cid, payload=payload, future=future,
+                                                      dependencies=dependencies), self._loop)
+
+        if cid is None:
+            return future.result()
+        return cid
+
+    async def _upload(self, cid: Optional[str], payload: str, future: concurrent.futures.Future,
+                      dependencies: List[concurrent.futures.Future]) -> None:
+        """Upload queued data once the data it links to has been uploaded.
+
+        :param cid: The locally computed CID, or None if it could not be computed
+        :type cid: Optional[str]
+        :param payload: The serialized JSON data
+        :type payload: str
+        :param future: The future to resolve with the CID when the upload has finished
+        :type future: concurrent.futures.Future
+        :param dependencies: The futures of queued uploads the data links to
+        :type dependencies: List[concurrent.futures.Future]
+        """
+        for dependency in dependencies:
+            await asyncio.wait([asyncio.wrap_future(dependency)])
+
+        data = json.loads(payload)
+        succeeded = False
+        try:
+            # Data that links to a failed upload is not uploaded, the daemon would hold a state without its history
+            for dependency in dependencies:
+                if dependency.exception() is not None:
+                    raise IPFSError(f'Not added to IPFS, it links to data whose upload failed: {dependency.exception()}')
+
+            async with self._concurrency:
+                response = await IPFS._call('Adding JSON data to IPFS', lambda: self._client.add_json(data=data))
+            uploaded_cid = response.get('Hash')
+            if cid is not None and uploaded_cid != cid:
+                raise IPFSError(f'IPFS daemon stored the data as {uploaded_cid} instead of {cid}')
+            if cid is None and uploaded_cid is not None:
+                ipfs_cache.set(uploaded_cid, _decompressed(cid=uploaded_cid, data=data))
+        except Exception as e:
+            error = e if isinstance(e, IPFSError) else IPFSError(f'Failed to add JSON data to IPFS: {e}')
+            if cid is not None:
+                ipfs_cache.delete(cid)
+            self._fail(cid=cid, data=data, error=error)
+            future.set_exception(error)
+        else:
+            succeeded = True
+            future.set_result(uploaded_cid)
+        finally:
+            with self._lock:
+                if cid is not None:
+                    self._pending.pop(cid, None)
+                    if not succeeded:
+                        self._failed.add(cid)
+            self._slots.release()
+
+    def _fail(self, cid: Optional[str], data: Dict, error: Exception) -> None:
+        """Report a failed upload to the error callback, or keep it for the next flush().
+
+        :param cid: The locally computed CID, or None if it could not be computed
+        :type cid: Optional[str]
+        :param data: The data that failed to upload
+        :type data: Dict
+        :param error: The exception of the failed upload
+        :type error: Exception
+        """
+        if self.on_error is None:
+            with self._lock:
+                self._errors.append((cid, error))
+            return
+
+        try:
+            self.on_error(cid, data, error)
+        except Exception:
+            # An error in the callback must not stop the worker
+            pass
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait until everything queued before the call has been uploaded.
+
+        :param timeout: The maximum number of seconds to wait, defaults to None for no limit
+        :type timeout: Optional[float], optional
+        :raises IPFSError: If uploads failed since the previous flush and there is no error callback, or on timeout
+        """
+        with self._lock:
+            futures = list(self._pending.values())
+
+        _, not_done = concurrent.futures.wait(futures, timeout=timeout)
+        if not_done:
+            raise IPFSError(f'Timed out waiting for {len(not_done)} queued uploads to IPFS')
+
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            details = ', '.join(f'{cid}: {error}' for cid, error in errors[:5])
+            raise IPFSError(f'{len(errors)} queued uploads to IPFS failed: {details}')
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush the queue, then stop the background thread and close the client.
+
+        :param timeout: The maximum number of seconds to wait for the flush, defaults to None for no limit
+        :type timeout: Optional[float], optional
+        :raises IPFSError: If the flush fails
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        try:
+            self.flush(timeout=timeout)
+        finally:
+            asyncio.run_coroutine_threadsafe(self._client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+
+
+def _links(data: Any) -> List[str]:
+    """Get the CIDs that JSON data saved by an IPFSDict or IPFSDictChain links to.
+
+    :param data: The JSON data
+    :type data: Any
+    :return: The normalized CIDs of the previous state, the states referenced by the chain metadata and the chunks
+        of chunked values
+    :rtype: List[str]
+    """
+    if not isinstance(data, dict):
+        return []
+
+    metadata = data.get('_chain')
+    links = [data.get('previous_cid')]
+    if isinstance(metadata, dict):
+        links.extend(metadata.get(key) for key in _LINK_KEYS)
+    for value in data.values():
+        if is_chunk_reference(value):
+            links.extend(value[CHUNKS_KEY])
+    return [normalize_cid(link) for link in links if isinstance(link, str)]
+
+
+_queue_lock = threading.Lock()
+
+
+def enable_write_behind(max_pending: int = 1000, concurrency: int = 8,
+                        on_error: Optional[Callable[[str, Dict, Exception], None]] = None) -> WriteBehindQueue:
+    """Switch add_json(), and with it every save(), to write-behind mode.
+
+    :param max_pending: The maximum number of queued uploads, saving blocks while the queue is full, defaults to 1000
+    :type max_pending: int, optional
+    :param concurrency: The maximum number of concurrent uploads, defaults to 8
+    :type concurrency: int, optional
+    :param on_error: A function called with the CID, the data and the exception of every failed upload, defaults to None
+    :type on_error: Optional[Callable[[str, Dict, Exception], None]], optional
+    :return: The queue
+    :rtype: WriteBehindQueue
+    :raises IPFSError: If write-behind mode is already enabled
+    """
+    with _queue_lock:
+        if IPFS._write_behind is not None:
+            raise IPFSError('Write-behind mode is already enabled')
+        IPFS._write_behind = WriteBehindQueue(max_pending=max_pending, concurrency=concurrency, on_error=on_error)
+        return IPFS._write_behind
+
+
+def disable_write_behind(timeout: Optional[float] = None) -> None:
+    """Flush the queue and switch add_json() back to uploading synchronously.
+
+    :param timeout: The maximum number of seconds to wait for the flush, defaults to None for no limit
+    :type timeout: Optional[float], optional
+    :raises IPFSError: If the flush fails
+    """
+    with _queue_lock:
+        queue, IPFS._write_behind = IPFS._write_behind, None
+
+    if queue is not None:
+        queue.close(timeout=timeout)
+
+
+def flush(timeout: Optional[float] = None) -> None:
+    """Wait until everything saved so far in write-behind mode has been uploaded. Does nothing in the default mode.
+
+    :param timeout: The maximum number of seconds to wait, defaults to None for no limit
+    :type timeout: Optional[float], optional
+    :raises IPFSError: If uploads failed since the previous flush and there is no error callback, or on timeout
+    """
+    queue = IPFS._write_behind
+    if queue is not None:
+        queue.flush(timeout=timeout)
@@ -0,0 +1,74 @@
+import io
+import unittest
+from ipfs_dict_chain.CAR import CARError, CARReader, CARWriter
+from ipfs_dict_chain.CID import cid_to_bytes
+from ipfs_dict_chain.IPFS import IPFSError
+from ipfs_dict_chain.UnixFS import encode_file_block, file_cid
+
+
+def make_block(content: bytes):
+    return cid_to_bytes(file_cid(content)), encode_file_block(content)
+
+
+class TestCAR(unittest.TestCase):
+
+    def setUp(self):
+        self.blocks = [make_block(f'{{"index": {i}}}'.encode()) for i in range(3)]
+
+    def write_car(self, blocks, roots=None):
+        stream = io.BytesIO()
+        writer = CARWriter(stream=stream, roots=roots if roots is not None else [blocks[0][0]])
+        for cid, data in blocks:
+            writer.write_block(cid=cid, data=data)
+        return stream.getvalue()
+
+    def test_roundtrip(self):
+        car = self.write_car(self.blocks)
+        reader = CARReader(stream=io.BytesIO(car))
+        self.assertEqual(reader.roots, [self.blocks[0][0]])
+        self.assertEqual(reader.root_cids(), [file_cid(b'{"index": 0}')])
+        self.assertEqual(list(reader), self.blocks)
+
+    def test_header_matches_reference(self):
+        """The header is the canonical dag-cbor encoding used by the IPFS daemon"""
+        root = self.blocks[0][0]
+        car = self.write_car([], roots=[root])
+        expected_header = b'\xa2eroots\x81\xd8\x2a\x58\x23\x00' + root + b'gversion\x01'
+        self.assertEqual(car, bytes([len(expected_header)]) + expected_header)
+
+    def test_duplicate_blocks_are_written_once(self):
+        stream = io.BytesIO()
+        writer = CARWriter(stream=stream, roots=[self.blocks[0][0]])
+        self.assertTrue(writer.write_block(*self.blocks[0]))
+        self.assertFalse(writer.write_block(*self.blocks[0]))
+        self.assertEqual(len(writer), 1)
+        self.assertEqual(len(list(CARReader(stream=io.BytesIO(stream.getvalue())))), 1)
+
+    def test_corrupted_block(self):
+        car = bytearray(self.write_car(self.blocks))
+        car[-2] ^= 0xff
+        reader = CARReader(stream=io.BytesIO(bytes(car)))
+        with self.assertRaises(CARError):
+            list(reader)
+
+        # Verification can be disabled
+        reader = CARReader(stream=io.BytesIO(bytes(car)), verify=False)
+        self.assertEqual(len(list(reader)), 3)
+
+    def test_truncated_data(self):
+        car = self.write_car(self.blocks)
+        with self.assertRaises(CARError):
+            list(CARReader(stream=io.BytesIO(car[:-3])))
+
+    def test_invalid_header(self):
+        with self.assertRaises(CARError):
+            CARReader(stream=io.BytesIO(b''))
+        with self.assertRaises(CARError):
+            CARReader(stream=io.BytesIO(b'\x03\xa1\x61\x61'))
+
+    def test_car_error_is_ipfs_error(self):
+        self.assertTrue(issubclass(CARError, IPFSError))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 import pytest
-from ipfs_dict_chain.CID import CID
+from ipfs_dict_chain.CID import (CID, b58decode, b58encode, cid_codec, cid_from_bytes, cid_to_bytes, decode_varint,
+                                 encode_varint, verify_block, DAG_PB, RAW)
 
 
 def test_init_valid():
@@ -115,3 +116,58 @@ def test_collection_usage():
     sorted_cids = sorted(cid_set, key=lambda x: x.value)
     assert len(sorted_cids) == 3
     assert sorted_cids[0] == min(sorted_cids, key=lambda x: x.value)
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 16384, 2 ** 32, 2 ** 63 - 1])
+def test_varint_roundtrip(value):
+    encoded = encode_varint(value)
+    assert decode_varint(encoded) == (value, len(encoded))
+
+def test_varint_invalid():
+    with pytest.raises(ValueError):
+        encode_varint(-1)
+    with pytest.raises(ValueError):
+        decode_varint(b'\x80')
+
+def test_base58_roundtrip():
+    for data in [b'', b'\0', b'\0\0abc', b'hello world', bytes(range(256))]:
+        assert b58decode(b58encode(data)) == data
+    with pytest.raises(ValueError):
+        b58decode('0OIl')
+
+def test_cid_bytes_v0():
+    value = 'QmV5mPAcGoqegJnzFheED2pnef96633jSjimR2SSgu7ZV5'
+    data = cid_to_bytes(value)
+    assert len(data) == 34
+    assert cid_from_bytes(data) == value
+    assert cid_to_bytes('/ipfs/' + value) == data
+    assert cid_codec(data) == DAG_PB
+
+def test_cid_bytes_v1():
+    value = 'bafkreideggsfzc345ldv5gpetasar6tssltrlif23wnwkpgwlv2ycuvgfq'
+    data = cid_to_bytes(value)
+    assert data[:2] == bytes([1, RAW])
+    assert cid_from_bytes(data) == value
+    assert cid_codec(data) == RAW
+
+def test_verify_block():
+    import hashlib
+    block = b'some block data'
+    cid = bytes([1, RAW, 0x12, 32]) + hashlib.sha256(block).digest()
+    verify_block(cid, block)
+    with pytest.raises(ValueError):
+        verify_block(cid, block + b'!')
+    with pytest.raises(ValueError):
+        verify_block(bytes([1, RAW, 0x1b, 32]) + b'\0' * 32, block)
+
+
+def test_verify_block_truncated_digest():
+    import hashlib
+    block = b'some block data'
+    digest = hashlib.sha256(block).digest()
+    for length in (0, 1, 20):
+        with pytest.raises(ValueError, match='digest length'):
+            verify_block(bytes([1, RAW, 0x12, length]) + digest[:length], block)
+    with pytest.raises(ValueError, match='digest length'):
+        verify_block(bytes([1, RAW, 0x13, 32]) + hashlib.sha512(block).digest()[:32], block)
+    verify_block(bytes([1, RAW, 0x13, 64]) + hashlib.sha512(block).digest(), block)
+    verify_block(bytes([1, RAW, 0x00, len(block)]) + block, block)
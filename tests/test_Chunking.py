@@ -0,0 +1,165 @@
+import io
+import json
+import random
+import unittest
+from unittest.mock import patch
+from ipfs_dict_chain.CAR import CARReader
+from ipfs_dict_chain.CID import cid_to_bytes
+from ipfs_dict_chain.Chunking import CHUNKS_KEY, chunk_boundaries, chunk_text, decode_values, encode_values, is_chunk_reference
+from ipfs_dict_chain.IPFS import IPFSError, ipfs_cache
+from ipfs_dict_chain.IPFSDict import IPFSDict
+from ipfs_dict_chain.IPFSDictChain import IPFSDictChain
+from ipfs_dict_chain.UnixFS import file_cid
+from ipfs_dict_chain.WriteBehind import _links
+
+
+def fake_add_json(data, maddr=None):
+    """Store data in the cache under the CID the IPFS daemon would assign, instead of adding it to IPFS."""
+    cid = file_cid(json.dumps(data).encode())
+    ipfs_cache.set(cid, json.loads(json.dumps(data)))
+    return cid
+
+
+def random_text(length, seed=1):
+    generator = random.Random(seed)
+    return ''.join(generator.choice('abcdefghij klmnopqrstuvwxyz\né€😀') for _ in range(length))
+
+
+class TestChunkBoundaries(unittest.TestCase):
+
+    def test_sizes(self):
+        data = random_text(200000).encode()
+        boundaries = chunk_boundaries(data, min_size=1024, average_size=4096, max_size=8192)
+        self.assertEqual(boundaries[-1], len(data))
+        sizes = [end - start for start, end in zip([0] + boundaries, boundaries)]
+        self.assertTrue(all(1024 <= size <= 8192 for size in sizes[:-1]))
+        self.assertEqual(boundaries, chunk_boundaries(data, min_size=1024, average_size=4096, max_size=8192))
+
+    def test_invalid_sizes(self):
+        with self.assertRaises(ValueError):
+            chunk_boundaries(b'data', min_size=0)
+        with self.assertRaises(ValueError):
+            chunk_boundaries(b'data', min_size=8192, average_size=4096)
+
+    def test_edits_only_change_nearby_chunks(self):
+        text = random_text(300000)
+        chunks = chunk_text(text)
+        appended = chunk_text(text + 'more text' * 100)
+        inserted = chunk_text(text[:150000] + 'inserted' + text[150000:])
+
+        self.assertEqual(''.join(chunks), text)
+        self.assertEqual(appended[:len(chunks) - 1], chunks[:-1])
+        self.assertLessEqual(len(set(inserted) - set(chunks)), 2)
+
+    def test_chunks_are_valid_text(self):
+        text = '€' * 100000
+        chunks = chunk_text(text, min_size=1000, average_size=2048, max_size=4096)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), text)
+
+
+@patch('ipfs_dict_chain.Chunking.add_json', side_effect=fake_add_json)
+class TestChunkedValues(unittest.TestCase):
+
+    def tearDown(self):
+        ipfs_cache.clear()
+
+    def test_encode_and_decode(self, mock_add_json):
+        data = {'small': 'x' * 100, 'large': random_text(100000), 'number': 1}
+        encoded = encode_values(data, threshold=1000)
+        self.assertEqual(encoded['small'], data['small'])
+        self.assertTrue(is_chunk_reference(encoded['large']))
+        self.assertEqual(decode_values(encoded), data)
+        self.assertIs(encode_values({'small': 'x'}, threshold=1000)['small'], 'x')
+
+    def test_unchanged_chunks_are_not_uploaded_again(self, mock_add_json):
+        text = random_text(200000)
+        first = encode_values({'text': text}, threshold=1000)
+        calls = mock_add_json.call_count
+
+        second = encode_values({'text': text + 'appended'}, threshold=1000)
+        self.assertLessEqual(mock_add_json.call_count - calls, 2)
+        self.assertEqual(first['text'][CHUNKS_KEY][:-1], second['text'][CHUNKS_KEY][:len(first['text'][CHUNKS_KEY]) - 1])
+
+    def test_decode_fetches_only_missing_chunks(self, mock_add_json):
+        encoded = encode_values({'text': random_text(200000)}, threshold=1000)
+        cids = encoded['text'][CHUNKS_KEY]
+        payloads = {cid: ipfs_cache.get(cid) for cid in cids}
+        ipfs_cache.delete(cids[0])
+
+        with patch('ipfs_dict_chain.IPFS._get_json_many', side_effect=lambda cids, concurrency: {cid: payloads[cid] for cid in cids}) as mock_get_json_many:
+            decode_values(encoded)
+        self.assertEqual(mock_get_json_many.call_args.kwargs['cids'], [cids[0]])
+
+    def test_invalid_chunk(self, mock_add_json):
+        cid = fake_add_json({'not a chunk': True})
+        with self.assertRaises(IPFSError):
+            decode_values({'text': {CHUNKS_KEY: [cid]}})
+
+    def test_ipfs_dict(self, mock_add_json):
+        with patch('ipfs_dict_chain.IPFSDict.add_json', side_effect=fake_add_json):
+            ipfs_dict = IPFSDict(chunk_threshold=1000)
+            ipfs_dict.text = random_text(50000)
+            cid = ipfs_dict.save()
+
+        self.assertTrue(is_chunk_reference(ipfs_cache.get(cid)['text']))
+        self.assertEqual(IPFSDict(cid=cid).text, ipfs_dict.text)
+        with self.assertRaises(ValueError):
+            IPFSDict(chunk_threshold=0)
+
+    def test_chain(self, mock_add_json):
+        """Versions of an append-heavy document share their unchanged chunks"""
+        with patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=fake_add_json):
+            chain = IPFSDictChain(checkpoint_interval=4, chunk_threshold=1000)
+            chain.log = random_text(100000)
+            chain.title = 'log'
+            for i in range(6):
+                chain.log += f'entry {i}\n' * 20
+                chain.save()
+            uploads = mock_add_json.call_count
+
+            chain.title = 'renamed'
+            chain.save()
+        self.assertEqual(mock_add_json.call_count, uploads)
+        self.assertEqual(ipfs_cache.get(chain.cid())['log'], ipfs_cache.get(chain.previous_cid)['log'])
+
+        loaded = IPFSDictChain(cid=chain.cid())
+        self.assertEqual(loaded.log, chain.log)
+        self.assertEqual(loaded.get_previous_states()[0]['log'], chain.log)
+        self.assertEqual(IPFSDictChain.diff(chain.previous_cid, chain.cid()), {'title': {'old': 'log', 'new': 'renamed'}})
+
+        history = list(loaded.key_history('log'))
+        self.assertEqual(len(history), 6)
+        self.assertEqual(history[0][1], chain.log)
+
+    def test_chain_export_and_import(self, mock_add_json):
+        """The chunks of chunked values are exported with the states and load after an import"""
+        with patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=fake_add_json):
+            chain = IPFSDictChain(chunk_threshold=1000)
+            chain.log = random_text(50000)
+            chain.save()
+            chain.log += 'appended\n' * 20
+            chain.save()
+
+        chunk_cids = {cid for state_cid in (chain.cid(), chain.previous_cid)
+                      for cid in ipfs_cache.get(state_cid)['log'][CHUNKS_KEY]}
+        stream = io.BytesIO()
+        chain.export_car(stream)
+        blocks = dict(CARReader(stream=io.BytesIO(stream.getvalue())))
+        self.assertEqual(set(blocks), {cid_to_bytes(cid) for cid in chunk_cids | {chain.cid(), chain.previous_cid}})
+
+        ipfs_cache.clear()
+        stream.seek(0)
+        with patch('ipfs_dict_chain.IPFSDictChain.dag_import'), \
+                patch('ipfs_dict_chain.IPFS._client', side_effect=AssertionError('request to the daemon')):
+            imported = IPFSDictChain.import_car(stream)
+            self.assertEqual(imported.log, chain.log)
+            self.assertEqual(imported.get_previous_states()[0]['log'], random_text(50000))
+
+    def test_write_behind_links(self, mock_add_json):
+        encoded = encode_values({'text': random_text(50000), 'previous_cid': None}, threshold=1000)
+        self.assertEqual(_links(encoded), encoded['text'][CHUNKS_KEY])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from ipfs_dict_chain.CompactState import CompactState, KeyTable
+from ipfs_dict_chain.FrozenDict import FrozenDict, freeze
+
+
+class TestCompactState(unittest.TestCase):
+
+    def setUp(self):
+        self.key_table = KeyTable()
+
+    def test_mapping(self):
+        state = CompactState.from_dict(data={'a': 1, 'b': [2]}, key_table=self.key_table)
+        self.assertEqual(state['a'], 1)
+        self.assertEqual(state.get('missing', 'default'), 'default')
+        self.assertIn('b', state)
+        self.assertEqual(list(state), ['a', 'b'])
+        self.assertEqual(len(state), 2)
+        self.assertEqual(state, {'a': 1, 'b': [2]})
+        self.assertEqual({'a': 1, 'b': [2]}, state)
+        self.assertNotEqual(state, {'a': 1})
+        with self.assertRaises(KeyError):
+            state['missing']
+
+    def test_slots(self):
+        state = CompactState.from_dict(data={'a': 1}, key_table=self.key_table)
+        self.assertFalse(hasattr(state, '__dict__'))
+        with self.assertRaises(TypeError):
+            state['a'] = 2
+
+    def test_shared_keys(self):
+        first = CompactState.from_dict(data={'a': 1, 'b': 2}, key_table=self.key_table)
+        second = CompactState.from_dict(data={'a': 3, 'b': 4}, key_table=self.key_table)
+        third = CompactState.from_dict(data={'b': 4, 'a': 3}, key_table=self.key_table)
+        self.assertIs(first._keys, second._keys)
+        self.assertIs(first._index, second._index)
+        self.assertIsNot(first._keys, third._keys)
+        self.assertEqual(second, third)
+        self.assertEqual(len(self.key_table), 2)
+
+    def test_shared_values(self):
+        """Values that did not change are shared with the adjacent version"""
+        newer = CompactState.from_dict(data=freeze({'same': {'nested': [1, 2]}, 'changed': 1, 'number': 1}),
+                                       key_table=self.key_table)
+        older = CompactState.from_dict(data=freeze({'same': {'nested': [1, 2]}, 'changed': 2, 'number': 1.0}),
+                                       key_table=self.key_table, adjacent=newer)
+        self.assertIs(older['same'], newer['same'])
+        self.assertEqual(older['changed'], 2)
+        self.assertIsInstance(older['number'], float)
+
+    def test_to_dict(self):
+        state = CompactState.from_dict(data=freeze({'a': {'b': [1]}}), key_table=self.key_table)
+        self.assertIsInstance(state['a'], FrozenDict)
+        data = state.to_dict()
+        data['a']['b'].append(2)
+        self.assertEqual(state['a'], {'b': [1]})
+
+    def test_invalid_values(self):
+        keys, index = self.key_table.intern(('a', 'b'))
+        with self.assertRaises(ValueError):
+            CompactState(keys=keys, index=index, values=(1,))
+
+
+if __name__ == '__main__':
+    unittest.main()
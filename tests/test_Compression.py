@@ -0,0 +1,156 @@
+import asyncio
+import json
+import unittest
+from ipfs_dict_chain.Compression import COMPRESSED_KEY, Compressor, decompress, get_compressor, is_compressed
+from ipfs_dict_chain.IPFS import IPFSError, add_json, get_file_content, get_json, get_json_keys, ipfs_cache
+from ipfs_dict_chain.IPFSDict import IPFSDict
+from ipfs_dict_chain.IPFSDictChain import IPFSDictChain
+from ipfs_dict_chain.WriteBehind import disable_write_behind, enable_write_behind, flush
+
+
+def stored_json(cid):
+    """Get the JSON document stored in IPFS, bypassing the cache and decompression."""
+    return json.loads(asyncio.run(get_file_content(cid)))
+
+
+class TestCompressor(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {'records': [{'id': i, 'name': f'user {i}', 'active': i % 2 == 0} for i in range(200)]}
+
+    def test_compress_and_decompress(self):
+        for codec in ('zlib', 'lzma'):
+            payload = Compressor(codec=codec, level=9).compress(data=self.data)
+            self.assertTrue(is_compressed(payload))
+            self.assertEqual(payload[COMPRESSED_KEY]['codec'], codec)
+            self.assertLess(len(json.dumps(payload)), len(json.dumps(self.data)) / 4)
+            self.assertEqual(decompress(json.loads(json.dumps(payload))), self.data)
+
+    def test_small_and_incompressible_data_is_not_compressed(self):
+        self.assertIs(Compressor(threshold=1000000).compress(data=self.data), self.data)
+
+        data = {'key': 'value'}
+        self.assertIs(Compressor(threshold=0).compress(data=data), data)
+        self.assertIs(decompress(data), data)
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            Compressor(codec='gzip')
+        with self.assertRaises(ValueError):
+            Compressor(level=10)
+
+    def test_get_compressor(self):
+        compressor = Compressor(codec='lzma')
+        self.assertIs(get_compressor(compression=compressor), compressor)
+        self.assertIsNone(get_compressor(compression=None))
+        self.assertEqual(get_compressor(compression='lzma').codec, 'lzma')
+
+    def test_invalid_payload(self):
+        with self.assertRaises(ValueError):
+            decompress({COMPRESSED_KEY: {'codec': 'zlib'}})
+        with self.assertRaises(ValueError):
+            decompress({COMPRESSED_KEY: {'codec': 'unknown', 'data': ''}})
+
+
+class TestCompressedPayloads(unittest.TestCase):
+
+    def setUp(self):
+        self.compressor = Compressor(threshold=100)
+
+    def tearDown(self):
+        disable_write_behind()
+        ipfs_cache.clear()
+
+    def test_ipfs_dict(self):
+        ipfs_dict = IPFSDict(compression=self.compressor)
+        ipfs_dict.text = 'compressible ' * 100
+        ipfs_dict.number = 1
+        cid = ipfs_dict.save()
+        self.assertTrue(is_compressed(stored_json(cid)))
+
+        # Compressed payloads are detected on load, the cache holds the decompressed data
+        self.assertEqual(get_json(cid), {'text': 'compressible ' * 100, 'number': 1})
+        ipfs_cache.clear()
+        loaded = IPFSDict(cid=cid)
+        self.assertEqual(loaded.text, 'compressible ' * 100)
+        self.assertEqual(loaded.number, 1)
+
+    def test_get_json_keys(self):
+        ipfs_dict = IPFSDict(compression=self.compressor)
+        ipfs_dict.text = 'compressible ' * 100
+        ipfs_dict.number = 1
+        cid = ipfs_dict.save()
+
+        ipfs_cache.clear()
+        self.assertEqual(get_json_keys(cid, ['number', 'missing']), {'number': 1})
+        self.assertIn(cid, ipfs_cache)
+
+    def test_corrupt_payload(self):
+        cid = add_json(data={COMPRESSED_KEY: {'codec': 'zlib', 'data': 'invalid'}})
+        ipfs_cache.clear()
+        with self.assertRaises(IPFSError):
+            get_json(cid)
+
+    def test_chain(self):
+        chain = IPFSDictChain(compression=self.compressor, shortcuts=True, checkpoint_interval=3)
+        for i in range(6):
+            chain.value = i
+            chain.text = f'version {i} ' + 'compressible ' * 100
+            chain.save()
+        self.assertTrue(is_compressed(stored_json(chain.cid())))
+
+        ipfs_cache.clear()
+        loaded = IPFSDictChain(cid=chain.cid())
+        self.assertEqual(loaded.value, 5)
+        self.assertEqual([state['value'] for state in loaded.get_previous_states()], [4, 3, 2, 1, 0])
+        self.assertEqual(loaded.at(depth=4).value, 1)
+
+        ipfs_cache.clear()
+        self.assertEqual([value for _, value in loaded.key_history('value')], [5, 4, 3, 2, 1, 0])
+
+    def test_uncompressed_chain_loads_compressed_states(self):
+        chain = IPFSDictChain()
+        chain.text = 'compressible ' * 100
+        chain.save()
+        compressed = IPFSDictChain(cid=chain.cid(), compression=self.compressor)
+        compressed.text = 'changed ' * 100
+        compressed.save()
+
+        ipfs_cache.clear()
+        loaded = IPFSDictChain(cid=compressed.cid())
+        self.assertEqual(loaded.text, 'changed ' * 100)
+        self.assertEqual(loaded.get_previous_states()[0]['text'], 'compressible ' * 100)
+
+    def test_compact(self):
+        chain = IPFSDictChain()
+        for i in range(4):
+            chain.value = i
+            chain.text = 'compressible ' * 100
+            chain.save()
+
+        mapping = IPFSDictChain.compact(cid=chain.cid(), compression=self.compressor)
+        head = mapping[chain.cid()]
+        self.assertTrue(is_compressed(stored_json(head)))
+
+        ipfs_cache.clear()
+        self.assertEqual(IPFSDictChain.diff(chain.cid(), head), {})
+        self.assertEqual([state['value'] for state in IPFSDictChain(cid=head).get_previous_states()], [2, 1, 0])
+
+    def test_write_behind(self):
+        enable_write_behind()
+        chain = IPFSDictChain(compression=self.compressor)
+        for i in range(3):
+            chain.value = i
+            chain.text = 'compressible ' * 100
+            chain.save()
+
+        # Queued states are cached decompressed, so they can be loaded before they are uploaded
+        self.assertEqual(IPFSDictChain(cid=chain.cid()).value, 2)
+        flush()
+
+        ipfs_cache.clear()
+        self.assertEqual([state['value'] for state in IPFSDictChain(cid=chain.cid()).get_previous_states()], [1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import copy
+import json
+import pickle
+import unittest
+from ipfs_dict_chain.FrozenDict import FrozenDict, FrozenList, freeze, thaw
+
+
+class TestFrozenDict(unittest.TestCase):
+
+    def setUp(self):
+        self.data = {
+            'string': 'value',
+            'list': [1, 2, {'nested': [3, 4]}],
+            'dict': {'a': {'b': 'c'}},
+        }
+
+    def test_freeze(self):
+        frozen = freeze(self.data)
+        self.assertIsInstance(frozen, FrozenDict)
+        self.assertIsInstance(frozen['list'], FrozenList)
+        self.assertIsInstance(frozen['list'][2], FrozenDict)
+        self.assertIsInstance(frozen['list'][2]['nested'], FrozenList)
+        self.assertIsInstance(frozen['dict']['a'], FrozenDict)
+
+    def test_freeze_is_idempotent(self):
+        frozen = freeze(self.data)
+        self.assertIs(freeze(frozen), frozen)
+
+    def test_equality_with_plain_data(self):
+        frozen = freeze(self.data)
+        self.assertEqual(frozen, self.data)
+        self.assertEqual(self.data, frozen)
+        self.assertEqual(frozen['list'], [1, 2, {'nested': [3, 4]}])
+
+    def test_json_serialization(self):
+        self.assertEqual(json.dumps(freeze(self.data)), json.dumps(self.data))
+
+    def test_dict_is_read_only(self):
+        frozen = freeze(self.data)
+        mutations = [
+            lambda: frozen.__setitem__('key', 'value'),
+            lambda: frozen.__delitem__('string'),
+            lambda: frozen.update({'key': 'value'}),
+            lambda: frozen.setdefault('key', 'value'),
+            lambda: frozen.pop('string'),
+            lambda: frozen.popitem(),
+            lambda: frozen.clear(),
+            lambda: frozen.__ior__({'key': 'value'}),
+            lambda: frozen['dict']['a'].__setitem__('b', 'd'),
+        ]
+        for mutation in mutations:
+            with self.assertRaises(TypeError):
+                mutation()
+        self.assertEqual(frozen, self.data)
+
+    def test_list_is_read_only(self):
+        frozen = freeze(self.data)['list']
+        mutations = [
+            lambda: frozen.append(5),
+            lambda: frozen.extend([5]),
+            lambda: frozen.insert(0, 5),
+            lambda: frozen.pop(),
+            lambda: frozen.remove(1),
+            lambda: frozen.clear(),
+            lambda: frozen.sort(),
+            lambda: frozen.reverse(),
+            lambda: frozen.__setitem__(0, 5),
+            lambda: frozen.__delitem__(0),
+            lambda: frozen.__iadd__([5]),
+            lambda: frozen.__imul__(2),
+        ]
+        for mutation in mutations:
+            with self.assertRaises(TypeError):
+                mutation()
+        self.assertEqual(frozen, [1, 2, {'nested': [3, 4]}])
+
+    def test_thaw(self):
+        frozen = freeze(self.data)
+        thawed = thaw(frozen)
+        self.assertEqual(thawed, self.data)
+        self.assertIs(type(thawed), dict)
+        self.assertIs(type(thawed['list']), list)
+        self.assertIs(type(thawed['list'][2]['nested']), list)
+
+        thawed['list'][2]['nested'].append(5)
+        self.assertEqual(frozen['list'][2]['nested'], [3, 4])
+
+    def test_pickle_and_copy(self):
+        frozen = freeze(self.data)
+        for clone in [pickle.loads(pickle.dumps(frozen)), copy.copy(frozen), copy.deepcopy(frozen)]:
+            self.assertEqual(clone, frozen)
+            self.assertIsInstance(clone, FrozenDict)
+
+    def test_repr(self):
+        self.assertEqual(repr(freeze({'a': [1]})), "FrozenDict({'a': FrozenList([1])})")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import io
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ipfs_dict_chain.CAR import CARError, CARWriter
+from ipfs_dict_chain.CID import cid_to_bytes
+from ipfs_dict_chain.Gateway import GatewayReader, current_gateway, use_gateway, use_rpc, verified_content
+from ipfs_dict_chain.IPFS import (IPFSError, IPFSNotFoundError, IPFSTimeoutError, add_json, deadline, get_json,
+                                  get_json_keys, ipfs_cache)
+from ipfs_dict_chain.UnixFS import encode_file_block, file_cid
+
+
+def car_for(content, corrupt=False, block=True):
+    """Create the CAR a trustless gateway returns for a single-block file."""
+    cid = file_cid(content)
+    data = encode_file_block(content)
+    if corrupt:
+        data = data[:-1] + bytes([data[-1] ^ 1])
+    stream = io.BytesIO()
+    writer = CARWriter(stream=stream, roots=[cid_to_bytes(cid)])
+    if block:
+        writer.write_block(cid=cid_to_bytes(cid), data=data)
+    return cid, stream.getvalue()
+
+
+class FakeGateway(ThreadingHTTPServer):
+    """A local HTTP gateway that serves CARs and counts connections and requests."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), GatewayHandler)
+        self.cars = {}
+        self.connections = 0
+        self.requests = []
+        self.failures = []
+        self.delay = 0.0
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('Accept')))
+        cid = self.path.split('?')[0].rsplit('/', 1)[-1]
+        car = self.server.cars.get(cid)
+        status, body = (200, car) if car is not None else (404, b'not found')
+        if self.server.failures:
+            status, body = self.server.failures.pop(0), b'busy'
+        time.sleep(self.server.delay)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/vnd.ipld.car')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGateway(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = FakeGateway()
+
+    def tearDown(self):
+        use_rpc()
+        self.gateway.stop()
+        ipfs_cache.clear()
+
+    def serve(self, content, **kwargs):
+        cid, car = car_for(content, **kwargs)
+        self.gateway.cars[cid] = car
+        return cid
+
+    def test_verified_content(self):
+        cid, car = car_for(b'{"key": "value"}')
+        self.assertEqual(verified_content(cid=cid, car=car), b'{"key": "value"}')
+
+        with self.assertRaises(CARError):
+            verified_content(cid=cid, car=car_for(b'{"key": "value"}', corrupt=True)[1])
+        with self.assertRaises(CARError):
+            verified_content(cid=cid, car=car_for(b'{"key": "value"}', block=False)[1])
+        with self.assertRaises(CARError):
+            verified_content(cid=cid, car=car_for(b'{"other": "value"}')[1])
+
+    def test_cat_reuses_connections(self):
+        cids = [self.serve(json.dumps({'n': i}).encode()) for i in range(5)]
+        reader = GatewayReader(urls=[self.gateway.url])
+        for i, cid in enumerate(cids):
+            self.assertEqual(json.loads(reader.cat(cid)), {'n': i})
+        reader.close()
+
+        self.assertEqual(self.gateway.connections, 1)
+        self.assertEqual(self.gateway.requests[0], (f'/ipfs/{cids[0]}?format=car', 'application/vnd.ipld.car; version=1'))
+
+    def test_failover(self):
+        """Gateways that fail or return content that does not match the CID are skipped"""
+        cid = self.serve(b'{"key": "value"}', corrupt=True)
+        other = FakeGateway()
+        try:
+            other.cars[cid] = car_for(b'{"key": "value"}')[1]
+            reader = GatewayReader(urls=['http://127.0.0.1:1', self.gateway.url, other.url], timeout=5)
+            self.assertEqual(reader.cat(f'/ipfs/{cid}'), b'{"key": "value"}')
+            reader.close()
+        finally:
+            other.stop()
+
+    def test_not_found(self):
+        reader = GatewayReader(urls=[self.gateway.url])
+        with self.assertRaises(IPFSNotFoundError) as context:
+            reader.cat('QmWgFQP5FT75mG5zzS1GA893bsLDYRTJpnnavWJzjvDq8D')
+        self.assertIn('HTTP 404', str(context.exception))
+        reader.close()
+
+        use_gateway(urls=[self.gateway.url])
+        with self.assertRaises(IPFSNotFoundError):
+            get_json('QmWgFQP5FT75mG5zzS1GA893bsLDYRTJpnnavWJzjvDq8D')
+
+    def test_transient_errors_are_retried(self):
+        cid = self.serve(b'{"key": "value"}')
+        self.gateway.failures = [503, 502]
+        use_gateway(urls=[self.gateway.url])
+        self.assertEqual(get_json(cid), {'key': 'value'})
+        self.assertEqual(len(self.gateway.requests), 3)
+
+    def test_deadline(self):
+        """The deadline is the socket timeout of the gateway request, so the request does not outlive it"""
+        cid = self.serve(b'{"key": "value"}')
+        self.gateway.delay = 1.0
+        use_gateway(urls=[self.gateway.url])
+        start = time.monotonic()
+        with self.assertRaises(IPFSTimeoutError), deadline(0.2):
+            get_json(cid)
+        self.assertLess(time.monotonic() - start, 0.9)
+
+        reader = GatewayReader(urls=[self.gateway.url])
+        start = time.monotonic()
+        with self.assertRaises(IPFSTimeoutError):
+            reader.cat(cid, timeout=0.2)
+        self.assertLess(time.monotonic() - start, 0.9)
+        reader.close()
+
+    def test_source_per_call(self):
+        cid = self.serve(b'{"key": "value"}')
+        reader = GatewayReader(urls=[self.gateway.url])
+        self.assertEqual(get_json(cid, gateway=reader), {'key': 'value'})
+        self.assertEqual(len(self.gateway.requests), 1)
+        reader.close()
+
+        # With reads going to the gateway, a read can still go through the RPC API
+        rpc_cid = add_json({'source': 'rpc'})
+        ipfs_cache.clear()
+        use_gateway(urls=[self.gateway.url])
+        self.assertEqual(get_json(rpc_cid, gateway=False), {'source': 'rpc'})
+        self.assertEqual(len(self.gateway.requests), 1)
+
+    def test_invalid_urls(self):
+        with self.assertRaises(ValueError):
+            GatewayReader(urls=[])
+        with self.assertRaises(ValueError):
+            GatewayReader(urls=['ftp://127.0.0.1'])
+
+    def test_get_json_from_gateway(self):
+        cid = self.serve(json.dumps({'first': 1, 'second': {'nested': True}}).encode())
+        reader = use_gateway(urls=self.gateway.url)
+        self.assertIs(current_gateway(), reader)
+
+        self.assertEqual(get_json_keys(cid, ['second']), {'second': {'nested': True}})
+        self.assertEqual(get_json(cid), {'first': 1, 'second': {'nested': True}})
+        self.assertEqual(len(self.gateway.requests), 2)
+
+        use_rpc()
+        self.assertIsNone(current_gateway())
+
+    def test_get_json_rejects_tampered_content(self):
+        cid = self.serve(b'{"key": "value"}', corrupt=True)
+        use_gateway(urls=[self.gateway.url])
+        with self.assertRaises(IPFSError):
+            get_json(cid)
+        self.assertNotIn(cid, ipfs_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
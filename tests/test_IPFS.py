@@ -1,8 +1,15 @@
 import unittest
 import asyncio
 import json
+import subprocess
+import sys
+import time
 from unittest.mock import patch, MagicMock, AsyncMock
-from ipfs_dict_chain.IPFS import IPFSCache, add_json, get_json, connect, IPFSError, get_file_content, _get_json
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiaddr import Multiaddr
+import threading
+from ipfs_dict_chain.IPFS import IPFSCache, IPFSNotFoundError, IPFSTimeoutError, RequestLimiter, RequestPolicy, SingleFlight, deadline, limit_requests, request_limiter, set_request_policy, add_json, get_json, get_json_keys, get_json_many, connect, connect_fastest, close_connection, probe, IPFSError, get_file_content, _get_json, ipfs_cache
 from multiaddr.exceptions import StringParseError
 
 
@@ -20,13 +27,56 @@ class TestIPFSConnection(unittest.TestCase):
         with self.assertRaises(IPFSError):
             connect('127.0.0.1', 9999)
 
-    @patch('ipfs_dict_chain.IPFS.add_json')
-    def test_connect_timeout(self, mock_add_json):
+    @patch('ipfs_dict_chain.IPFS._probe')
+    def test_connect_timeout(self, mock_probe):
         """Test connection timeout"""
-        mock_add_json.side_effect = TimeoutError("Connection timed out")
+        mock_probe.side_effect = TimeoutError("Connection timed out")
         with self.assertRaises(IPFSError):
             connect('127.0.0.1', 5001)
 
+    @patch('ipfs_dict_chain.IPFS._add_json', side_effect=AssertionError("connect should not write"))
+    def test_connect_is_read_only(self, mock_add_json):
+        """connect probes the daemon without adding data, and reports what it found"""
+        info = connect('127.0.0.1', 5001)
+        self.assertEqual(info['address'], '/ip4/127.0.0.1/tcp/5001')
+        self.assertIsNotNone(info['version'])
+        self.assertIsNotNone(info['id'])
+        self.assertIsInstance(info['protocols'], list)
+        self.assertGreater(info['latency'], 0)
+        mock_add_json.assert_not_called()
+
+    def test_probe(self):
+        self.assertEqual(probe('127.0.0.1', 5001)['address'], '/ip4/127.0.0.1/tcp/5001')
+        with self.assertRaises(IPFSError):
+            probe('127.0.0.1', 9999)
+
+    def test_connect_fastest(self):
+        """Unreachable daemons are skipped and the fastest reachable one is connected"""
+        info = connect_fastest([('127.0.0.1', 9999), ('127.0.0.1', 5001)])
+        self.assertEqual(info['address'], '/ip4/127.0.0.1/tcp/5001')
+        with self.assertRaises(IPFSError):
+            connect_fastest([('127.0.0.1', 9999)])
+
+    def test_keep_alive(self):
+        """With keep_alive, synchronous calls share one client"""
+        import aioipfs
+        with patch('aioipfs.AsyncIPFS', wraps=aioipfs.AsyncIPFS) as mock_ipfs:
+            try:
+                connect('127.0.0.1', 5001, keep_alive=True)
+                for i in range(5):
+                    cid = add_json({"keep_alive": i})
+                    ipfs_cache.delete(cid)
+                    self.assertEqual(get_json(cid), {"keep_alive": i})
+                    ipfs_cache.delete(cid)
+            finally:
+                close_connection()
+        self.assertEqual(mock_ipfs.call_count, 1)
+
+        # Without the kept connection every call has its own client again
+        cid = add_json({"keep_alive": "closed"})
+        self.assertEqual(get_json(cid), {"keep_alive": "closed"})
+        ipfs_cache.delete(cid)
+
 
 class TestIPFSCache(unittest.TestCase):
 
@@ -148,15 +198,17 @@ class TestIPFSFunctions(unittest.TestCase):
         self.assertEqual(test_data, retrieved_data)
         
         # Clean up
-        ipfs_cache._cache.pop(test_cid, None)
+        ipfs_cache.delete(test_cid)
 
-    @patch('ipfs_dict_chain.IPFS.get_file_content')
-    def test_get_json_invalid_json(self, mock_get_file_content):
+    @patch('ipfs_dict_chain.IPFS.iter_file_content')
+    def test_get_json_invalid_json(self, mock_iter_file_content):
         """Test _get_json with invalid JSON data"""
         from ipfs_dict_chain.IPFS import _get_json
         
-        # Mock get_file_content to return invalid JSON
-        mock_get_file_content.return_value = "{ invalid json }"
+        # Mock iter_file_content to return invalid JSON
+        async def content(cid, gateway=None):
+            yield b"{ invalid json }"
+        mock_iter_file_content.side_effect = content
         
         # Try to get JSON data - should raise IPFSError
         test_cid = "QmInvalidJson123"
@@ -168,9 +220,272 @@ class TestIPFSFunctions(unittest.TestCase):
         self.assertIn(test_cid, str(context.exception))
 
 
+class TestIPFSWriteThroughCache(unittest.TestCase):
+    """Test write-through caching and normalized cache keys"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    @patch('aioipfs.AsyncIPFS')
+    def test_add_json_writes_through(self, mock_ipfs):
+        """Data added to IPFS can be loaded again without a round-trip to the daemon"""
+        test_cid = "QmWriteThrough123"
+        mock_client = AsyncMock()
+        mock_client.add_json = AsyncMock(return_value={'Hash': test_cid})
+        mock_client.cat = AsyncMock(side_effect=AssertionError("cat should not be called"))
+        mock_client.close = AsyncMock()
+        mock_ipfs.return_value = mock_client
+
+        cid = add_json({"key": "value", "tuple": (1, 2), 1: "int key"})
+        self.assertEqual(cid, test_cid)
+        self.assertEqual(get_json(test_cid), {"key": "value", "tuple": [1, 2], "1": "int key"})
+        self.assertEqual(get_json(f"/ipfs/{test_cid}"), {"key": "value", "tuple": [1, 2], "1": "int key"})
+        mock_client.cat.assert_not_called()
+
+        ipfs_cache.delete(test_cid)
+
+    def test_normalized_cache_keys(self):
+        """The long and short form of a CID share one cache entry"""
+        cache = IPFSCache()
+        cache.set("/ipfs/QmNormalized123", {"key": "value"})
+        self.assertEqual(cache.get("QmNormalized123"), {"key": "value"})
+        self.assertIn("QmNormalized123", cache)
+        self.assertIn("/ipfs/QmNormalized123", cache)
+        self.assertEqual(len(cache), 1)
+
+        cache.set("QmNormalized123", {"key": "other"})
+        self.assertEqual(len(cache), 1)
+        cache.delete("/ipfs/QmNormalized123")
+        self.assertNotIn("QmNormalized123", cache)
+
+    def test_empty_dict_is_a_cache_hit(self):
+        """A cached empty dict is returned from the cache instead of being fetched again"""
+        test_cid = "QmEmptyDictHit123"
+        ipfs_cache.set(test_cid, {})
+
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=AssertionError("should not fetch")):
+            self.assertEqual(get_json(test_cid), {})
+            self.assertEqual(self.loop.run_until_complete(_get_json(f"/ipfs/{test_cid}")), {})
+
+        ipfs_cache.delete(test_cid)
+
+    def test_fetch_is_cached_under_normalized_cid(self):
+        """Data fetched with the long form of a CID is found again with the short form"""
+        test_cid = "QmNormalizedFetch123"
+
+        async def content(cid, gateway=None):
+            yield json.dumps({"fetched": True}).encode()
+
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=content) as mock_content:
+            self.assertEqual(get_json(f"/ipfs/{test_cid}"), {"fetched": True})
+            self.assertEqual(get_json(test_cid), {"fetched": True})
+            self.assertEqual(mock_content.call_count, 1)
+
+        ipfs_cache.delete(test_cid)
+
+
+class TestIPFSStreaming(unittest.TestCase):
+    """Test streaming and incremental parsing of JSON data"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_large_payload_is_streamed(self):
+        """A payload larger than a block is read back in chunks and parsed into frozen data"""
+        test_data = {"small": 1, "large": ["x" * 1000] * 500, "nested": {"key": "value"}}
+        cid = add_json(test_data)
+        ipfs_cache.delete(cid)
+
+        retrieved_data = get_json(cid)
+        self.assertEqual(test_data, retrieved_data)
+        self.assertIn(cid, ipfs_cache)
+
+        ipfs_cache.delete(cid)
+        self.assertEqual(get_json_keys(cid, ["small", "nested", "missing"]), {"small": 1, "nested": {"key": "value"}})
+        self.assertNotIn(cid, ipfs_cache)
+
+    def test_get_json_keys_stops_early(self):
+        """The stream is closed as soon as all selected keys have been found"""
+        test_cid = "QmStreamKeys123"
+        chunks = [b'{"first": 1, ', b'"second": [2, 3], ', b'"third": "' + b'x' * 100, b'"}']
+        read = []
+
+        async def content(cid, gateway=None):
+            for chunk in chunks:
+                read.append(chunk)
+                yield chunk
+
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=content):
+            self.assertEqual(get_json_keys(test_cid, ["first", "second"]), {"first": 1, "second": [2, 3]})
+        self.assertEqual(len(read), 2)
+        self.assertNotIn(test_cid, ipfs_cache)
+
+    def test_get_json_keys_from_cache(self):
+        test_cid = "QmStreamKeysCached123"
+        ipfs_cache.set(test_cid, {"first": 1, "second": 2})
+
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=AssertionError("should not fetch")):
+            self.assertEqual(get_json_keys(test_cid, ["second"]), {"second": 2})
+
+        ipfs_cache.set(test_cid, [1, 2])
+        with self.assertRaises(IPFSError):
+            get_json_keys(test_cid, ["second"])
+
+        ipfs_cache.delete(test_cid)
+
+    def test_get_json_many(self):
+        """Uncached CIDs are fetched concurrently, cached CIDs are not fetched again"""
+        cids = [add_json({"batch": i}) for i in range(5)]
+        for cid in cids[1:]:
+            ipfs_cache.delete(cid)
+
+        with patch('ipfs_dict_chain.IPFS._get_json', wraps=_get_json) as mock_get_json:
+            results = get_json_many([f'/ipfs/{cid}' for cid in cids] + cids[:2], concurrency=2)
+        self.assertEqual(results, {cid: {"batch": i} for i, cid in enumerate(cids)})
+        self.assertEqual(sorted(call.kwargs['cid'] for call in mock_get_json.call_args_list), sorted(cids[1:]))
+        self.assertEqual(get_json_many([]), {})
+
+    def test_truncated_stream(self):
+        async def content(cid, gateway=None):
+            yield b'{"key": "val'
+
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=content):
+            with self.assertRaises(IPFSError) as context:
+                self.loop.run_until_complete(_get_json("QmTruncated123"))
+        self.assertIn("Failed to parse json data from IPFS hash", str(context.exception))
+
+
+class TestIPFSSingleFlight(unittest.TestCase):
+    """Test coalescing of concurrent fetches for the same CID"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_concurrent_async_fetches_share_one_request(self):
+        """Concurrent coroutines asking for the same CID trigger a single cat"""
+        test_cid = "QmSingleFlightAsync123"
+        calls = []
+
+        async def slow_content(cid, gateway=None):
+            calls.append(cid)
+            await asyncio.sleep(0.05)
+            yield json.dumps({"shared": True}).encode()
+
+        async def fetch_many():
+            return await asyncio.gather(*[_get_json(test_cid) for _ in range(10)])
+
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=slow_content):
+            results = self.loop.run_until_complete(fetch_many())
+
+        self.assertEqual(len(calls), 1)
+        for result in results:
+            self.assertEqual(result, {"shared": True})
+
+        ipfs_cache.delete(test_cid)
+
+    def test_concurrent_threaded_fetches_share_one_request(self):
+        """Concurrent threads asking for the same CID trigger a single cat"""
+        test_cid = "QmSingleFlightThreads123"
+        calls = []
+
+        async def slow_content(cid, gateway=None):
+            calls.append(cid)
+            await asyncio.sleep(0.05)
+            yield json.dumps({"shared": True}).encode()
+
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=slow_content):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda _: get_json(test_cid), range(8)))
+
+        self.assertEqual(len(calls), 1)
+        for result in results:
+            self.assertEqual(result, {"shared": True})
+
+        ipfs_cache.delete(test_cid)
+
+    def test_errors_are_shared_and_not_cached(self):
+        """A failed shared fetch raises for every waiter and is retried on the next call"""
+        test_cid = "QmSingleFlightError123"
+        calls = []
+
+        async def failing_content(cid, gateway=None):
+            calls.append(cid)
+            await asyncio.sleep(0.05)
+            raise ConnectionError("daemon unavailable")
+            yield b''
+
+        async def fetch_many():
+            return await asyncio.gather(*[_get_json(test_cid) for _ in range(5)], return_exceptions=True)
+
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=failing_content):
+            results = self.loop.run_until_complete(fetch_many())
+            self.assertEqual(len(calls), 1)
+            for result in results:
+                self.assertIsInstance(result, IPFSError)
+
+            with self.assertRaises(IPFSError):
+                self.loop.run_until_complete(_get_json(test_cid))
+            self.assertEqual(len(calls), 2)
+
+    def test_waiters_keep_their_deadline(self):
+        """A thread waiting for a call in flight raises IPFSTimeoutError when its own deadline passes"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 'result'
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            leader = executor.submit(flight.do, 'key', slow)
+            started.wait(5)
+            start = time.monotonic()
+            with deadline(0.1), self.assertRaises(IPFSTimeoutError):
+                flight.do('key', lambda: 'other')
+            self.assertLess(time.monotonic() - start, 1)
+
+            # The call goes on for the leader
+            release.set()
+            self.assertEqual(leader.result(5), 'result')
+
+
 class TestIPFSCacheExtended(unittest.TestCase):
     """Extended tests for IPFSCache functionality"""
 
+    def test_cache_stores_frozen_data(self):
+        """Cached data is read-only, so one reader can not corrupt it for the others"""
+        cache = IPFSCache()
+        test_data = {"list": [1, 2, 3], "nested": {"key": "value"}}
+        test_cid = "QmFrozenCache123"
+        cache.set(test_cid, test_data)
+
+        # Changes to the original object do not leak into the cache
+        test_data["list"].append(4)
+        cached = cache.get(test_cid)
+        self.assertEqual(cached, {"list": [1, 2, 3], "nested": {"key": "value"}})
+
+        with self.assertRaises(TypeError):
+            cached["list"].append(4)
+        with self.assertRaises(TypeError):
+            cached["nested"]["key"] = "other"
+
+        # Every reader shares the same object
+        self.assertIs(cache.get(test_cid), cached)
+
     def test_cache_miss(self):
         """Test cache miss scenario"""
         cache = IPFSCache()
@@ -204,6 +519,117 @@ class TestIPFSCacheExtended(unittest.TestCase):
             self.assertEqual(result, test_data)
 
 
+class TestIPFSThreadSafety(unittest.TestCase):
+    """Test the thread-safe cache and atomic connection state"""
+
+    def test_cache_stripes(self):
+        """Entries are spread over the stripes and remain individually addressable"""
+        cache = IPFSCache(stripes=4)
+        for i in range(100):
+            cache.set(f"QmStripe{i}", {"index": i})
+
+        self.assertEqual(len(cache), 100)
+        self.assertTrue(all(len(stripe) > 0 for stripe in cache._stripes))
+        for i in range(100):
+            self.assertEqual(cache.get(f"QmStripe{i}"), {"index": i})
+
+        cache.delete("QmStripe0")
+        self.assertIsNone(cache.get("QmStripe0"))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+    def test_cache_invalid_stripes(self):
+        """A cache needs at least one stripe"""
+        with self.assertRaises(ValueError):
+            IPFSCache(stripes=0)
+
+    def test_cache_thread_pool_consistency(self):
+        """Concurrent writers and readers on many keys never lose or mix up entries"""
+        cache = IPFSCache()
+
+        def worker(n):
+            for i in range(200):
+                key = f"QmWorker{n}_{i}"
+                cache.set(key, {"worker": n, "i": i})
+                assert cache.get(key) == {"worker": n, "i": i}
+            return n
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            self.assertEqual(sorted(executor.map(worker, range(16))), list(range(16)))
+
+        self.assertEqual(len(cache), 16 * 200)
+
+    def test_fetch_throughput_scales_with_threads(self):
+        """Fetches of different CIDs run in parallel instead of queueing behind a global lock"""
+        latency = 0.1
+        threads = 8
+
+        async def slow_content(cid, gateway=None):
+            await asyncio.sleep(latency)
+            yield json.dumps({"cid": cid}).encode()
+
+        test_cids = [f"QmParallelFetch{i}" for i in range(threads)]
+        with patch('ipfs_dict_chain.IPFS.iter_file_content', side_effect=slow_content):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                results = list(executor.map(get_json, test_cids))
+            elapsed = time.perf_counter() - start
+
+        for test_cid, result in zip(test_cids, results):
+            self.assertEqual(result, {"cid": test_cid})
+            ipfs_cache.delete(test_cid)
+
+        # Serialized fetches would take threads * latency
+        self.assertLess(elapsed, threads * latency / 2)
+
+    @patch('ipfs_dict_chain.IPFS._probe')
+    def test_failed_connect_keeps_address(self, mock_probe):
+        """A failed connect does not replace the address used by other threads"""
+        import ipfs_dict_chain.IPFS as ipfs_module
+        previous_address = ipfs_module.multi_address
+        mock_probe.side_effect = ConnectionError("Connection refused")
+
+        with self.assertRaises(IPFSError):
+            connect('127.0.0.2', 5002)
+
+        self.assertIs(ipfs_module.multi_address, previous_address)
+
+    @patch('ipfs_dict_chain.IPFS._probe')
+    def test_connect_probes_new_address(self, mock_probe):
+        """connect verifies the new daemon before installing its address"""
+        import ipfs_dict_chain.IPFS as ipfs_module
+        previous_address = ipfs_module.multi_address
+        mock_probe.return_value = {'latency': 0.001}
+
+        try:
+            connect('127.0.0.2', 5002)
+            probed_address = mock_probe.call_args.kwargs['maddr']
+            self.assertEqual(str(probed_address), '/ip4/127.0.0.2/tcp/5002')
+            self.assertIs(ipfs_module.multi_address, probed_address)
+        finally:
+            ipfs_module.multi_address = previous_address
+
+
+class TestIPFSLazyImports(unittest.TestCase):
+    """Test that the network dependencies are only imported when they are needed"""
+
+    def loaded_modules(self, code):
+        check = f"{code}\nimport sys\nprint(sorted(m for m in ('aiohttp', 'aioipfs', 'multiaddr') if m in sys.modules))"
+        output = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+
+    def test_import_does_not_load_network_dependencies(self):
+        code = ("import ipfs_dict_chain.IPFSDictChain, ipfs_dict_chain.WriteBehind\n"
+                "from ipfs_dict_chain.IPFS import ipfs_cache, get_json\n"
+                "ipfs_cache.set('QmLazy', {'key': 'value'})\n"
+                "assert get_json('QmLazy') == {'key': 'value'}")
+        self.assertEqual(self.loaded_modules(code), "[]")
+
+    def test_default_address_is_built_on_first_use(self):
+        code = "import ipfs_dict_chain.IPFS as ipfs\nassert str(ipfs.multi_address) == '/ip4/127.0.0.1/tcp/5001'"
+        self.assertEqual(self.loaded_modules(code), "['multiaddr']")
+
+
 class TestIPFSLargeData(unittest.TestCase):
     """Test IPFS operations with large data structures"""
 
@@ -373,5 +799,282 @@ class TestIPFSEndToEnd(unittest.TestCase):
                 self.assertTrue(json.loads(result))  # Verify it's valid JSON
 
 
+class TestRequestLimiter(unittest.TestCase):
+
+    def tearDown(self):
+        limit_requests()
+
+    def test_concurrency_is_shared_by_threads_and_event_loops(self):
+        limiter = RequestLimiter(max_concurrency=2)
+        active = []
+
+        async def request():
+            async with limiter.request():
+                active.append(limiter.active)
+                await asyncio.sleep(0.02)
+
+        async def requests():
+            await asyncio.gather(*[request() for _ in range(4)])
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            list(executor.map(lambda _: asyncio.run(requests()), range(3)))
+
+        self.assertEqual(len(active), 12)
+        self.assertEqual(max(active), 2)
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+
+    def test_rate(self):
+        limiter = RequestLimiter(max_concurrency=None, rate=50, burst=2)
+
+        async def requests():
+            for _ in range(7):
+                async with limiter.request():
+                    pass
+
+        start = time.monotonic()
+        asyncio.run(requests())
+        # The burst starts at once, the other 5 requests are spaced by 1/50 s
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_cancelled_waiter_releases_its_slot(self):
+        limiter = RequestLimiter(max_concurrency=1)
+
+        async def scenario():
+            async with limiter.request():
+                waiter = asyncio.ensure_future(limiter.request().__aenter__())
+                await asyncio.sleep(0)
+                self.assertEqual(limiter.waiting, 1)
+                waiter.cancel()
+                await asyncio.sleep(0)
+            async with limiter.request():
+                self.assertEqual(limiter.active, 1)
+
+        asyncio.run(scenario())
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+
+    def test_adaptive_window(self):
+        limiter = RequestLimiter(max_concurrency=16, adaptive=True, min_concurrency=2)
+        self.assertEqual(limiter.window, 2)
+
+        async def request(error=None):
+            async with limiter.request():
+                if error is not None:
+                    raise error
+
+        async def scenario():
+            # Slow start: every successful request adds a slot
+            for _ in range(6):
+                await request()
+            self.assertEqual(limiter.window, 8)
+
+            # Overload halves the window, requests that started before the decrease do not halve it again
+            first, second = limiter.request(), limiter.request()
+            await first.__aenter__()
+            await second.__aenter__()
+            await first.__aexit__(ConnectionError, ConnectionError(), None)
+            self.assertEqual(limiter.window, 4)
+            await second.__aexit__(ConnectionError, ConnectionError(), None)
+            self.assertEqual(limiter.window, 4)
+
+            # After slow start, the window grows by one slot per window of successful requests
+            for _ in range(4):
+                await request()
+            self.assertEqual(limiter.window, 4)
+            await request()
+            self.assertEqual(limiter.window, 5)
+
+            # Errors that are answers of the daemon do not count as overload
+            with self.assertRaises(IPFSError):
+                await request(error=IPFSError('not found'))
+            self.assertEqual(limiter.window, 5)
+
+            for _ in range(4):
+                with self.assertRaises(ConnectionError):
+                    await request(error=ConnectionError())
+            self.assertEqual(limiter.window, 2)
+
+        asyncio.run(scenario())
+
+    def test_adaptive_window_follows_latency(self):
+        limiter = RequestLimiter(max_concurrency=8, adaptive=True, min_concurrency=1)
+
+        async def request(latency):
+            async with limiter.request():
+                await asyncio.sleep(latency)
+
+        async def scenario():
+            for _ in range(3):
+                await request(0.001)
+            self.assertEqual(limiter.window, 4)
+            await request(0.1)
+            self.assertEqual(limiter.window, 2)
+
+        asyncio.run(scenario())
+
+    def test_invalid_limits(self):
+        for kwargs in ({'max_concurrency': 0}, {'max_concurrency': None, 'adaptive': True},
+                       {'max_concurrency': 4, 'min_concurrency': 5}, {'rate': 0}, {'rate': 1, 'burst': 0},
+                       {'latency_tolerance': 1}):
+            with self.assertRaises(ValueError):
+                RequestLimiter(**kwargs)
+
+    def test_requests_to_the_daemon_are_limited(self):
+        limiter = limit_requests(max_concurrency=2)
+        self.assertIs(request_limiter(), limiter)
+        cids = [add_json({'limited': i}) for i in range(6)]
+        for cid in cids:
+            ipfs_cache.delete(cid)
+
+        with patch.object(limiter, '_acquire', wraps=limiter._acquire) as acquire:
+            self.assertEqual(get_json_many(cids), {cid: {'limited': i} for i, cid in enumerate(cids)})
+        self.assertEqual(acquire.call_count, 6)
+        self.assertEqual(limiter.active, 0)
+
+
+class FakeDaemon(ThreadingHTTPServer):
+    """A local stand-in for the RPC API of the IPFS daemon whose answers can be delayed or fail."""
+
+    daemon_threads = True
+
+    def __init__(self, content=b'{"key": "value"}'):
+        super().__init__(('127.0.0.1', 0), FakeDaemonHandler)
+        self.content = content
+        self.delay = 0.0
+        self.stall = False
+        self.failures = []
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def maddr(self):
+        return Multiaddr(f'/ip4/127.0.0.1/tcp/{self.server_address[1]}')
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeDaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.requests.append(self.path.split('?')[0])
+        time.sleep(self.server.delay)
+
+        if self.server.failures:
+            status, message = self.server.failures.pop(0)
+            if status is None:
+                # A lost connection
+                self.close_connection = True
+                return
+            body = json.dumps({'Message': message, 'Code': 0, 'Type': 'error'}).encode()
+        elif self.path.startswith('/api/v0/add'):
+            status, body = 200, json.dumps({'Name': 'data', 'Hash': 'QmAddedByFakeDaemon', 'Size': '1'}).encode()
+        else:
+            status, body = 200, self.server.content
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.server.stall:
+            self.wfile.write(body[:3])
+            self.wfile.flush()
+            time.sleep(1)
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestIPFSTimeoutsAndRetries(unittest.TestCase):
+
+    def setUp(self):
+        self.daemon = FakeDaemon()
+        self.address = patch('ipfs_dict_chain.IPFS.multi_address', self.daemon.maddr, create=True)
+        self.address.start()
+        set_request_policy(timeout=5, retries=2, backoff=0.01)
+
+    def tearDown(self):
+        set_request_policy()
+        self.address.stop()
+        self.daemon.stop()
+        ipfs_cache.clear()
+
+    def test_timeout(self):
+        self.daemon.delay = 1
+        set_request_policy(timeout=0.1)
+        start = time.monotonic()
+        with self.assertRaises(IPFSTimeoutError):
+            get_json('QmHungRequest')
+        with self.assertRaises(IPFSTimeoutError):
+            asyncio.run(get_file_content('QmHungRequest'))
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_stalled_stream_times_out(self):
+        self.daemon.stall = True
+        set_request_policy(timeout=0.2)
+        with self.assertRaises(IPFSTimeoutError):
+            get_json('QmStalledStream')
+
+    def test_deadline_covers_all_requests_of_an_operation(self):
+        self.daemon.delay = 0.15
+        start = time.monotonic()
+        with self.assertRaises(IPFSTimeoutError):
+            with deadline(0.4):
+                for i in range(10):
+                    get_json(f'QmDeadline{i}')
+        self.assertLess(time.monotonic() - start, 0.8)
+        self.assertLess(len(self.daemon.requests), 5)
+
+        with deadline(5), deadline(0):
+            with self.assertRaises(IPFSTimeoutError):
+                get_json_many(['QmPassedDeadline'])
+        self.assertLess(len(self.daemon.requests), 5)
+
+    def test_transient_errors_are_retried(self):
+        self.daemon.failures = [(503, 'busy'), (502, 'bad gateway')]
+        self.assertEqual(get_json('QmRetried'), {'key': 'value'})
+        self.assertEqual(len(self.daemon.requests), 3)
+
+        self.daemon.failures = [(503, 'busy'), (503, 'busy'), (503, 'busy')]
+        with self.assertRaises(IPFSError) as context:
+            get_json('QmFailing')
+        self.assertNotIsInstance(context.exception, IPFSTimeoutError)
+        self.assertEqual(len(self.daemon.requests), 6)
+
+    def test_lost_connections_are_retried(self):
+        self.daemon.failures = [(None, 'lost'), (None, 'lost')]
+        self.assertEqual(asyncio.run(get_file_content('QmRetried')), '{"key": "value"}')
+        self.assertEqual(len(self.daemon.requests), 3)
+
+    def test_add_json_is_retried(self):
+        self.daemon.failures = [(None, 'lost')]
+        self.assertEqual(add_json({'retried': True}), 'QmAddedByFakeDaemon')
+        self.assertEqual(self.daemon.requests, ['/api/v0/add', '/api/v0/add'])
+
+    def test_missing_content(self):
+        from ipfs_dict_chain.IPFSDict import IPFSDict
+
+        for _ in range(3):
+            self.daemon.failures.append((500, 'merkledag: not found'))
+        with self.assertRaises(IPFSNotFoundError):
+            get_json('QmMissing')
+        with self.assertRaises(IPFSNotFoundError):
+            asyncio.run(get_file_content('QmMissing'))
+        with self.assertRaises(IPFSNotFoundError):
+            IPFSDict(cid='QmWgFQP5FT75mG5zzS1GA893bsLDYRTJpnnavWJzjvDq8D')
+        # Missing content is an answer of the daemon, it is not retried
+        self.assertEqual(len(self.daemon.requests), 3)
+
+    def test_invalid_policy(self):
+        for kwargs in ({'timeout': 0}, {'retries': -1}, {'backoff': -1}):
+            with self.assertRaises(ValueError):
+                RequestPolicy(**kwargs)
+        self.assertLessEqual(RequestPolicy(backoff=1, max_backoff=0.5).delay(attempt=3), 0.5)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from datetime import datetime
 from ipfs_dict_chain.IPFSDict import IPFSDict
 from ipfs_dict_chain.IPFS import IPFSError
+from ipfs_dict_chain.FrozenDict import freeze
 from unittest.mock import patch
 
 
@@ -227,6 +228,36 @@ class TestIPFSDict(unittest.TestCase):
         self.assertIn("does not contain a dict", str(context.exception))
         self.assertIn(test_cid, str(context.exception))
 
+    @patch('ipfs_dict_chain.IPFSDict.get_json')
+    def test_load_does_not_corrupt_shared_data(self, mock_get_json):
+        """Mutating a loaded value does not affect the shared cached data."""
+        shared = freeze({'list': [1, 2, 3], 'dict': {'a': {'b': 1}}, 'string': 'value'})
+        mock_get_json.return_value = shared
+
+        ipfs_dict = IPFSDict()
+        ipfs_dict.load(cid="QmTestSharedData123")
+
+        # Reads share the cached objects without copying them
+        self.assertIs(dict(ipfs_dict.items())['list'], shared['list'])
+        self.assertIs(ipfs_dict.list, shared['list'])
+        self.assertIs(ipfs_dict['dict'], shared['dict'])
+
+        # Loaded values can only be modified through a private copy
+        with self.assertRaises(TypeError):
+            ipfs_dict.list.append(4)
+        ipfs_dict.thaw('list').append(4)
+        ipfs_dict.thaw('dict')['a']['b'] = 2
+        self.assertIs(ipfs_dict.thaw('list'), ipfs_dict.list)
+
+        self.assertEqual(ipfs_dict.list, [1, 2, 3, 4])
+        self.assertEqual(ipfs_dict.dict, {'a': {'b': 2}})
+        self.assertEqual(shared, {'list': [1, 2, 3], 'dict': {'a': {'b': 1}}, 'string': 'value'})
+
+        other_dict = IPFSDict()
+        other_dict.load(cid="QmTestSharedData123")
+        self.assertEqual(other_dict.list, [1, 2, 3])
+        self.assertEqual(other_dict.dict, {'a': {'b': 1}})
+
 
 if __name__ == '__main__':
     unittest.main()
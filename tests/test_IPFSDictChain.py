@@ -1,7 +1,61 @@
+import io
+import json
+import os
+import tempfile
 import unittest
 from datetime import datetime
-from ipfs_dict_chain.IPFSDictChain import IPFSDictChain
-from ipfs_dict_chain.IPFS import IPFSError
+from unittest.mock import patch
+from ipfs_dict_chain.CAR import CARError, CARReader, CARWriter
+from ipfs_dict_chain.CID import cid_to_bytes
+from ipfs_dict_chain import IPFSDictChain as ipfs_dict_chain_module
+from ipfs_dict_chain.IPFSDictChain import MISSING, IPFSDictChain, _ancestor, _skip_height, diff_states
+from ipfs_dict_chain.FrozenDict import FrozenDict, freeze
+from ipfs_dict_chain.IPFS import IPFSError, IPFSNotFoundError, get_json, ipfs_cache
+from ipfs_dict_chain.UnixFS import file_cid
+
+
+def cache_chain(states):
+    """Store a chain of states in the cache under the CIDs the IPFS daemon would assign, oldest state first."""
+    cids = []
+    previous_cid = None
+    for state in states:
+        payload = {'previous_cid': previous_cid, **state}
+        previous_cid = file_cid(json.dumps(payload).encode())
+        ipfs_cache.set(previous_cid, payload)
+        cids.append(previous_cid)
+    return cids
+
+
+# The data stored by fake_add_json, as the IPFS daemon would hold it
+uploaded = {}
+
+
+def fake_add_json(data, maddr=None):
+    """Store data in the cache under the CID the IPFS daemon would assign, instead of adding it to IPFS."""
+    cid = file_cid(json.dumps(data).encode())
+    ipfs_cache.set(cid, json.loads(json.dumps(data)))
+    uploaded[cid] = json.loads(json.dumps(data))
+    return cid
+
+
+async def fake_stream_json(cid, keys=None, gateway=None):
+    """Fetch data stored by fake_add_json, instead of fetching it from IPFS."""
+    if cid not in uploaded:
+        raise IPFSNotFoundError(f'{cid} not found')
+    data = freeze(uploaded[cid])
+    return data if keys is None else FrozenDict((key, data[key]) for key in keys if key in data)
+
+
+def upload_chain(states):
+    """Store a chain of states like fake_add_json without caching them, oldest state first."""
+    cids = []
+    previous_cid = None
+    for state in states:
+        payload = {'previous_cid': previous_cid, **state}
+        previous_cid = file_cid(json.dumps(payload).encode())
+        uploaded[previous_cid] = payload
+        cids.append(previous_cid)
+    return cids
 
 
 class TestIPFSDictChain(unittest.TestCase):
@@ -44,6 +98,28 @@ class TestIPFSDictChain(unittest.TestCase):
         previous_cids = ipfs_dict_chain.get_previous_cids()
         self.assertEqual(previous_cids, [cid1])
 
+    def test_get_previous_states_compact(self):
+        cids = cache_chain([{'counter': i, 'constant': {'nested': 'value'}} for i in range(5)])
+        payloads = {cid: ipfs_cache.get(cid) for cid in cids}
+        chain = IPFSDictChain(cid=cids[-1])
+        ipfs_cache.delete(cids[0])
+
+        def fetch(cid, gateway=None):
+            ipfs_cache.set(cid, payloads[cid])
+            return ipfs_cache.get(cid)
+
+        with patch('ipfs_dict_chain.IPFS._run_get_json', side_effect=fetch):
+            states = chain.get_previous_states(compact=True)
+            # States that were not cached are not added to the cache
+            self.assertNotIn(cids[0], ipfs_cache)
+            self.assertIn(cids[1], ipfs_cache)
+            self.assertEqual(states, chain.get_previous_states())
+
+        self.assertIs(states[0]._keys, states[1]._keys)
+        self.assertIs(states[-1]['constant'], states[0]['constant'])
+        for cid in cids:
+            ipfs_cache.delete(cid)
+
     def test_multiple_state_changes(self):
         """Test multiple state changes and history tracking."""
         chain = IPFSDictChain()
@@ -167,5 +243,670 @@ class TestIPFSDictChain(unittest.TestCase):
         self.assertEqual(main_chain.value, "main_2")
 
 
+class TestIPFSDictChainCAR(unittest.TestCase):
+    """Test CAR export and import of whole chains."""
+
+    def setUp(self):
+        self.states = [{'value': f'state_{i}', 'counter': i} for i in range(5)]
+        self.cids = cache_chain(self.states)
+
+    def tearDown(self):
+        for cid in self.cids:
+            ipfs_cache.delete(cid)
+
+    @patch('ipfs_dict_chain.IPFSDictChain.dag_export')
+    def test_export_car_from_cache(self, mock_dag_export):
+        """Cached states are encoded locally without contacting the daemon"""
+        mock_dag_export.side_effect = AssertionError("dag export should not be called")
+        chain = IPFSDictChain(cid=self.cids[-1])
+        stream = io.BytesIO()
+
+        exported = chain.export_car(stream)
+
+        self.assertEqual(exported, list(reversed(self.cids)))
+        reader = CARReader(stream=io.BytesIO(stream.getvalue()))
+        self.assertEqual(reader.root_cids(), [self.cids[-1]])
+        self.assertEqual(len(list(reader)), 5)
+
+    def test_export_car_max_depth(self):
+        chain = IPFSDictChain(cid=self.cids[-1])
+        exported = chain.export_car(io.BytesIO(), max_depth=2)
+        self.assertEqual(exported, list(reversed(self.cids))[:3])
+
+    def test_export_unsaved_chain(self):
+        with self.assertRaises(IPFSError):
+            IPFSDictChain().export_car(io.BytesIO())
+
+    @patch('ipfs_dict_chain.IPFSDictChain.dag_export')
+    def test_export_car_from_daemon(self, mock_dag_export):
+        """States that are not cached are exported from the daemon and decoded from their blocks"""
+        chain = IPFSDictChain(cid=self.cids[-1])
+        reference = io.BytesIO()
+        chain.export_car(reference)
+        blocks = dict(CARReader(stream=io.BytesIO(reference.getvalue())))
+
+        def export_one(cid):
+            stream = io.BytesIO()
+            writer = CARWriter(stream=stream, roots=[cid_to_bytes(cid)])
+            writer.write_block(cid_to_bytes(cid), blocks[cid_to_bytes(cid)])
+            return stream.getvalue()
+
+        mock_dag_export.side_effect = export_one
+        for cid in self.cids:
+            ipfs_cache.delete(cid)
+
+        stream = io.BytesIO()
+        chain.export_car(stream)
+        self.assertEqual(stream.getvalue(), reference.getvalue())
+        self.assertEqual(mock_dag_export.call_count, 5)
+        self.assertIn(self.cids[0], ipfs_cache)
+
+    @patch('ipfs_dict_chain.IPFSDictChain.dag_import')
+    def test_import_car_stream(self, mock_dag_import):
+        """Importing verifies the blocks, imports them and seeds the cache with the states"""
+        stream = io.BytesIO()
+        IPFSDictChain(cid=self.cids[-1]).export_car(stream)
+        for cid in self.cids:
+            ipfs_cache.delete(cid)
+
+        imported_paths = []
+        mock_dag_import.side_effect = lambda path: imported_paths.append(open(path, 'rb').read())
+        stream.seek(0)
+        chain = IPFSDictChain.import_car(stream)
+
+        self.assertEqual(imported_paths, [stream.getvalue()])
+        self.assertEqual(chain.cid(), f'/ipfs/{self.cids[-1]}')
+        self.assertEqual(chain.value, 'state_4')
+        self.assertEqual([state['counter'] for state in chain.get_previous_states()], [3, 2, 1, 0])
+
+    @patch('ipfs_dict_chain.IPFSDictChain.dag_import')
+    def test_import_car_path(self, mock_dag_import):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'chain.car')
+            IPFSDictChain(cid=self.cids[-1]).export_car(path)
+            chain = IPFSDictChain.import_car(path)
+
+        mock_dag_import.assert_called_once_with(path=path)
+        self.assertEqual(chain.value, 'state_4')
+
+    @patch('ipfs_dict_chain.IPFSDictChain.dag_import')
+    def test_import_corrupted_car(self, mock_dag_import):
+        """Nothing is imported when a block does not match its CID"""
+        stream = io.BytesIO()
+        IPFSDictChain(cid=self.cids[-1]).export_car(stream)
+        corrupted = bytearray(stream.getvalue())
+        corrupted[-3] ^= 0xff
+
+        with self.assertRaises(CARError):
+            IPFSDictChain.import_car(io.BytesIO(bytes(corrupted)))
+        mock_dag_import.assert_not_called()
+
+
+
+@patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=fake_add_json)
+class TestIPFSDictChainCompaction(unittest.TestCase):
+    """Test chain metadata, delta encoding and compaction of long histories."""
+
+    def setUp(self):
+        self.states = [{'value': f'state_{i}', 'counter': i, 'constant': 'x' * 100} for i in range(20)]
+        self.cids = cache_chain(self.states)
+        # Compaction does not keep the new states in the cache, they are fetched from the fake daemon again
+        fetch = patch('ipfs_dict_chain.IPFS._stream_json', new=fake_stream_json)
+        fetch.start()
+        self.addCleanup(fetch.stop)
+
+    def tearDown(self):
+        ipfs_cache.clear()
+        uploaded.clear()
+
+    def test_skip_height(self, mock_add_json):
+        self.assertEqual([_skip_height(seq) for seq in range(1, 9)], [0, 0, 1, 0, 1, 4, 1, 0])
+        for seq in range(2, 1000):
+            self.assertLess(_skip_height(seq), seq)
+
+    def test_default_format_unchanged(self, mock_add_json):
+        """Without options a chain keeps saving plain states"""
+        chain = IPFSDictChain()
+        chain.key = 'value'
+        chain.save()
+        self.assertEqual(ipfs_cache.get(chain.cid()), {'previous_cid': None, 'key': 'value'})
+
+    def test_shortcuts(self, mock_add_json):
+        chain = IPFSDictChain(shortcuts=True)
+        cids = []
+        for i in range(40):
+            chain.counter = i
+            cids.append(chain.save())
+
+        self.assertEqual(ipfs_cache.get(cids[-1])['_chain']['seq'], 39)
+        self.assertNotIn('_chain', dict(IPFSDictChain(cid=cids[-1]).items()))
+        for seq in (0, 1, 7, 24, 38, 39):
+            self.assertEqual(_ancestor(cid=cids[-1], seq=seq), cids[seq])
+
+        # A reloaded chain keeps storing metadata
+        reloaded = IPFSDictChain(cid=cids[-1])
+        reloaded.counter = 40
+        self.assertEqual(ipfs_cache.get(reloaded.save())['_chain']['seq'], 40)
+
+    def test_checkpoint_interval(self, mock_add_json):
+        chain = IPFSDictChain(checkpoint_interval=4)
+        chain.constant = 'x' * 100
+        chain.removed = True
+        cids = []
+        for i in range(10):
+            chain.counter = i
+            if i == 2:
+                del chain.removed
+            cids.append(chain.save())
+
+        delta = ipfs_cache.get(cids[5])
+        self.assertEqual(delta['_chain']['base'], cids[4])
+        self.assertNotIn('constant', delta)
+        self.assertNotIn('base', ipfs_cache.get(cids[8])['_chain'])
+        self.assertEqual(ipfs_cache.get(cids[3])['_chain']['deleted'], ['removed'])
+
+        loaded = IPFSDictChain(cid=cids[6])
+        self.assertEqual(dict(loaded.items()), {'previous_cid': cids[5], 'constant': 'x' * 100, 'counter': 6})
+        self.assertEqual([state['counter'] for state in loaded.get_previous_states()], [5, 4, 3, 2, 1, 0])
+        self.assertTrue(IPFSDictChain(cid=cids[1]).removed)
+        self.assertEqual(loaded.changes(), {'previous_cid': {'old': cids[4], 'new': cids[5]},
+                                            'counter': {'old': 5, 'new': 6}})
+
+    @patch('ipfs_dict_chain.IPFSDictChain.dag_import')
+    def test_export_car_max_depth_keeps_checkpoints(self, mock_dag_import, mock_add_json):
+        """Delta encoded states are exported with their checkpoint, even when it is older than max_depth"""
+        chain = IPFSDictChain(checkpoint_interval=10)
+        chain.constant = 'x' * 100
+        cids = []
+        for i in range(4):
+            chain.counter = i
+            cids.append(chain.save())
+
+        stream = io.BytesIO()
+        self.assertEqual(chain.export_car(stream, max_depth=1), [cids[3], cids[2]])
+        blocks = dict(CARReader(stream=io.BytesIO(stream.getvalue())))
+        self.assertEqual(set(blocks), {cid_to_bytes(cid) for cid in (cids[3], cids[2], cids[0])})
+
+        ipfs_cache.clear()
+        stream.seek(0)
+        with patch('ipfs_dict_chain.IPFS._client', side_effect=AssertionError('request to the daemon')):
+            imported = IPFSDictChain.import_car(stream)
+            self.assertEqual(dict(imported.items()), {'previous_cid': cids[2], 'constant': 'x' * 100, 'counter': 3})
+            self.assertEqual(imported.get_previous_states(max_depth=1)[0]['counter'], 2)
+
+    def test_invalid_checkpoint_interval(self, mock_add_json):
+        with self.assertRaises(ValueError):
+            IPFSDictChain(checkpoint_interval=0)
+        with self.assertRaises(ValueError):
+            IPFSDictChain.compact(cid=self.cids[-1], checkpoint_interval=0)
+
+    def test_compact(self, mock_add_json):
+        mapping = IPFSDictChain.compact(cid=self.cids[-1], checkpoint_interval=5)
+
+        self.assertEqual(set(mapping), set(self.cids))
+        compacted = IPFSDictChain(cid=mapping[self.cids[-1]])
+        self.assertEqual(compacted.value, 'state_19')
+        self.assertEqual(compacted.previous_cid, mapping[self.cids[-2]])
+        self.assertEqual([state['counter'] for state in compacted.get_previous_states()], list(reversed(range(19))))
+        self.assertEqual(_ancestor(cid=mapping[self.cids[-1]], seq=3), mapping[self.cids[3]])
+        self.assertNotIn('constant', get_json(mapping[self.cids[-1]]))
+
+    def test_compact_does_not_fill_the_cache(self, mock_add_json):
+        """Neither the old nor the new states stay in the cache, however long the chain is"""
+        sizes = []
+
+        def add_json(data, maddr=None):
+            sizes.append(len(ipfs_cache))
+            return fake_add_json(data)
+
+        mock_add_json.side_effect = add_json
+        for length in (10, 60):
+            ipfs_cache.clear()
+            cids = upload_chain([{'counter': i, 'constant': 'x' * 100} for i in range(length)])
+            mapping = IPFSDictChain.compact(cid=cids[-1], checkpoint_interval=4)
+            self.assertEqual(len(ipfs_cache), 0)
+            self.assertEqual(IPFSDictChain(cid=mapping[cids[-1]]).get_previous_states()[-1]['counter'], 0)
+
+        self.assertLessEqual(max(sizes), 1)
+
+    def test_compact_max_depth(self, mock_add_json):
+        mapping = IPFSDictChain.compact(cid=self.cids[-1], max_depth=4)
+
+        self.assertEqual(set(mapping), set(self.cids[-5:]))
+        compacted = IPFSDictChain(cid=mapping[self.cids[-1]])
+        self.assertEqual(len(compacted.get_previous_cids()), 4)
+        self.assertIsNone(IPFSDictChain(cid=mapping[self.cids[-5]]).previous_cid)
+
+    def test_compact_resume(self, mock_add_json):
+        """A compaction recorded in a progress file only rewrites the states added since"""
+        with tempfile.TemporaryDirectory() as directory:
+            progress_path = os.path.join(directory, 'progress.jsonl')
+            first = IPFSDictChain.compact(cid=self.cids[9], progress_path=progress_path)
+            self.assertEqual(len(first), 10)
+
+            calls = mock_add_json.call_count
+            second = IPFSDictChain.compact(cid=self.cids[-1], progress_path=progress_path)
+
+        self.assertEqual(mock_add_json.call_count - calls, 10)
+        self.assertEqual(second[self.cids[9]], first[self.cids[9]])
+        self.assertEqual(IPFSDictChain(cid=second[self.cids[10]]).previous_cid, first[self.cids[9]])
+        self.assertEqual(second, IPFSDictChain.compact(cid=self.cids[-1]))
+
+
+
+@patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=fake_add_json)
+class TestIPFSDictChainPointInTime(unittest.TestCase):
+    """Test save timestamps and point-in-time queries."""
+
+    def setUp(self):
+        fetch = patch('ipfs_dict_chain.IPFS._stream_json', new=fake_stream_json)
+        fetch.start()
+        self.addCleanup(fetch.stop)
+
+    def tearDown(self):
+        ipfs_cache.clear()
+        uploaded.clear()
+
+    def timed_chain(self, length):
+        chain = IPFSDictChain(timestamps=True)
+        for i in range(length):
+            chain.counter = i
+            chain.save(timestamp=1000.0 + 10 * i)
+        return chain
+
+    def fetched_states(self, query):
+        """Run a query and return the CIDs of the states it loaded."""
+        fetched = set()
+        load_payload = ipfs_dict_chain_module._load_payload
+
+        def counting_load_payload(cid):
+            fetched.add(cid)
+            return load_payload(cid=cid)
+
+        with patch('ipfs_dict_chain.IPFSDictChain._load_payload', side_effect=counting_load_payload):
+            result = query()
+        return result, fetched
+
+    def test_save_timestamp(self, mock_add_json):
+        chain = IPFSDictChain(timestamps=True)
+        chain.key = 'value'
+        chain.save()
+        metadata = ipfs_cache.get(chain.cid())['_chain']
+        self.assertEqual(metadata['seq'], 0)
+        self.assertAlmostEqual(metadata['time'], datetime.now().timestamp(), delta=60)
+
+        # A timestamp can be given explicitly, and a reloaded chain keeps storing save times
+        reloaded = IPFSDictChain(cid=chain.cid())
+        reloaded.key = 'new_value'
+        reloaded.save(timestamp=datetime.fromtimestamp(metadata['time'] + 5))
+        self.assertAlmostEqual(ipfs_cache.get(reloaded.cid())['_chain']['time'], metadata['time'] + 5, places=3)
+
+        with self.assertRaises(ValueError):
+            reloaded.save(timestamp=metadata['time'] - 1)
+
+    def test_at_timestamp(self, mock_add_json):
+        chain = self.timed_chain(length=50)
+        self.assertEqual(chain.at(timestamp=1000.0).counter, 0)
+        self.assertEqual(chain.at(timestamp=1255.0).counter, 25)
+        self.assertEqual(chain.at(timestamp=1260.0).counter, 26)
+        self.assertEqual(chain.at(timestamp=datetime.fromtimestamp(9999)).counter, 49)
+        self.assertIsNone(chain.at(timestamp=999.0))
+
+    def test_at_depth(self, mock_add_json):
+        chain = self.timed_chain(length=50)
+        self.assertEqual(chain.at(depth=0).cid(), f'/ipfs/{chain.cid()}')
+        self.assertEqual(chain.at(depth=1).cid(), f'/ipfs/{chain.previous_cid}')
+        self.assertEqual(chain.at(depth=49).counter, 0)
+        self.assertIsNone(chain.at(depth=50))
+
+    def test_at_fetches_logarithmic_number_of_states(self, mock_add_json):
+        chain = self.timed_chain(length=1000)
+        for counter in (0, 1, 333, 998):
+            result, fetched = self.fetched_states(lambda: chain.at(timestamp=1000.0 + 10 * counter + 5))
+            self.assertEqual(result.counter, counter)
+            self.assertLess(len(fetched), 50)
+
+            result, fetched = self.fetched_states(lambda: chain.at(depth=999 - counter))
+            self.assertEqual(result.counter, counter)
+            self.assertLess(len(fetched), 50)
+
+    def test_at_chain_without_metadata(self, mock_add_json):
+        """States without metadata are walked back one at a time and count as older than any timestamp"""
+        cids = cache_chain([{'counter': i} for i in range(5)])
+        chain = IPFSDictChain(cid=cids[-1])
+        self.assertEqual(chain.at(depth=3).counter, 1)
+        self.assertEqual(chain.at(timestamp=0).counter, 4)
+
+        chain.counter = 5
+        chain.save(timestamp=2000.0)
+        self.assertEqual(chain.at(timestamp=1999.0).counter, 4)
+        self.assertEqual(chain.at(timestamp=2000.0).counter, 5)
+        self.assertEqual(chain.at(depth=5).counter, 0)
+
+    def test_at_invalid_arguments(self, mock_add_json):
+        chain = self.timed_chain(length=2)
+        with self.assertRaises(ValueError):
+            chain.at()
+        with self.assertRaises(ValueError):
+            chain.at(timestamp=1000.0, depth=1)
+        with self.assertRaises(ValueError):
+            chain.at(depth=-1)
+        with self.assertRaises(IPFSError):
+            IPFSDictChain().at(depth=0)
+
+    def test_compact_keeps_save_times(self, mock_add_json):
+        chain = self.timed_chain(length=10)
+        mapping = IPFSDictChain.compact(cid=chain.cid(), checkpoint_interval=4)
+        compacted = IPFSDictChain(cid=mapping[chain.cid()])
+        self.assertEqual(compacted.at(timestamp=1035.0).counter, 3)
+
+
+@patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=fake_add_json)
+class TestIPFSDictChainKeyHistory(unittest.TestCase):
+    """Test the history of a single key."""
+
+    def tearDown(self):
+        ipfs_cache.clear()
+
+    def save_values(self, chain, values):
+        """Save a state for every value of 'tracked', with a counter that changes every time."""
+        for counter, value in enumerate(values):
+            chain.counter = counter
+            if value is MISSING:
+                chain.__dict__.pop('tracked', None)
+            else:
+                chain.tracked = value
+            chain.save()
+
+    def test_key_history(self, mock_add_json):
+        chain = IPFSDictChain()
+        chain.save()
+        self.save_values(chain, ['a', 'a', 'b', MISSING, MISSING, 'c', 'c'])
+        cids = list(reversed(chain.get_previous_cids())) + [chain.cid()]
+
+        self.assertEqual(list(chain.key_history('tracked')),
+                         [(cids[6], 'c'), (cids[4], MISSING), (cids[3], 'b'), (cids[1], 'a')])
+        self.assertEqual(list(chain.key_history('counter'))[-1], (cids[1], 0))
+        self.assertEqual(list(chain.key_history('never_set')), [])
+
+    def test_key_history_max_depth(self, mock_add_json):
+        chain = IPFSDictChain()
+        self.save_values(chain, ['a', 'b', 'b', 'b'])
+        history = list(chain.key_history('tracked', max_depth=1))
+        self.assertEqual(history, [(chain.previous_cid, 'b')])
+
+    def test_key_history_is_lazy(self, mock_add_json):
+        chain = IPFSDictChain()
+        self.save_values(chain, ['a'] * 10 + ['b'])
+
+        with patch('ipfs_dict_chain.IPFSDictChain.get_json_keys', wraps=ipfs_dict_chain_module.get_json_keys) as mock_get_json_keys:
+            self.assertEqual(next(chain.key_history('tracked'))[1], 'b')
+        self.assertEqual(mock_get_json_keys.call_count, 2)
+
+    def test_key_history_with_deltas(self, mock_add_json):
+        """Delta encoded states take unchanged values from their checkpoint without materializing any state"""
+        chain = IPFSDictChain(checkpoint_interval=4)
+        self.save_values(chain, ['a'] * 6 + [MISSING] * 3 + ['b'] * 3)
+
+        with patch('ipfs_dict_chain.IPFSDictChain.get_json', side_effect=AssertionError('state materialized')):
+            history = list(chain.key_history('tracked'))
+        self.assertEqual([value for _, value in history], ['b', MISSING, 'a'])
+        self.assertEqual(IPFSDictChain(cid=history[1][0]).counter, 6)
+        self.assertEqual(IPFSDictChain(cid=history[2][0]).counter, 0)
+
+    def test_key_history_of_unsaved_chain(self, mock_add_json):
+        with self.assertRaises(IPFSError):
+            next(IPFSDictChain().key_history('key'))
+
+
+@patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=fake_add_json)
+class TestIPFSDictChainChangelog(unittest.TestCase):
+    """Test diffs between arbitrary states and change logs over ranges of states."""
+
+    def setUp(self):
+        self.cids = cache_chain([{'counter': 0, 'status': 'new'},
+                                 {'counter': 1, 'status': 'new', 'owner': 'alice'},
+                                 {'counter': 2, 'status': 'done', 'owner': 'alice'},
+                                 {'counter': 3, 'status': 'done'}])
+
+    def tearDown(self):
+        ipfs_cache.clear()
+
+    def test_diff(self, mock_add_json):
+        self.assertEqual(IPFSDictChain.diff(self.cids[0], self.cids[3]), {'counter': {'old': 0, 'new': 3},
+                                                                          'status': {'old': 'new', 'new': 'done'}})
+        self.assertEqual(IPFSDictChain.diff(self.cids[3], f'/ipfs/{self.cids[1]}'), {'counter': {'old': 3, 'new': 1},
+                                                                                     'status': {'old': 'done', 'new': 'new'},
+                                                                                     'owner': {'new': 'alice'}})
+        self.assertEqual(IPFSDictChain.diff(self.cids[2], self.cids[2]), {})
+
+    def test_changelog(self, mock_add_json):
+        changelog = list(IPFSDictChain.changelog(from_cid=self.cids[0], to_cid=self.cids[3], batch_size=2))
+        self.assertEqual(changelog, [
+            (self.cids[1], {'counter': {'old': 0, 'new': 1}, 'owner': {'new': 'alice'}}),
+            (self.cids[2], {'counter': {'old': 1, 'new': 2}, 'status': {'old': 'new', 'new': 'done'}}),
+            (self.cids[3], {'counter': {'old': 2, 'new': 3}, 'owner': {'old': 'alice'}}),
+        ])
+
+        changelog = list(IPFSDictChain.changelog(from_cid=None, to_cid=self.cids[1]))
+        self.assertEqual(changelog[0], (self.cids[0], {'counter': {'new': 0}, 'status': {'new': 'new'}}))
+        self.assertEqual(len(changelog), 2)
+        self.assertEqual(list(IPFSDictChain.changelog(from_cid=self.cids[2], to_cid=self.cids[2])), [])
+
+    def test_changelog_matches_changes(self, mock_add_json):
+        chain = IPFSDictChain(checkpoint_interval=3)
+        first_cid = chain.save()
+        for i in range(10):
+            chain.counter = i
+            chain['even' if i % 2 == 0 else 'odd'] = i
+            chain.save()
+
+        changelog = list(IPFSDictChain.changelog(from_cid=first_cid, to_cid=chain.cid()))
+        self.assertEqual(len(changelog), 10)
+        for cid, changes in changelog:
+            expected = IPFSDictChain(cid=cid).changes()
+            del expected['previous_cid']
+            self.assertEqual(changes, expected)
+
+    def test_changelog_fetches_each_state_once(self, mock_add_json):
+        payloads = {cid: ipfs_cache.get(cid) for cid in self.cids}
+        ipfs_cache.clear()
+        fetched = []
+
+        async def stream_json(cid, keys=None, gateway=None):
+            fetched.append(cid)
+            return payloads[cid]
+
+        with patch('ipfs_dict_chain.IPFS._stream_json', new=stream_json):
+            changelog = list(IPFSDictChain.changelog(from_cid=None, to_cid=self.cids[3], batch_size=3))
+        self.assertEqual(len(changelog), 4)
+        self.assertEqual(sorted(fetched), sorted(self.cids))
+
+    def test_changelog_invalid_range(self, mock_add_json):
+        with self.assertRaises(IPFSError):
+            list(IPFSDictChain.changelog(from_cid=self.cids[3], to_cid=self.cids[1]))
+        with self.assertRaises(ValueError):
+            list(IPFSDictChain.changelog(from_cid=None, to_cid=self.cids[1], batch_size=0))
+
+
+@patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=fake_add_json)
+class TestIPFSDictChainCommonAncestor(unittest.TestCase):
+    """Test finding the common ancestor of divergent heads."""
+
+    def tearDown(self):
+        ipfs_cache.clear()
+
+    def fork(self, base_length, length_a, length_b, **kwargs):
+        """Save a chain and two branches from its head, and return the base head and both branch heads."""
+        chain = IPFSDictChain(**kwargs)
+        for i in range(base_length):
+            chain.value = f'base_{i}'
+            chain.save()
+        base = chain.cid()
+
+        heads = []
+        for branch, length in (('a', length_a), ('b', length_b)):
+            branch_chain = IPFSDictChain(cid=base, **kwargs)
+            for i in range(length):
+                branch_chain.value = f'{branch}_{i}'
+                branch_chain.save()
+            heads.append(branch_chain.cid())
+        return base, heads[0], heads[1]
+
+    def test_common_ancestor_by_walking(self, mock_add_json):
+        base, head_a, head_b = self.fork(base_length=30, length_a=3, length_b=7)
+
+        with patch('ipfs_dict_chain.IPFSDictChain.get_json', wraps=ipfs_cache.get) as mock_get_json:
+            self.assertEqual(IPFSDictChain.common_ancestor(head_a, head_b), base)
+        # The walk stops at the fork instead of reading the whole history
+        self.assertLess(mock_get_json.call_count, 25)
+
+    def test_common_ancestor_with_shortcuts(self, mock_add_json):
+        base, head_a, head_b = self.fork(base_length=200, length_a=2, length_b=90, shortcuts=True)
+
+        with patch('ipfs_dict_chain.IPFSDictChain.get_json', wraps=ipfs_cache.get) as mock_get_json:
+            self.assertEqual(IPFSDictChain.common_ancestor(head_a, head_b), base)
+            self.assertEqual(IPFSDictChain.common_ancestor(f'/ipfs/{head_b}', head_a), base)
+        self.assertLess(mock_get_json.call_count, 100)
+
+    def test_common_ancestor_of_ancestor(self, mock_add_json):
+        for kwargs in ({}, {'shortcuts': True}):
+            base, head_a, _ = self.fork(base_length=5, length_a=4, length_b=0, **kwargs)
+            self.assertEqual(IPFSDictChain.common_ancestor(head_a, base), base)
+            self.assertEqual(IPFSDictChain.common_ancestor(base, head_a), base)
+            self.assertEqual(IPFSDictChain.common_ancestor(head_a, head_a), head_a)
+
+    def test_unrelated_chains(self, mock_add_json):
+        for kwargs in ({}, {'shortcuts': True}):
+            _, head_a, _ = self.fork(base_length=3, length_a=2, length_b=0, **kwargs)
+            chain = IPFSDictChain(**kwargs)
+            for i in range(6):
+                chain.other = i
+                chain.save()
+            self.assertIsNone(IPFSDictChain.common_ancestor(head_a, chain.cid()))
+
+
+
+@patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=fake_add_json)
+class TestIPFSDictChainMerge(unittest.TestCase):
+    """Test three-way merges of divergent branches."""
+
+    def setUp(self):
+        self.base_cid = cache_chain([{'shared': 0, 'conflict': 'base', 'removed': True, 'kept': 'base'}])[-1]
+
+    def tearDown(self):
+        ipfs_cache.clear()
+
+    def branches(self, **kwargs):
+        """Save two branches from the base state with one conflicting key, and return both chains."""
+        ours = IPFSDictChain(cid=self.base_cid, **kwargs)
+        ours.conflict = 'ours'
+        ours.our_key = 1
+        del ours.removed
+        ours.save()
+
+        theirs = IPFSDictChain(cid=self.base_cid, **kwargs)
+        theirs.conflict = 'theirs'
+        theirs.their_key = 2
+        theirs.kept = 'theirs'
+        theirs.save()
+        theirs.shared = 1
+        theirs.save()
+        return ours, theirs
+
+    def test_diff_states(self, mock_add_json):
+        self.assertEqual(diff_states({'a': 1, 'b': 2, 'c': 3}, {'a': 1, 'b': 3, 'd': 4}),
+                         {'b': {'old': 2, 'new': 3}, 'c': {'old': 3}, 'd': {'new': 4}})
+
+    def test_changes_with_removed_key(self, mock_add_json):
+        chain = IPFSDictChain(cid=self.base_cid)
+        del chain.removed
+        chain.save()
+        self.assertEqual(chain.changes()['removed'], {'old': True})
+
+    def test_merge_ours(self, mock_add_json):
+        ours, theirs = self.branches()
+        head_cid = ours.cid()
+        merged_cid = ours.merge(theirs.cid())
+
+        self.assertEqual(dict(ours.items()), {'previous_cid': head_cid, 'shared': 1, 'conflict': 'ours', 'kept': 'theirs',
+                                              'our_key': 1, 'their_key': 2})
+        metadata = ipfs_cache.get(merged_cid)['_chain']
+        self.assertEqual(metadata['merge'], theirs.cid())
+        self.assertEqual(metadata['merges'], 1)
+        self.assertEqual(dict(IPFSDictChain(cid=merged_cid).items()), dict(ours.items()))
+
+    def test_merge_theirs(self, mock_add_json):
+        ours, theirs = self.branches()
+        ours.merge(theirs.cid(), strategy='theirs')
+        self.assertEqual(ours.conflict, 'theirs')
+        self.assertFalse(hasattr(ours, 'removed'))
+
+    def test_merge_last_writer_wins(self, mock_add_json):
+        ours, theirs = self.branches()
+        ours.merge(theirs.cid(), strategy='last-writer-wins')
+        self.assertEqual(ours.conflict, 'theirs')
+
+    def test_merge_callback(self, mock_add_json):
+        calls = []
+
+        def resolve(key, base, our_value, their_value):
+            calls.append((key, base, our_value, their_value))
+            return MISSING
+
+        ours, theirs = self.branches(shortcuts=True)
+        ours.merge(theirs.cid(), strategy=resolve)
+        self.assertEqual(calls, [('conflict', 'base', 'ours', 'theirs')])
+        self.assertNotIn('conflict', dict(ours.items()))
+
+    def test_merge_unknown_strategy(self, mock_add_json):
+        ours, theirs = self.branches()
+        with self.assertRaises(ValueError):
+            ours.merge(theirs.cid(), strategy='newest')
+
+    def test_merge_ancestor(self, mock_add_json):
+        """Merging an ancestor does nothing, merging a descendant fast-forwards"""
+        ours, theirs = self.branches()
+        head_cid = theirs.cid()
+        self.assertEqual(theirs.merge(self.base_cid), head_cid)
+
+        chain = IPFSDictChain(cid=self.base_cid)
+        chain.merge(head_cid)
+        self.assertEqual(chain.cid(), f'/ipfs/{head_cid}')
+        self.assertEqual(dict(chain.items()), dict(theirs.items()))
+
+    def test_common_ancestor_after_merge(self, mock_add_json):
+        """Forks after a merge are found through both parents"""
+        ours, theirs = self.branches(shortcuts=True)
+        ours.merge(theirs.cid())
+
+        theirs.shared = 2
+        theirs.save()
+        ours.shared = 3
+        ours.save()
+
+        self.assertEqual(IPFSDictChain.common_ancestor(ours.cid(), theirs.cid()), theirs.previous_cid)
+
+    @patch('ipfs_dict_chain.IPFSDictChain.dag_import')
+    def test_export_car_after_merge(self, mock_dag_import, mock_add_json):
+        """Both parents of a merge and their histories are exported"""
+        ours, theirs = self.branches()
+        our_head, their_head = ours.cid(), theirs.cid()
+        merged_cid = ours.merge(their_head)
+
+        stream = io.BytesIO()
+        exported = ours.export_car(stream)
+        self.assertEqual(exported[:3], [merged_cid, our_head, their_head])
+        self.assertEqual(set(exported), {merged_cid, our_head, their_head, theirs.previous_cid, self.base_cid})
+        self.assertEqual(ours.export_car(io.BytesIO(), max_depth=1), [merged_cid, our_head, their_head])
+
+        ipfs_cache.clear()
+        stream.seek(0)
+        with patch('ipfs_dict_chain.IPFS._client', side_effect=AssertionError('request to the daemon')):
+            imported = IPFSDictChain.import_car(stream)
+            self.assertEqual(IPFSDictChain.common_ancestor(our_head, their_head), self.base_cid)
+            self.assertEqual(imported.merge(their_head), imported.cid())
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
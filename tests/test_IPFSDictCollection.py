@@ -0,0 +1,161 @@
+import io
+import unittest
+from unittest.mock import patch
+from ipfs_dict_chain.CAR import CARReader
+from ipfs_dict_chain.CID import cid_to_bytes
+from ipfs_dict_chain.IPFS import IPFSError, add_json, get_json, ipfs_cache
+from ipfs_dict_chain.IPFSDict import IPFSDict
+from ipfs_dict_chain.IPFSDictChain import IPFSDictChain
+from ipfs_dict_chain.IPFSDictCollection import IPFSDictCollection
+
+
+def make_member(value):
+    member = IPFSDict()
+    member.value = value
+    member.save()
+    return member
+
+
+class TestIPFSDictCollection(unittest.TestCase):
+
+    def tearDown(self):
+        ipfs_cache.clear()
+
+    def test_add_and_load(self):
+        collection = IPFSDictCollection(prefix_length=1)
+        members = {f'member {i}': make_member(value=i) for i in range(20)}
+        for name, member in members.items():
+            collection.add(name=name, member=member)
+        cid = collection.save()
+
+        ipfs_cache.clear()
+        loaded = IPFSDictCollection(cid=cid)
+        self.assertEqual(loaded.count, 20)
+        self.assertEqual(loaded.prefix_length, 1)
+        self.assertEqual(sorted(loaded.names()), sorted(members))
+        self.assertEqual(loaded.cid_of('member 3'), members['member 3'].cid())
+        self.assertIsNone(loaded.cid_of('missing'))
+        self.assertEqual(loaded.load_member('member 7').value, 7)
+
+        subset = loaded.load_members(['member 1', 'member 15'])
+        self.assertEqual({name: member.value for name, member in subset.items()}, {'member 1': 1, 'member 15': 15})
+        with self.assertRaises(KeyError):
+            loaded.load_members(['member 1', 'missing'])
+
+    def test_members_are_streamed_in_batches(self):
+        collection = IPFSDictCollection()
+        for i in range(10):
+            collection.add(name=f'member {i}', member=make_member(value=i))
+        collection.save()
+
+        loaded = IPFSDictCollection(cid=collection.cid())
+        with patch.object(IPFSDictCollection, 'load_members', wraps=loaded.load_members) as load_members:
+            members = list(loaded.members(batch_size=4))
+        self.assertEqual([name for name, _ in members], list(loaded.names()))
+        self.assertEqual(sorted(member.value for _, member in members), list(range(10)))
+        self.assertEqual([len(call.kwargs['names']) for call in load_members.call_args_list], [4, 4, 2])
+
+    def test_only_changed_shards_are_uploaded(self):
+        collection = IPFSDictCollection(prefix_length=2)
+        for i in range(50):
+            collection.add(name=f'member {i}', member=make_member(value=i))
+        first_cid = collection.save()
+        shards = dict(collection.shards)
+
+        collection.add(name='member 3', member=make_member(value='changed'))
+        collection.remove(name='member 4')
+        second_cid = collection.save()
+
+        changed = {key for key in shards if shards[key] != collection.shards.get(key)}
+        self.assertEqual(changed, {collection._shard_key('member 3'), collection._shard_key('member 4')})
+        self.assertEqual(collection.count, 49)
+        self.assertEqual(collection.previous_cid, first_cid)
+
+        # Every version of the collection stays addressable by its root CID
+        self.assertEqual(IPFSDictCollection(cid=first_cid).load_member('member 3').value, 3)
+        self.assertEqual(IPFSDictCollection(cid=second_cid).load_member('member 3').value, 'changed')
+        with self.assertRaises(KeyError):
+            IPFSDictCollection(cid=second_cid).remove('member 4')
+
+    def test_save_members(self):
+        collection = IPFSDictCollection(dict_class=IPFSDictChain)
+        chains = {}
+        for i in range(12):
+            chains[f'chain {i}'] = IPFSDictChain()
+            chains[f'chain {i}'].value = i
+
+        with patch.object(IPFSDictCollection, 'save', wraps=collection.save) as save:
+            cid = collection.save_members(members=chains, concurrency=4)
+        self.assertEqual(save.call_count, 1)
+        self.assertEqual(cid, collection.cid())
+
+        loaded = IPFSDictCollection(cid=cid, dict_class=IPFSDictChain)
+        self.assertEqual(loaded.count, 12)
+        member = loaded.load_member('chain 5')
+        self.assertIsInstance(member, IPFSDictChain)
+        self.assertEqual(member.value, 5)
+
+    def test_member_cids_are_normalized(self):
+        """A member added by a bare CID or an /ipfs/ path is stored the same way"""
+        cid = make_member(value=1).cid().removeprefix('/ipfs/')
+        with_path, bare = IPFSDictCollection(), IPFSDictCollection()
+        with_path.add(name='member', member=f'/ipfs/{cid}')
+        bare.add(name='member', member=cid)
+        self.assertEqual(with_path.save(), bare.save())
+        self.assertEqual(with_path.cid_of('member'), cid)
+
+    def test_export_and_import(self):
+        """The shards and members of every exported version are in the archive and load after an import"""
+        collection = IPFSDictCollection(dict_class=IPFSDictChain, prefix_length=1)
+        for i in range(5):
+            chain = IPFSDictChain()
+            chain.value = i
+            chain.save()
+            chain.value = i * 10
+            chain.save()
+            collection.add(name=f'member {i}', member=chain)
+        first_cid = collection.save()
+        collection.add(name='member 0', member=make_member(value='replaced'))
+        collection.save()
+
+        stream = io.BytesIO()
+        self.assertEqual(collection.export_car(stream), [collection.cid().removeprefix('/ipfs/'), first_cid])
+        blocks = dict(CARReader(stream=io.BytesIO(stream.getvalue())))
+        first = IPFSDictCollection(cid=first_cid, dict_class=IPFSDictChain)
+        expected = {first_cid, collection.cid()} | set(first.shards.values()) | set(collection.shards.values())
+        for name in first.names():
+            expected.add(first.cid_of(name))
+            expected.update(first.load_member(name).get_previous_cids())
+        expected.add(collection.cid_of('member 0'))
+        self.assertEqual(set(blocks), {cid_to_bytes(cid) for cid in expected})
+
+        ipfs_cache.clear()
+        stream.seek(0)
+        with patch('ipfs_dict_chain.IPFSDictChain.dag_import'), \
+                patch('ipfs_dict_chain.IPFS._client', side_effect=AssertionError('request to the daemon')):
+            imported = IPFSDictCollection.import_car(stream, dict_class=IPFSDictChain)
+            self.assertEqual(imported.count, 5)
+            self.assertEqual(imported.load_member('member 0').value, 'replaced')
+            self.assertEqual(imported.load_member('member 3').get_previous_states()[0]['value'], 3)
+            self.assertEqual(IPFSDictCollection(cid=first_cid).load_member('member 0').value, 0)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            IPFSDictCollection(prefix_length=5)
+        with self.assertRaises(ValueError):
+            IPFSDictCollection().add(name='unsaved', member=IPFSDict())
+        with self.assertRaises(IPFSError):
+            IPFSDictCollection(cid=add_json(data={'value': 1}))
+
+    def test_empty_shards_are_dropped(self):
+        collection = IPFSDictCollection()
+        collection.add(name='only', member=make_member(value=1))
+        collection.save()
+        collection.remove(name='only')
+        collection.save()
+        self.assertEqual(collection.shards, {})
+        self.assertEqual(get_json(collection.cid())['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
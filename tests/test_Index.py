@@ -0,0 +1,139 @@
+import os
+import tempfile
+import unittest
+from ipfs_dict_chain.IPFS import ipfs_cache
+from ipfs_dict_chain.IPFSDict import IPFSDict
+from ipfs_dict_chain.IPFSDictChain import IPFSDictChain
+from ipfs_dict_chain.Index import Index
+
+
+class TestIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = Index(fields=['status', 'priority'])
+        self.index.add(cid='QmOpen1', data={'status': 'open', 'priority': 1, 'title': 'first'})
+        self.index.add(cid='QmOpen2', data={'status': 'open', 'priority': 2.5})
+        self.index.add(cid='QmClosed', data={'status': 'closed', 'priority': 3})
+        self.index.add(cid='QmOther', data={'status': None, 'priority': 'high', 'tags': ['a']})
+
+    def tearDown(self):
+        self.index.close()
+
+    def test_find(self):
+        self.assertEqual(self.index.find('status', 'open'), ['QmOpen1', 'QmOpen2'])
+        self.assertEqual(self.index.find('status', None), ['QmOther'])
+        self.assertEqual(self.index.find('priority', 3.0), ['QmClosed'])
+        self.assertEqual(self.index.find('status', 'missing'), [])
+
+    def test_find_range(self):
+        self.assertEqual(self.index.find_range('priority', start=2), ['QmOpen2', 'QmClosed'])
+        self.assertEqual(self.index.find_range('priority', end=3), ['QmOpen1', 'QmOpen2'])
+        self.assertEqual(self.index.find_range('priority', end=3, include_end=True), ['QmOpen1', 'QmOpen2', 'QmClosed'])
+        # A range of strings does not match numbers and the other way around
+        self.assertEqual(self.index.find_range('priority', start='a'), ['QmOther'])
+        self.assertEqual(self.index.find_range('status', start='c', end='o'), ['QmClosed'])
+
+    def test_invalid_queries(self):
+        with self.assertRaises(ValueError):
+            self.index.find('title', 'first')
+        with self.assertRaises(ValueError):
+            self.index.find('status', ['open'])
+        for start, end in ((None, None), (1, 'z'), (True, None)):
+            with self.assertRaises(ValueError):
+                self.index.find_range('priority', start=start, end=end)
+        with self.assertRaises(ValueError):
+            Index(fields=[])
+
+    def test_add_replaces_and_remove(self):
+        self.index.add(cid='/ipfs/QmOpen1', data={'status': 'closed'})
+        self.assertEqual(self.index.find('status', 'open'), ['QmOpen2'])
+        self.assertEqual(self.index.find('priority', 1), [])
+
+        self.index.add(cid='QmOpen3', data={'status': 'open'}, replaces='QmOpen2')
+        self.assertEqual(self.index.find('status', 'open'), ['QmOpen3'])
+        self.assertNotIn('QmOpen2', self.index)
+
+        self.index.remove(cid='QmOpen3')
+        self.assertEqual(self.index.cids(), ['QmClosed', 'QmOpen1', 'QmOther'])
+        self.assertEqual(len(self.index), 3)
+
+    def test_values_that_are_not_indexed(self):
+        self.index.add(cid='QmLarge', data={'status': float('nan'), 'priority': 2 ** 70})
+        self.assertIn('QmLarge', self.index)
+        self.assertEqual(self.index.find_range('priority', start=4), [])
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.sqlite')
+            with Index(fields=['status'], path=path) as index:
+                index.add(cid='QmOpen', data={'status': 'open'})
+            with Index(fields=['status'], path=path) as index:
+                self.assertEqual(index.find('status', 'open'), ['QmOpen'])
+
+
+class TestIndexedDicts(unittest.TestCase):
+
+    def setUp(self):
+        self.index = Index(fields=['status', 'priority'])
+
+    def tearDown(self):
+        self.index.close()
+        ipfs_cache.clear()
+
+    def test_save_and_load(self):
+        ipfs_dict = IPFSDict(index=self.index)
+        ipfs_dict.status = 'open'
+        ipfs_dict.priority = 1
+        first_cid = ipfs_dict.save()
+        self.assertEqual(self.index.find('status', 'open'), [first_cid])
+
+        # A save replaces the previous version of the dictionary
+        ipfs_dict.status = 'closed'
+        second_cid = ipfs_dict.save()
+        self.assertEqual(self.index.find('status', 'open'), [])
+        self.assertEqual(self.index.find('status', 'closed'), [second_cid])
+
+        # Loading an earlier version does not index it next to the latest one
+        loaded = IPFSDict(cid=first_cid, index=self.index)
+        self.assertEqual(loaded.status, 'open')
+        self.assertEqual(self.index.find('status', 'open'), [])
+        self.assertEqual(self.index.cids(), [second_cid])
+
+    def test_load_previous_state(self):
+        chain = IPFSDictChain(index=self.index)
+        for status in ('new', 'open', 'closed'):
+            chain.status = status
+            chain.save()
+        head = chain.cid()
+        IPFSDictChain(cid=chain.previous_cid, index=self.index)
+        self.assertEqual(self.index.cids(), [head])
+        self.assertEqual(self.index.find('status', 'open'), [])
+
+    def test_chain_heads(self):
+        chain = IPFSDictChain(index=self.index, shortcuts=True)
+        for status in ('new', 'open', 'closed'):
+            chain.status = status
+            chain.save()
+        self.assertEqual(self.index.cids(), [chain.cid()])
+        self.assertEqual(self.index.find('status', 'closed'), [chain.cid()])
+
+    def test_rebuild(self):
+        heads = []
+        for i in range(5):
+            chain = IPFSDictChain(checkpoint_interval=2)
+            for status in ('new', 'open' if i % 2 == 0 else 'closed'):
+                chain.status = status
+                chain.priority = i
+                chain.save()
+            heads.append(chain.cid())
+
+        self.index.add(cid='QmStale', data={'status': 'open'})
+        ipfs_cache.clear()
+        self.assertEqual(self.index.rebuild(heads=heads), 5)
+        self.assertEqual(self.index.find('status', 'open'), sorted([heads[0], heads[2], heads[4]]))
+        self.assertEqual(self.index.find_range('priority', start=1, end=3), [heads[1], heads[2]])
+        self.assertNotIn('QmStale', self.index)
+
+
+if __name__ == '__main__':
+    unittest.main()
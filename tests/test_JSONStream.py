@@ -0,0 +1,85 @@
+import json
+import unittest
+from ipfs_dict_chain.FrozenDict import FrozenDict, freeze
+from ipfs_dict_chain.JSONStream import JSONObjectParser, parse_json_object
+
+
+def split(data, size):
+    """Split data into chunks of the given size."""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestJSONObjectParser(unittest.TestCase):
+
+    def setUp(self):
+        self.document = {
+            'string': 'with "quotes", \\backslashes\\ and {braces} [brackets]',
+            'unicode': '🌟 é',
+            'number': -12.5e3,
+            'literals': [True, False, None],
+            'nested': {'list': [1, {'a': []}, '}'], 'empty': {}},
+            '"key" with, special:chars': 0,
+        }
+
+    def test_chunked_parse(self):
+        for ensure_ascii in (True, False):
+            data = json.dumps(self.document, indent=2, ensure_ascii=ensure_ascii).encode()
+            for size in (1, 2, 3, 7, 64, len(data)):
+                self.assertEqual(parse_json_object(split(data, size)), self.document)
+
+    def test_members_are_returned_as_they_complete(self):
+        parser = JSONObjectParser()
+        self.assertEqual(parser.feed(b'{"a": 1, "b": [1,'), [('a', 1)])
+        self.assertEqual(parser.feed(b' 2], "c"'), [('b', [1, 2])])
+        self.assertEqual(parser.feed(b': null}'), [('c', None)])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.close(), {'a': 1, 'b': [1, 2], 'c': None})
+
+    def test_selected_keys(self):
+        data = json.dumps(self.document).encode()
+        result = parse_json_object(split(data, 5), keys=['number', 'nested', 'missing'])
+        self.assertEqual(result, {'number': self.document['number'], 'nested': self.document['nested']})
+
+    def test_done_when_all_keys_found(self):
+        parser = JSONObjectParser(keys=['a'])
+        parser.feed(b'{"b": "skipped", "a": 1, "c": ')
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.result, {'a': 1})
+
+    def test_first_key(self):
+        parser = JSONObjectParser(keys=['a'])
+        parser.feed(b'{"fir')
+        self.assertIsNone(parser.first_key)
+        parser.feed(b'st": 1, "a": 2}')
+        self.assertEqual(parser.first_key, 'first')
+
+    def test_skipped_values_are_not_decoded(self):
+        """Invalid values of keys that are not selected do not raise"""
+        parser = JSONObjectParser(keys=['a'])
+        parser.feed(b'{"b": [nonsense], "a": 1}')
+        self.assertEqual(parser.close(), {'a': 1})
+
+    def test_convert(self):
+        parser = JSONObjectParser(convert=freeze)
+        parser.feed(b'{"a": {"b": [1]}, "c": 2}')
+        result = parser.close()
+        self.assertIsInstance(result['a'], FrozenDict)
+        self.assertEqual(result, {'a': {'b': [1]}, 'c': 2})
+
+    def test_documents_that_are_not_objects(self):
+        self.assertEqual(parse_json_object(split(b'[1, {"a": 2}]', 3)), [1, {'a': 2}])
+        self.assertEqual(parse_json_object([b' "text"']), 'text')
+        with self.assertRaises(ValueError):
+            parse_json_object([b'[1, 2]'], keys=['a'])
+
+    def test_empty_object(self):
+        self.assertEqual(parse_json_object([b' { ', b'} ']), {})
+
+    def test_invalid_documents(self):
+        for data in (b'{"a": 1', b'{"a" 1}', b'{"a": 1}x', b'{"a": 1,}', b'{a: 1}', b'{"a": tru}', b''):
+            with self.assertRaises(ValueError, msg=data):
+                parse_json_object(split(data, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import unittest
+from typing import Any, ClassVar, Dict, List, Optional, Union
+from ipfs_dict_chain.IPFS import add_json, get_json, ipfs_cache, normalize_cid
+from ipfs_dict_chain.IPFSDict import IPFSDict
+from ipfs_dict_chain.Schema import MISSING, SchemaChain, SchemaDict, SchemaError, field
+
+
+class Order(SchemaDict):
+    status: str
+    priority: int = 0
+    price: float = 0.0
+    paid: bool = False
+    note: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    quantities: Dict[str, int] = field(default_factory=dict)
+    reference: Union[int, str] = 0
+    details: Any = None
+    kind: ClassVar[str] = 'order'
+
+
+class StrictOrder(Order, extra='forbid'):
+    pass
+
+
+class LooseOrder(Order, extra='ignore'):
+    pass
+
+
+class Task(SchemaChain):
+    title: str
+    done: bool = False
+    label: Optional[str] = None
+
+
+class TestSchema(unittest.TestCase):
+
+    def tearDown(self):
+        ipfs_cache.clear()
+
+    def test_load_coerces_values(self):
+        cid = add_json({'status': 'open', 'priority': 2.0, 'price': 3, 'tags': ['a', 'b'], 'quantities': {'x': 1},
+                        'reference': 'r-1', 'details': {'nested': [1, 2]}})
+        order = Order(cid=cid)
+        self.assertEqual(order.status, 'open')
+        self.assertIs(type(order.priority), int)
+        self.assertIs(type(order.price), float)
+        self.assertEqual(order.tags, ['a', 'b'])
+        self.assertEqual(order.quantities, {'x': 1})
+        self.assertEqual(order.reference, 'r-1')
+        self.assertEqual(order.details, {'nested': [1, 2]})
+
+        # Loaded values are mutable and read without a copy
+        self.assertIs(order.tags, order.tags)
+        order.tags.append('c')
+        self.assertEqual(order.tags, ['a', 'b', 'c'])
+
+        # Missing fields get their defaults
+        self.assertFalse(order.paid)
+        self.assertIsNone(order.note)
+
+    def test_invalid_values(self):
+        for data in ({'priority': 1}, {'status': 1}, {'status': 'open', 'priority': 1.5},
+                     {'status': 'open', 'priority': True}, {'status': 'open', 'paid': 1},
+                     {'status': 'open', 'tags': ['a', 1]}, {'status': 'open', 'quantities': []},
+                     {'status': 'open', 'note': 1}, {'status': 'open', 'reference': 1.5}):
+            with self.assertRaises(SchemaError, msg=data):
+                Order(cid=add_json(data))
+
+    def test_save_and_load(self):
+        order = Order()
+        order.status = 'open'
+        order.tags.append('new')
+        order.extra = 'value'
+        cid = order.save()
+
+        self.assertEqual(get_json(cid), {'status': 'open', 'priority': 0, 'price': 0.0, 'paid': False, 'note': None,
+                                         'tags': ['new'], 'quantities': {}, 'reference': 0, 'details': None,
+                                         'extra': 'value'})
+        self.assertEqual(Order(cid=cid).items(), order.items())
+        self.assertEqual(IPFSDict(cid=cid).status, 'open')
+
+    def test_save_validates(self):
+        with self.assertRaises(SchemaError):
+            Order().save()
+
+        order = Order()
+        order.status = 'open'
+        order.priority = 'high'
+        with self.assertRaises(SchemaError):
+            order.save()
+
+    def test_extra_policies(self):
+        cid = add_json({'status': 'open', 'unknown': [1]})
+        self.assertEqual(Order(cid=cid).unknown, [1])
+        self.assertFalse(hasattr(LooseOrder(cid=cid), 'unknown'))
+        with self.assertRaises(SchemaError):
+            StrictOrder(cid=cid)
+
+        strict = StrictOrder()
+        strict.status = 'open'
+        strict.unknown = 1
+        with self.assertRaises(SchemaError):
+            strict.save()
+
+        loose = LooseOrder()
+        loose.status = 'open'
+        loose.unknown = 1
+        self.assertNotIn('unknown', get_json(loose.save()))
+
+    def test_fields_are_slots(self):
+        order = Order()
+        order.status = 'open'
+        self.assertEqual(Order.__slots__, ('status', 'priority', 'price', 'paid', 'note', 'tags', 'quantities',
+                                           'reference', 'details'))
+        self.assertEqual(order.__dict__, {})
+        self.assertEqual(StrictOrder.__slots__, ())
+        self.assertEqual(list(StrictOrder.__fields__), list(Order.__fields__))
+        self.assertEqual(Order.kind, 'order')
+
+    def test_chain(self):
+        task = Task()
+        task.title = 'write tests'
+        task.save()
+        task.done = True
+        task.save()
+
+        loaded = Task(cid=task.cid())
+        self.assertTrue(loaded.done)
+        self.assertEqual(loaded.get_previous_states(), [{'previous_cid': None, 'title': 'write tests', 'done': False,
+                                                         'label': None}])
+
+    def test_chain_merge(self):
+        task = Task()
+        task.title = 'write tests'
+        task.label = 'base'
+        base_cid = task.save()
+
+        # Fast-forward to a head that has the current state in its history
+        other = Task(cid=base_cid)
+        other.done = True
+        other.save()
+        self.assertEqual(normalize_cid(task.merge(other.cid())), normalize_cid(other.cid()))
+        self.assertTrue(task.done)
+        self.assertEqual(normalize_cid(task.previous_cid), normalize_cid(base_cid))
+        self.assertEqual(task.__dict__, {})
+
+        # A conflicting field removed by the strategy is not saved and gets its default again on load
+        task.label = 'ours'
+        task.save()
+        other.label = 'theirs'
+        other.save()
+        merged_cid = task.merge(other.cid(), strategy=lambda key, base, ours, theirs: MISSING)
+        self.assertNotIn('label', dict(task.items()))
+        self.assertNotIn('label', get_json(merged_cid))
+        self.assertIsNone(Task(cid=merged_cid).label)
+
+    def test_invalid_declarations(self):
+        with self.assertRaises(ValueError):
+            class MutableDefault(SchemaDict):
+                tags: List[str] = []
+
+        with self.assertRaises(TypeError):
+            class UnsupportedType(SchemaDict):
+                value: bytes
+
+        with self.assertRaises(ValueError):
+            class UnknownPolicy(SchemaDict, extra='reject'):
+                value: int
+
+
+if __name__ == '__main__':
+    unittest.main()
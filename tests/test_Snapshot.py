@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from ipfs_dict_chain.Compression import Compressor
+from ipfs_dict_chain.IPFS import ipfs_cache
+from ipfs_dict_chain.IPFSDict import IPFSDict
+from ipfs_dict_chain.IPFSDictChain import IPFSDictChain
+from ipfs_dict_chain.Snapshot import SnapshotError, load_snapshot, save_snapshot
+from ipfs_dict_chain.WriteBehind import disable_write_behind, enable_write_behind
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.snapshot')
+        ipfs_cache.clear()
+
+    def tearDown(self):
+        disable_write_behind()
+        ipfs_cache.clear()
+        self.directory.cleanup()
+
+    def test_warm_start(self):
+        chain = IPFSDictChain(compression=Compressor(threshold=100))
+        for i in range(5):
+            chain.value = i
+            chain.text = f'version {i} ' + 'compressible ' * 20
+            chain.save()
+        plain = IPFSDict()
+        plain.unicode = '🌟 é'
+        plain.save()
+
+        cached = dict(ipfs_cache.items())
+        self.assertEqual(save_snapshot(self.path, heads={'chain': chain.cid(), 'plain': '/ipfs/' + plain.cid()}), 6)
+
+        ipfs_cache.clear()
+        heads = load_snapshot(self.path)
+        self.assertEqual(heads, {'chain': chain.cid(), 'plain': plain.cid()})
+        self.assertEqual(dict(ipfs_cache.items()), cached)
+
+        # The history is loaded without a request to the daemon
+        with patch('ipfs_dict_chain.IPFS._client', side_effect=AssertionError('request to the daemon')):
+            loaded = IPFSDictChain(cid=heads['chain'])
+            self.assertEqual([state['value'] for state in loaded.get_previous_states()], [3, 2, 1, 0])
+            self.assertEqual(IPFSDict(cid=heads['plain']).unicode, '🌟 é')
+
+    def test_unverifiable_entries_are_skipped(self):
+        """Entries whose payload can not be reproduced from the cached data are left out and fetched again"""
+        other_level = IPFSDictChain(compression=Compressor(level=1, threshold=100))
+        other_level.text = ' '.join(str(i) for i in range(1000))
+        other_level.save()
+        large = IPFSDict()
+        large.text = 'x' * 300000
+        large.save()
+        plain = IPFSDict()
+        plain.value = 1
+        plain.save()
+
+        self.assertEqual(save_snapshot(self.path), 1)
+        ipfs_cache.clear()
+        load_snapshot(self.path)
+        self.assertEqual([cid for cid, _ in ipfs_cache.items()], [plain.cid()])
+        self.assertEqual(IPFSDictChain(cid=other_level.cid()).text, other_level.text)
+        self.assertEqual(IPFSDict(cid=large.cid()).text, large.text)
+
+    def test_write_behind_is_flushed(self):
+        enable_write_behind()
+        ipfs_dict = IPFSDict()
+        ipfs_dict.value = 1
+        ipfs_dict.save()
+        with patch('ipfs_dict_chain.WriteBehind.WriteBehindQueue.flush') as flush:
+            save_snapshot(self.path)
+        flush.assert_called_once()
+
+    def test_corrupted_snapshot(self):
+        ipfs_dict = IPFSDict()
+        ipfs_dict.value = 'original'
+        ipfs_dict.save()
+        save_snapshot(self.path)
+        with open(self.path, 'rb') as snapshot_file:
+            content = snapshot_file.read()
+
+        for corrupted in (content.replace(b'original', b'modified'), content[:-1], content + b'x', b'not a snapshot',
+                          b'NOTSNAPS' + content[8:]):
+            with open(self.path, 'wb') as snapshot_file:
+                snapshot_file.write(corrupted)
+            ipfs_cache.clear()
+            with self.assertRaises(SnapshotError, msg=corrupted):
+                load_snapshot(self.path)
+            self.assertEqual(len(ipfs_cache), 0)
+
+    def test_empty_cache(self):
+        self.assertEqual(save_snapshot(self.path), 0)
+        self.assertEqual(load_snapshot(self.path), {})
+        self.assertEqual(os.listdir(self.directory.name), ['cache.snapshot'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import unittest
+from ipfs_dict_chain.CID import cid_to_bytes, encode_varint
+from ipfs_dict_chain.UnixFS import (CHUNK_SIZE, UNIXFS_FILE, UNIXFS_RAW, decode_pbnode, decode_unixfs,
+                                    encode_file_block, file_cid, read_file)
+
+
+class TestUnixFS(unittest.TestCase):
+
+    def test_file_cid_matches_daemon(self):
+        """CIDs computed locally match the CIDs the IPFS daemon assigns to added JSON data"""
+        self.assertEqual(file_cid(json.dumps({"key": "value"}).encode()),
+                         'QmV5mPAcGoqegJnzFheED2pnef96633jSjimR2SSgu7ZV5')
+        self.assertEqual(file_cid(json.dumps({"previous_cid": None, "key": "value"}).encode()),
+                         'QmNqXUYiiNMFXKy5rYFfs1tFASH6kgMA4fA1JwRoGuam8D')
+        self.assertEqual(file_cid(b''), 'QmbFMke1KXqnYyBBWxB74N4c5SBnJMVAiMNRcGu6x1AwQH')
+
+    def test_file_cid_too_large(self):
+        self.assertIsNone(file_cid(b'x' * (CHUNK_SIZE + 1)))
+        with self.assertRaises(ValueError):
+            encode_file_block(b'x' * (CHUNK_SIZE + 1))
+
+    def test_decode_single_block(self):
+        content = b'{"key": "value"}'
+        links, data = decode_pbnode(encode_file_block(content))
+        self.assertEqual(links, [])
+        self.assertEqual(decode_unixfs(data), (UNIXFS_FILE, content))
+
+    def test_read_single_block_file(self):
+        content = b'{"key": "value"}'
+        cid = cid_to_bytes(file_cid(content))
+        blocks = {cid: encode_file_block(content)}
+        self.assertEqual(read_file(cid=cid, get_block=blocks.__getitem__), content)
+
+    def test_read_multi_block_file(self):
+        """Files split over several blocks are reassembled in link order"""
+        blocks = {}
+        links = b''
+        for chunk in [b'first ', b'second ', b'third']:
+            unixfs = b'\x08' + encode_varint(UNIXFS_RAW) + b'\x12' + encode_varint(len(chunk)) + chunk
+            block = b'\x0a' + encode_varint(len(unixfs)) + unixfs
+            cid = bytes([1, 0x70, 0x12, 32]) + hashlib.sha256(block).digest()
+            blocks[cid] = block
+            link = b'\x0a' + encode_varint(len(cid)) + cid + b'\x18' + encode_varint(len(block))
+            links += b'\x12' + encode_varint(len(link)) + link
+
+        root_unixfs = b'\x08' + encode_varint(UNIXFS_FILE) + b'\x18' + encode_varint(18)
+        root_block = links + b'\x0a' + encode_varint(len(root_unixfs)) + root_unixfs
+        root_cid = bytes([1, 0x70, 0x12, 32]) + hashlib.sha256(root_block).digest()
+        blocks[root_cid] = root_block
+
+        content = read_file(cid=root_cid, get_block=blocks.__getitem__)
+        self.assertEqual(content, b'first second third')
+
+    def test_read_raw_block(self):
+        cid = bytes([1, 0x55, 0x12, 32]) + b'\0' * 32
+        self.assertEqual(read_file(cid=cid, get_block=lambda _: b'raw data'), b'raw data')
+
+    def test_read_directory_fails(self):
+        unixfs = b'\x08\x01'
+        block = b'\x0a' + encode_varint(len(unixfs)) + unixfs
+        cid = bytes([1, 0x70, 0x12, 32]) + b'\0' * 32
+        with self.assertRaises(ValueError):
+            read_file(cid=cid, get_block=lambda _: block)
+
+
+if __name__ == '__main__':
+    unittest.main()
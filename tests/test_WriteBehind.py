@@ -0,0 +1,174 @@
+import asyncio
+import json
+import random
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from ipfs_dict_chain.IPFS import IPFSError, get_json, ipfs_cache
+from ipfs_dict_chain.IPFSDictChain import IPFSDictChain
+from ipfs_dict_chain.UnixFS import file_cid
+from ipfs_dict_chain.WriteBehind import WriteBehindQueue, disable_write_behind, enable_write_behind, flush
+
+
+def fake_client(delay=0.0, fail=False, release=None):
+    """Create a mock client that records the order of uploads and answers with the CIDs the daemon would assign."""
+    client = MagicMock()
+    client.uploads = []
+
+    async def upload(data):
+        if release is not None:
+            await asyncio.get_running_loop().run_in_executor(None, release.wait)
+        await asyncio.sleep(random.uniform(0, delay))
+        if fail:
+            raise ConnectionError("daemon unavailable")
+        cid = file_cid(json.dumps(data).encode()) or 'QmLargePayload'
+        client.uploads.append(cid)
+        return {'Hash': cid}
+
+    client.add_json = AsyncMock(side_effect=upload)
+    client.close = AsyncMock()
+    return client
+
+
+class TestWriteBehind(unittest.TestCase):
+
+    def tearDown(self):
+        disable_write_behind()
+        ipfs_cache.clear()
+
+    def test_saves_are_uploaded_in_the_background(self):
+        enable_write_behind()
+        chain = IPFSDictChain()
+        for i in range(20):
+            chain.counter = i
+            chain.save()
+        flush()
+
+        head = chain.cid()
+        ipfs_cache.clear()
+        self.assertEqual(get_json(head)['counter'], 19)
+        self.assertEqual(len(IPFSDictChain(cid=head).get_previous_cids()), 19)
+
+    def test_enable_twice(self):
+        enable_write_behind()
+        with self.assertRaises(IPFSError):
+            enable_write_behind()
+
+    def test_chain_order_is_preserved(self):
+        """Every state is uploaded after the state its previous_cid links to"""
+        client = fake_client(delay=0.01)
+        with patch('ipfs_dict_chain.WriteBehind._client', return_value=client):
+            queue = WriteBehindQueue(concurrency=8)
+            chains = [IPFSDictChain() for _ in range(4)]
+            with patch('ipfs_dict_chain.IPFSDictChain.add_json', side_effect=lambda data: queue.submit(data)):
+                for i in range(10):
+                    for number, chain in enumerate(chains):
+                        chain.value = f'{number}_{i}'
+                        chain.save()
+            queue.close()
+
+        self.assertEqual(len(client.uploads), 40)
+        for chain in chains:
+            cids = [chain.cid()] + chain.get_previous_cids()
+            positions = [client.uploads.index(cid) for cid in reversed(cids)]
+            self.assertEqual(positions, sorted(positions))
+
+    def test_backpressure(self):
+        release = threading.Event()
+        with patch('ipfs_dict_chain.WriteBehind._client', return_value=fake_client(release=release)):
+            queue = WriteBehindQueue(max_pending=2, concurrency=1)
+            queue.submit({'n': 0})
+            queue.submit({'n': 1})
+
+            third = threading.Thread(target=queue.submit, args=({'n': 2},))
+            third.start()
+            third.join(0.1)
+            self.assertTrue(third.is_alive())
+            self.assertEqual(queue.pending, 2)
+
+            release.set()
+            third.join(5)
+            self.assertFalse(third.is_alive())
+            queue.close()
+        self.assertEqual(queue.pending, 0)
+
+    def test_error_callback(self):
+        errors = []
+        with patch('ipfs_dict_chain.WriteBehind._client', return_value=fake_client(fail=True)):
+            queue = WriteBehindQueue(on_error=lambda cid, data, error: errors.append((cid, data, error)))
+            cid = queue.submit({'key': 'value'})
+            queue.close()
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][:2], (cid, {'key': 'value'}))
+        self.assertIsInstance(errors[0][2], IPFSError)
+
+    def test_failed_upload_is_not_linked_to(self):
+        """A failed state is removed from the cache and the states that link to it are not uploaded"""
+        errors = []
+        release = threading.Event()
+        client = fake_client(release=release)
+        upload = client.add_json.side_effect
+
+        async def fail_first(data):
+            if data.get('counter') == 0:
+                raise ConnectionError("daemon unavailable")
+            return await upload(data)
+
+        client.add_json = AsyncMock(side_effect=fail_first)
+        with patch('ipfs_dict_chain.WriteBehind._client', return_value=client):
+            queue = WriteBehindQueue(on_error=lambda cid, data, error: errors.append(cid))
+            first = queue.submit({'previous_cid': None, 'counter': 0})
+            second = queue.submit({'previous_cid': first, 'counter': 1})
+            unrelated = queue.submit({'previous_cid': None, 'counter': 2})
+            release.set()
+            queue.flush()
+
+            self.assertEqual(sorted(errors), sorted([first, second]))
+            self.assertEqual(client.uploads, [unrelated])
+            self.assertNotIn(first, ipfs_cache)
+            self.assertNotIn(second, ipfs_cache)
+
+            with self.assertRaises(IPFSError):
+                queue.submit({'previous_cid': second, 'counter': 3})
+            # Submitting the failed data again retries it
+            self.assertEqual(queue.submit({'previous_cid': None, 'counter': 0}), first)
+            queue.close()
+
+    def test_errors_raise_on_flush(self):
+        with patch('ipfs_dict_chain.WriteBehind._client', return_value=fake_client(fail=True)):
+            queue = WriteBehindQueue()
+            queue.submit({'key': 'value'})
+            with self.assertRaises(IPFSError):
+                queue.flush()
+            # Errors are reported once
+            queue.flush()
+            queue.close()
+
+    def test_cid_mismatch_is_an_error(self):
+        client = fake_client()
+        client.add_json = AsyncMock(return_value={'Hash': 'QmSomethingElse'})
+        with patch('ipfs_dict_chain.WriteBehind._client', return_value=client):
+            queue = WriteBehindQueue()
+            queue.submit({'key': 'value'})
+            with self.assertRaises(IPFSError):
+                queue.close()
+
+    def test_large_payload_waits_for_upload(self):
+        """The CID of a payload larger than one block comes from the daemon"""
+        with patch('ipfs_dict_chain.WriteBehind._client', return_value=fake_client()):
+            queue = WriteBehindQueue()
+            self.assertEqual(queue.submit({'large': 'x' * 300000}), 'QmLargePayload')
+            queue.close()
+        self.assertEqual(get_json('QmLargePayload')['large'], 'x' * 300000)
+
+    def test_closed_queue(self):
+        with patch('ipfs_dict_chain.WriteBehind._client', return_value=fake_client()):
+            queue = WriteBehindQueue()
+            queue.close()
+        with self.assertRaises(IPFSError):
+            queue.submit({'key': 'value'})
+
+
+if __name__ == '__main__':
+    unittest.main()